@@ -0,0 +1,976 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+import typing
+
+import botocore.exceptions
+
+from .constants import SQSExtendedConstants
+from .digest import DigestSpooledFile
+from .extended_messaging import SQSExtendedMessage
+from .models.payload_s3_pointer import PayloadS3Pointer
+from .streams import MemoryViewReader
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSQSExtendedMessage(SQSExtendedMessage):
+    """Asyncio version of SQSExtendedMessage for aiobotocore clients.
+    The extended methods of SQS client are coroutines, like
+    `await sqs.send_message_extended(...)`, and put/get/delete messages
+    on S3 concurrently by the given S3 client of aiobotocore.
+    Stored messages, pointers, and receipt handles are in the same format
+    as SQSExtendedMessage, so that both can be used for the same queue.
+    aiobotocore is not imported by this module, and is required
+    by `pip install aws-sqs-ext-client[async]`.
+    :type s3_client: object
+    :param s3_client: S3 client of aiobotocore, which must be kept open
+        while the extended methods are called
+    :type s3_bucket_name: string
+    :param s3_bucket_name: S3 bucket name to store actual messages
+    :param kwargs: other options of SQSExtendedMessage, like `max_workers`
+        to limit the number of concurrent S3 requests.
+        `lazy_payload` is not supported
+    """
+
+    def __init__(
+            self, s3_client: typing.Any, s3_bucket_name: str, *args,
+            **kwargs) -> None:
+        if kwargs.get('lazy_payload'):
+            raise ValueError(
+                'lazy_payload is not supported by AsyncSQSExtendedMessage')
+
+        self.s3_client = s3_client
+        super().__init__(None, s3_bucket_name, *args, **kwargs)
+
+    def _create_s3_resource(self, session) -> typing.Any:
+        # aiobotocore has no resource, and s3_client is used instead
+        return None
+
+    async def _gather(
+        self, coroutines: typing.List[typing.Awaitable], limit: int,
+        return_exceptions: bool = False,
+    ) -> list:
+        """Run the given coroutines concurrently up to the limit.
+        :type coroutines: list
+        :param coroutines: coroutines to be run
+        :type limit: int
+        :param limit: max number of coroutines run at the same time
+        :type return_exceptions: bool
+        :param return_exceptions: if True, errors are returned as results
+            instead of raising the first one
+        :rtype: list
+        :return: results in the order of the given coroutines
+        """
+        semaphore = asyncio.Semaphore(max(limit, 1))
+
+        async def run(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(
+            *(run(coroutine) for coroutine in coroutines),
+            return_exceptions=return_exceptions)
+
+    async def _read_stream(self, stream: typing.Any, size: int = -1) -> bytes:
+        """Read the stream on the thread pool not to block the event loop.
+        :type stream: file-like object
+        :param stream: stream to be read
+        :type size: int
+        :param size: max size to be read (optional: read all by default)
+        :rtype: bytes
+        :return: data
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), stream.read, size)
+
+    async def _run_in_executor(
+            self, func: typing.Callable, *args) -> typing.Any:
+        """Call the function on the thread pool not to block the event loop
+        with CPU-bound work on large payloads, like (de)compression and
+        calculating digests.
+        :type func: callable
+        :param func: function to be called
+        :rtype: any
+        :return: result of the function
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), functools.partial(func, *args))
+
+    async def _compress_in_executor(
+        self, compressing: bool, func: typing.Callable, *args,
+    ) -> typing.Any:
+        """Call the function on the thread pool if it compresses messages,
+        not to block the event loop with large payloads.
+        :type compressing: bool
+        :param compressing: True if the function compresses messages
+        :type func: callable
+        :param func: function to be called
+        :rtype: any
+        :return: result of the function
+        """
+        if not compressing:
+            return func(*args)
+
+        return await self._run_in_executor(func, *args)
+
+    async def _put_reference(
+            self, params: dict, reference: str) -> typing.Optional[dict]:
+        """Put the reference marker of the message, and then check whether
+        the object to be stored already exists.
+        See SQSExtendedMessage._put_reference.
+        """
+        marker = {k: v for k, v in params.items() if k != 'Metadata'}
+        marker['Key'] = self._reference_key(params['Key'], reference)
+        await self.s3_client.put_object(Body=b'', **marker)
+        try:
+            response = await self.s3_client.head_object(
+                **self._head_object_params(params))
+        except botocore.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in (
+                    '404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+        logger.info(
+            f"{params['Key']} already exists in {params['Bucket']}")
+        return response
+
+    async def _put_message_to_s3(
+        self, encoded: typing.Any, s3_put_params: dict = {'ACL': 'private'},
+        reference: typing.Optional[str] = None,
+    ) -> str:
+        """Put actual message into S3 and return the pointer to it.
+        Streams and messages larger than multipart_threshold are uploaded
+        by multipart upload with concurrent parts.
+        :type encoded: bytes-like object, file-like object, or os.PathLike
+        :param encoded: message body to be stored
+        :type s3_put_params: dict
+        :param s3_put_params: parameters for s3.put_object
+        :type reference: str
+        :param reference: reference ID of the message with content_addressed
+        :rtype: str
+        :return: serialized PayloadS3Pointer
+        """
+        # streams are compressed only in spooled mode
+        params, compressed = await self._compress_in_executor(
+            self.compression is not None and (
+                not self.is_stream(encoded)
+                or self.spool_threshold is not None),
+            self._build_put_params, encoded, s3_put_params)
+        if self.is_stream(compressed) and compressed is not encoded:
+            # the spooled file of the compressed stream is removed
+            # after uploaded
+            with compressed:
+                return await self._put_object_to_s3(
+                    compressed, params, reference)
+
+        return await self._put_object_to_s3(compressed, params, reference)
+
+    async def _put_object_to_s3(
+        self, encoded: typing.Any, params: dict,
+        reference: typing.Optional[str] = None,
+    ) -> str:
+        """Put the encoded (and compressed) message into S3.
+        See SQSExtendedMessage._put_object_to_s3.
+        """
+        if reference is not None:
+            loop = asyncio.get_running_loop()
+            params['Key'] = await loop.run_in_executor(
+                self._get_executor(), self._hash_payload, encoded)
+            existing = await self._put_reference(params, reference)
+            if existing is not None:
+                return self._build_pointer(params, existing)
+
+        if isinstance(encoded, os.PathLike):
+            with open(encoded, 'rb') as f:
+                await self._upload_message_to_s3(f, params)
+            response = await self._head_checksum(params)
+        elif hasattr(encoded, 'read'):
+            await self._upload_message_to_s3(encoded, params)
+            response = await self._head_checksum(params)
+        elif len(encoded) >= self.multipart_threshold:
+            await self._upload_message_to_s3(
+                MemoryViewReader(encoded), params)
+            response = await self._head_checksum(params)
+        else:
+            # memoryview is not accepted by put_object
+            params['Body'] = (
+                MemoryViewReader(encoded) if isinstance(encoded, memoryview)
+                else encoded)
+            params['ContentLength'] = len(encoded)
+            response = await self.s3_client.put_object(**params)
+            logger.info(
+                f"{params['Key']} was written into {self.s3_bucket_name}")
+
+        return self._build_pointer(params, response)
+
+    async def _head_checksum(self, params: dict) -> dict:
+        """Get the checksum of the object uploaded by multipart upload.
+        See SQSExtendedMessage._head_checksum.
+        """
+        if self.s3_checksum_algorithm is None:
+            return {}
+
+        return await self.s3_client.head_object(
+            **self._head_object_params(params))
+
+    async def _upload_message_to_s3(
+            self, stream: typing.Any, params: dict) -> None:
+        """Upload actual message into S3 from the stream.
+        If the size is larger than multipart_threshold, parts are read
+        one by one and uploaded concurrently up to multipart_max_concurrency,
+        so that the whole message is not loaded into memory.
+        :type stream: file-like object
+        :param stream: message body to be stored
+        :type params: dict
+        :param params: parameters for s3.put_object including Bucket and Key
+        """
+        if self._get_stream_size(stream) < self.multipart_threshold:
+            await self.s3_client.put_object(
+                Body=await self._read_stream(stream), **params)
+            logger.info(
+                f"{params['Key']} was uploaded into {params['Bucket']}")
+            return
+
+        upload = await self.s3_client.create_multipart_upload(**params)
+        target = {
+            'Bucket': params['Bucket'], 'Key': params['Key'],
+            'UploadId': upload['UploadId']}
+        # acquired before reading a part to bound parts in memory
+        semaphore = asyncio.Semaphore(max(self.multipart_max_concurrency, 1))
+        # checksums of parts are needed to complete the upload with them
+        algorithm = params.get('ChecksumAlgorithm')
+        checksum = {'ChecksumAlgorithm': algorithm} if algorithm else {}
+
+        async def upload_part(number: int, data: bytes) -> dict:
+            try:
+                res = await self.s3_client.upload_part(
+                    Body=data, PartNumber=number, **target, **checksum)
+                part = {'ETag': res['ETag'], 'PartNumber': number}
+                if algorithm and f'Checksum{algorithm}' in res:
+                    part[f'Checksum{algorithm}'] = res[f'Checksum{algorithm}']
+                return part
+            finally:
+                semaphore.release()
+
+        tasks = []
+        try:
+            while True:
+                await semaphore.acquire()
+                data = await self._read_stream(
+                    stream, self.multipart_chunksize)
+                if not data:
+                    semaphore.release()
+                    break
+                tasks.append(asyncio.ensure_future(
+                    upload_part(len(tasks) + 1, data)))
+
+            parts = await asyncio.gather(*tasks)
+            await self.s3_client.complete_multipart_upload(
+                MultipartUpload={'Parts': parts}, **target)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await self.s3_client.abort_multipart_upload(**target)
+            raise
+        logger.info(
+            f"{params['Key']} was uploaded into {params['Bucket']}")
+
+    async def _put_messages_to_s3(
+        self, entries: typing.List[dict], uploads: typing.Dict[int, bytes],
+    ) -> typing.Dict[int, dict]:
+        """Put messages of batch entries into S3 concurrently.
+        MessageBody of each entry is replaced with the pointer on success.
+        :type entries: list
+        :param entries: entries of send_message_batch
+        :type uploads: dict
+        :param uploads: encoded bodies to be stored keyed by entry index
+        :rtype: dict
+        :return: failed results, like `Failed` of send_message_batch,
+            keyed by entry index
+        """
+        results = await self._gather([
+            self._put_message_to_s3(
+                encoded, reference=self._get_reference(
+                    entries[i]['MessageAttributes']))
+            for i, encoded in uploads.items()],
+            self.max_workers, return_exceptions=True)
+
+        failed = {}
+        for i, result in zip(uploads, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    f'failed to put message of entry {i}: {result}')
+                failed[i] = self._failed_entry(entries[i], i, result)
+            else:
+                entries[i]['MessageBody'] = result
+
+        return failed
+
+    async def _put_packed_messages_to_s3(
+        self, entries: typing.List[dict], uploads: typing.Dict[int, bytes],
+    ) -> typing.Dict[int, dict]:
+        """Put messages of batch entries into S3 packing them into one
+        object if pack_batch is enabled.
+        See SQSExtendedMessage._put_packed_messages_to_s3.
+        """
+        packed = self._split_packed_uploads(uploads)
+        failed = await self._put_messages_to_s3(entries, {
+            i: encoded for i, encoded in uploads.items() if i not in packed})
+        if not packed:
+            return failed
+
+        params, data, ranges = await self._compress_in_executor(
+            self.compression is not None, self._pack_messages,
+            [uploads[i] for i in packed])
+        try:
+            if len(data) >= self.multipart_threshold:
+                await self._upload_message_to_s3(
+                    MemoryViewReader(data), params)
+            else:
+                await self.s3_client.put_object(
+                    Body=data, ContentLength=len(data), **params)
+                logger.info(
+                    f"{params['Key']} was written into {params['Bucket']}")
+        except Exception as e:
+            logger.warning(f'failed to put packed messages: {e}')
+            failed.update({
+                i: self._failed_entry(entries[i], i, e) for i in packed})
+            return failed
+
+        for i, (offset, length) in zip(packed, ranges):
+            entries[i]['MessageBody'] = PayloadS3Pointer(
+                params['Bucket'], params['Key'], offset, length).toJSON()
+
+        return failed
+
+    async def _call_batch_wo_failed(
+        self, func: typing.Callable, args: tuple, kwargs: dict,
+        failed: typing.Dict[int, dict],
+    ) -> dict:
+        """Await the original batch method only with entries which
+        didn't fail on S3, and report the others as failed ones.
+        See SQSExtendedMessage._call_batch_wo_failed.
+        """
+        if not failed:
+            return await func(*args, **kwargs)
+
+        kwargs['Entries'] = [
+            entry for i, entry in enumerate(kwargs['Entries'])
+            if i not in failed]
+        response = (
+            await func(*args, **kwargs) if kwargs['Entries']
+            else {'Successful': []})
+        response.setdefault('Failed', []).extend(failed.values())
+
+        return response
+
+    async def _call_batches(
+        self, func: typing.Callable, args: tuple, kwargs: dict,
+        batches: typing.List[typing.List[int]],
+        failed: typing.Dict[int, dict], keep_order: bool = False,
+    ) -> dict:
+        """Await the original batch method for each planned batch
+        concurrently, and merge the responses into one.
+        See SQSExtendedMessage._call_batches.
+        """
+        if len(batches) == 1 and not (keep_order and failed):
+            return await self._call_batch_wo_failed(
+                func, args, kwargs, failed)
+
+        entries = kwargs['Entries']
+
+        def call(batch):
+            return func(
+                *args, **{**kwargs, 'Entries': [entries[i] for i in batch]})
+
+        if keep_order:
+            failed_groups = set()
+            sent = []
+            results = []
+            for batch in batches:
+                batch = self._skip_failed_groups(
+                    entries, batch, failed, failed_groups)
+                if not batch:
+                    continue
+                try:
+                    res = await call(batch)
+                except Exception as e:
+                    res = e
+                self._add_failed_groups(entries, batch, res, failed_groups)
+                sent.append(batch)
+                results.append(res)
+
+            return self._merge_batch_responses(
+                entries, sent, results, failed)
+
+        batches = [
+            [i for i in batch if i not in failed] for batch in batches]
+        batches = [batch for batch in batches if batch]
+        results = await self._gather(
+            [call(batch) for batch in batches],
+            self.batch_max_concurrency, return_exceptions=True)
+
+        return self._merge_batch_responses(entries, batches, results, failed)
+
+    async def _get_object_by_ranges(
+        self, payload: PayloadS3Pointer,
+    ) -> typing.Tuple[bytearray, dict]:
+        """Get the stored object by concurrent byte-range requests.
+        See SQSExtendedMessage._get_object_by_ranges.
+        """
+        part_size = self.download_part_size
+        response = await self.s3_client.get_object(
+            Bucket=payload.s3BucketName, Key=payload.s3Key,
+            Range=f'bytes=0-{part_size - 1}')
+        # like 'bytes 0-8388607/104857600'
+        total = int(response['ContentRange'].split('/')[-1])
+        buffer = bytearray(total)
+        view = memoryview(buffer)
+        first = await response['Body'].read()
+        view[0:len(first)] = first
+
+        async def get_part(start: int) -> None:
+            end = min(start + part_size, total)
+            # IfMatch fails if the object is overwritten while getting parts
+            res = await self.s3_client.get_object(
+                Bucket=payload.s3BucketName, Key=payload.s3Key,
+                Range=f'bytes={start}-{end - 1}', IfMatch=response['ETag'])
+            part = await res['Body'].read()
+            if len(part) != end - start:
+                raise ValueError(
+                    f'{payload.s3Key} was truncated at {start + len(part)}')
+            view[start:end] = part
+
+        await self._gather(
+            [get_part(start)
+             for start in range(len(first), total, part_size)],
+            self.download_max_concurrency)
+
+        return buffer, response.get('Metadata', {})
+
+    async def _get_message_from_s3(
+        self, payload: PayloadS3Pointer, size: typing.Optional[int] = None,
+    ) -> typing.Any:
+        """Get actual message stored in S3.
+        See SQSExtendedMessage._get_message_from_s3.
+        """
+        cached = self._get_cached_object(payload)
+        if cached is not None:
+            return await self._run_in_executor(self._decode_object, *cached)
+
+        if (self.spool_threshold is not None and size is not None
+                and size >= self.spool_threshold):
+            return await self._spool_message_from_s3(payload)
+
+        if self._is_got_by_ranges(payload, size):
+            data, metadata = await self._get_object_by_ranges(payload)
+        else:
+            response = await self.s3_client.get_object(
+                **self._get_object_params(payload))
+            self._verify_checksum(payload, response)
+            data = await response['Body'].read()
+            metadata = response.get('Metadata', {})
+
+        logger.info(
+            f"{payload.s3Key} was read from {payload.s3BucketName}")
+        self._cache_object(payload, data, metadata)
+
+        return await self._run_in_executor(
+            self._decode_object, data, metadata)
+
+    async def _spool_message_from_s3(
+            self, payload: PayloadS3Pointer) -> typing.IO[bytes]:
+        """Get actual message stored in S3 into the spooled file.
+        See SQSExtendedMessage._spool_message_from_s3.
+        """
+        response = await self.s3_client.get_object(
+            **self._get_object_params(payload))
+        self._verify_checksum(payload, response)
+        compression = response.get('Metadata', {}).get(
+            SQSExtendedConstants.COMPRESSION_METADATA_NAME.value)
+        decompressor = (
+            self._get_codec(compression).decompressor()
+            if compression is not None else None)
+
+        spooled = DigestSpooledFile(
+            max_size=self.spool_threshold, dir=self.spool_directory)
+
+        def write(chunk: typing.Optional[bytes]) -> None:
+            # None flushes the decompressor at the end
+            if decompressor is None:
+                if chunk is not None:
+                    spooled.write(chunk)
+            elif chunk is None:
+                spooled.write(decompressor.flush())
+            else:
+                spooled.write(decompressor.decompress(chunk))
+
+        try:
+            while True:
+                chunk = await response['Body'].read(self.download_part_size)
+                if not chunk:
+                    break
+                await self._run_in_executor(write, chunk)
+            await self._run_in_executor(write, None)
+        except Exception:
+            spooled.close()
+            raise
+        spooled.seek(0)
+        logger.info(
+            f"{payload.s3Key} was spooled from {payload.s3BucketName}")
+
+        return spooled
+
+    async def _revert_attributes_and_message(
+        self, attributes: typing.Optional[dict], body: str,
+        receipt_handle: str,
+    ) -> typing.Tuple[typing.Optional[dict], typing.Any, str]:
+        """Revert attributes and message from the queue.
+        See SQSExtendedMessage._revert_attributes_and_message.
+        """
+        if attributes is not None and attributes.get(
+                SQSExtendedConstants.RESERVED_ENCODING_ATTRIBUTE_NAME.value
+        ) is not None:
+            return await self._run_in_executor(
+                self._decode_inline_message, attributes, body,
+                receipt_handle)
+
+        name = SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value
+        if attributes is None or attributes.get(name) is None:
+            # messages kept in the queue are reverted without S3
+            return super()._revert_attributes_and_message(
+                attributes, body, receipt_handle)
+
+        payload = PayloadS3Pointer.fromJSON(body)
+        size = int(attributes[name].get('StringValue', 0))
+        data = await self._get_message_from_s3(payload, size)
+        attr = self._pop_reserved_attribute(
+            attributes, name,
+            SQSExtendedConstants.RESERVED_REFERENCE_ATTRIBUTE_NAME.value)
+
+        return attr, data, self._build_receipt_handle(
+            payload, receipt_handle, self._get_reference(attributes))
+
+    async def _revert_received_messages(
+        self, is_client: bool, messages: list,
+        visibility_timeout: typing.Optional[int] = None,
+    ) -> None:
+        """Revert all received messages in place.
+        Messages stored in S3 are got concurrently up to max_workers,
+        and their digests are calculated on the thread pool.
+        :type is_client: bool
+        :param is_client: True if the caller is client
+        :type messages: list
+        :param messages: received messages
+        :type visibility_timeout: int
+        :param visibility_timeout: VisibilityTimeout of the receiving call,
+            for which messages are held in byte_budget
+        """
+        parsed = [
+            self._parse_received_message(is_client, message)
+            for message in messages]
+        sizes = self._get_stored_sizes(is_client, messages, parsed)
+        await self._acquire_budget(sizes, visibility_timeout)
+        try:
+            results = await self._gather([
+                self._revert_attributes_and_message(*args)
+                for args in parsed], self.max_workers)
+        except Exception:
+            self._release_budget(sizes)
+            raise
+
+        def update() -> None:
+            for message, result in zip(messages, results):
+                self._update_received_message(message, is_client, *result)
+
+        if any(self._find_reserved_attribute(args[0]) for args in parsed):
+            await self._run_in_executor(update)
+        else:
+            update()
+
+    async def _acquire_budget(
+        self, sizes: typing.Dict[str, typing.Tuple[int, str]],
+        hold_timeout: typing.Optional[float] = None,
+    ) -> None:
+        """Wait until received messages fit into byte_budget if given
+        on the thread pool not to block the event loop.
+        If the caller is cancelled while waiting, the messages are released
+        as soon as the thread holds them because nobody gets them.
+        See SQSExtendedMessage._acquire_budget.
+        """
+        if self.byte_budget is None or not sizes:
+            return
+
+        future = self._get_executor('sqs-extended-budget').submit(
+            super()._acquire_budget, sizes, hold_timeout)
+        try:
+            await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            def release(done: concurrent.futures.Future) -> None:
+                if not done.cancelled() and done.exception() is None:
+                    self._release_budget(sizes)
+
+            future.add_done_callback(release)
+            raise
+
+    async def _delete_message_from_s3(self, receipt_handle: str) -> None:
+        """Delete message stored in S3.
+        :type receipt_handle: str
+        :param receipt_handle: identifier to handle received message
+        """
+        self._invalidate_cached_objects([receipt_handle])
+        self._release_budget([receipt_handle])
+        bucket, key, _ = self._parse_receipt_handle(receipt_handle)
+        packed = self._parse_ack_key(key)
+        if packed is not None:
+            await self._acknowledge_packed_messages(bucket, *packed)
+            return
+
+        await self.s3_client.delete_object(Bucket=bucket, Key=key)
+        logger.info(f"{key} was deleted from {bucket}")
+
+        content_key = self._get_referenced_key(key)
+        if content_key is not None:
+            await self._delete_unreferenced_objects(bucket, [content_key])
+
+    async def _acknowledge_packed_messages(
+            self, bucket: str, key: str, offsets: typing.List[int]) -> None:
+        """Put the acknowledgement marker of packed messages, and delete
+        the object if all messages packed in it are acknowledged.
+        See SQSExtendedMessage._acknowledge_packed_messages.
+        """
+        await self.s3_client.put_object(
+            Bucket=bucket, Key=self._ack_key(key, offsets), Body=b'')
+        logger.info(f"{key} was acknowledged at {offsets} in {bucket}")
+
+        try:
+            markers = []
+            params = {'Bucket': bucket, 'Prefix': self._ack_key(key, [])}
+            while True:
+                page = await self.s3_client.list_objects_v2(**params)
+                markers.extend(o['Key'] for o in page.get('Contents', []))
+                if not page.get('IsTruncated'):
+                    break
+                params['ContinuationToken'] = page['NextContinuationToken']
+
+            if not self._is_all_acknowledged(key, markers):
+                return
+
+            res = await self.s3_client.delete_objects(
+                Bucket=bucket, Delete={
+                    'Objects': [{'Key': k} for k in [key] + markers],
+                    'Quiet': True,
+                })
+        except Exception as e:
+            res = e
+        self._log_deleted_objects(bucket, [key], res)
+
+    async def _is_referenced(self, bucket: str, key: str) -> bool:
+        """Check whether any reference marker of the stored object remains.
+        """
+        res = await self.s3_client.list_objects_v2(
+            Bucket=bucket, Prefix=self._reference_key(key, ''), MaxKeys=1)
+
+        return res.get('KeyCount', 0) > 0
+
+    async def _delete_unreferenced_objects(
+            self, bucket: str, keys: typing.List[str]) -> None:
+        """Delete stored objects whose reference markers were all deleted.
+        See SQSExtendedMessage._delete_unreferenced_objects.
+        """
+        results = await self._gather(
+            [self._is_referenced(bucket, key) for key in keys],
+            self.max_workers, return_exceptions=True)
+        unreferenced = []
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    f'failed to list references of {key}: {result}')
+            elif not result:
+                unreferenced.append(key)
+
+        limit = SQSExtendedConstants.MAX_DELETE_OBJECTS.value
+        for n in range(0, len(unreferenced), limit):
+            chunk = unreferenced[n:n + limit]
+            try:
+                res = await self.s3_client.delete_objects(
+                    Bucket=bucket, Delete={
+                        'Objects': [{'Key': key} for key in chunk],
+                        'Quiet': True,
+                    })
+            except Exception as e:
+                res = e
+            self._log_deleted_objects(bucket, chunk, res)
+
+    async def _delete_messages_from_s3(
+        self, entries: typing.List[dict],
+        receipt_handles: typing.Dict[int, str],
+    ) -> typing.Dict[int, dict]:
+        """Delete messages of batch entries stored in S3 by DeleteObjects
+        of each bucket concurrently.
+        See SQSExtendedMessage._delete_messages_from_s3.
+        """
+        self._invalidate_cached_objects(receipt_handles.values())
+        self._release_budget(receipt_handles.values())
+        packed, receipt_handles = self._group_packed_messages(
+            receipt_handles)
+        targets = list(packed)
+        results = await self._gather([
+            self._acknowledge_packed_messages(*target, list(packed[target]))
+            for target in targets], self.max_workers, return_exceptions=True)
+
+        failed = {}
+        for target, result in zip(targets, results):
+            if isinstance(result, Exception):
+                failed.update(self._failed_packed_messages(
+                    entries, target, packed[target], result))
+
+        chunks = self._group_objects_to_delete(receipt_handles)
+        results = await self._gather([
+            self.s3_client.delete_objects(
+                Bucket=bucket, Delete={
+                    'Objects': [{'Key': key} for key in chunk],
+                    'Quiet': True,
+                })
+            for bucket, chunk in chunks], self.max_workers,
+            return_exceptions=True)
+
+        for (bucket, chunk), result in zip(chunks, results):
+            failed.update(
+                self._check_deleted_objects(entries, bucket, chunk, result))
+
+        # reference markers were deleted instead of shared objects
+        for bucket, keys in self._find_referenced_keys(
+                chunks, failed).items():
+            await self._delete_unreferenced_objects(bucket, keys)
+
+        return failed
+
+    def _send_message_extended(self, func: typing.Callable) -> typing.Callable:
+        async def send_message_extended(*args, **kwargs) -> typing.Any:
+            """Send a message (and attributes) to the given queue.
+            See SQSExtendedMessage._send_message_extended.
+            """
+            attributes = kwargs.get('MessageAttributes', {})
+            reserved = self._find_reserved_attribute(attributes)
+            if reserved is not None:
+                raise ValueError(f'{reserved} is reserved name')
+
+            body = kwargs.get('MessageBody', None)
+            if body is None:
+                raise ValueError('message body is required')
+
+            kwargs['MessageAttributes'], kwargs['MessageBody'], encoded = (
+                await self._compress_in_executor(
+                    self.compress_to_fit,
+                    self._prepare_attributes_and_message, attributes, body))
+            if encoded is not None:
+                kwargs['MessageBody'] = await self._put_message_to_s3(
+                    encoded, reference=self._get_reference(
+                        kwargs['MessageAttributes']))
+
+            return await func(*args, **kwargs)
+
+        return send_message_extended
+
+    def _receive_message_extended(
+            self, func: typing.Callable) -> typing.Callable:
+        async def receive_message_extended(*args, **kwargs) -> typing.Any:
+            """Receive messages (and attributes) from the given queue.
+            See SQSExtendedMessage._receive_message_extended.
+            """
+            self._add_reserved_attribute_names(kwargs)
+
+            # get message from queue
+            response = await func(*args, **kwargs)
+            is_client, messages, metadata = self._parse_received_response(
+                response)
+
+            # transform messages
+            await self._revert_received_messages(
+                is_client, messages, kwargs.get('VisibilityTimeout'))
+
+            if messages:
+                metadata['Messages'] = messages
+
+            return metadata
+
+        return receive_message_extended
+
+    def _delete_message_extended(
+            self, func: typing.Callable) -> typing.Callable:
+        async def delete_message_extended(*args, **kwargs) -> None:
+            """Delete a message from the given queue and S3 bucket.
+            See SQSExtendedMessage._delete_message_extended.
+            """
+            receipt_handle = kwargs.get('ReceiptHandle')
+            if receipt_handle is None:
+                raise ValueError('invalid call without ReceiptHandle')
+
+            if self._is_extended_receipt_handle(receipt_handle):
+                await self._delete_message_from_s3(receipt_handle)
+                kwargs['ReceiptHandle'] = (
+                    self._get_original_receipt_handle(receipt_handle))
+
+            await func(*args, **kwargs)
+
+        return delete_message_extended
+
+    def _send_message_batch_extended(
+            self, func: typing.Callable) -> typing.Callable:
+        async def send_message_batch_extended(*args, **kwargs) -> dict:
+            """Send messages (and attributes) to the given queue.
+            See SQSExtendedMessage._send_message_batch_extended.
+            """
+            entries = kwargs.get('Entries')
+            if not isinstance(entries, list):
+                raise ValueError('Entries (list) must be given')
+
+            uploads, batches, keep_order = await self._compress_in_executor(
+                self.compress_to_fit, self._prepare_batch_entries, entries)
+
+            # put all offloaded messages into S3 concurrently
+            failed = await self._put_packed_messages_to_s3(entries, uploads)
+
+            return await self._call_batches(
+                func, args, kwargs, batches, failed, keep_order)
+
+        return send_message_batch_extended
+
+    def _delete_message_batch_extended(
+            self, func: typing.Callable) -> typing.Callable:
+        async def delete_message_batch_extended(*args, **kwargs) -> dict:
+            """Delete messages from the given queue and S3 bucket.
+            See SQSExtendedMessage._delete_message_batch_extended.
+            """
+            entries = kwargs.get('Entries')
+            if not isinstance(entries, list):
+                raise ValueError('Entries (list) must be given')
+
+            receipt_handles = self._find_extended_receipt_handles(entries)
+
+            # messages whose stored one was not deleted are kept in the queue
+            failed = await self._delete_messages_from_s3(
+                entries, receipt_handles)
+            self._restore_receipt_handles(entries, receipt_handles, failed)
+
+            return await self._call_batch_wo_failed(
+                func, args, kwargs, failed)
+
+        return delete_message_batch_extended
+
+    def _change_message_visibility_extended(
+            self, func: typing.Callable) -> typing.Callable:
+        async def change_message_visibility_extended(
+                *args, **kwargs) -> typing.Any:
+            """Change the visibility timeout of the received message.
+            See SQSExtendedMessage._change_message_visibility_extended.
+            """
+            receipt_handle = kwargs.get('ReceiptHandle')
+            if receipt_handle is None:
+                raise ValueError('invalid call without ReceiptHandle')
+
+            if self._is_extended_receipt_handle(receipt_handle):
+                kwargs['ReceiptHandle'] = (
+                    self._get_original_receipt_handle(receipt_handle))
+
+            response = await func(*args, **kwargs)
+            self._change_budget_holds(
+                [(receipt_handle, kwargs.get('VisibilityTimeout'))])
+
+            return response
+
+        return change_message_visibility_extended
+
+    def _change_message_visibility_batch_extended(
+            self, func: typing.Callable) -> typing.Callable:
+        async def change_message_visibility_batch_extended(
+                *args, **kwargs) -> dict:
+            """Change the visibility timeout of received messages.
+            See SQSExtendedMessage._change_message_visibility_batch_extended.
+            """
+            entries = kwargs.get('Entries')
+            if not isinstance(entries, list):
+                raise ValueError('Entries (list) must be given')
+
+            kwargs['Entries'] = self._strip_receipt_handles(entries)
+
+            response = await func(*args, **kwargs)
+            self._change_budget_holds(
+                self._changed_visibility_timeouts(entries, response))
+
+            return response
+
+        return change_message_visibility_batch_extended
+
+    def _release_message_extended(self) -> typing.Callable:
+        release = super()._release_message_extended()
+
+        async def release_message_extended(*args, **kwargs) -> int:
+            """Release the received message from byte_budget.
+            See SQSExtendedMessage._release_message_extended.
+            """
+            return release(*args, **kwargs)
+
+        return release_message_extended
+
+
+def extend_sqs(
+    session: typing.Any, s3_client: typing.Any, s3_bucket_name: str,
+    **kwargs,
+) -> AsyncSQSExtendedMessage:
+    """Add the async extended methods to SQS clients created by
+    the given aiobotocore session after this call.
+    Unlike SQSExtendedSession.extend_sqs, this doesn't create the bucket.
+    :type session: aiobotocore.session.AioSession
+    :param session: aiobotocore session to create SQS clients
+    :type s3_client: object
+    :param s3_client: S3 client of aiobotocore to store actual messages
+    :type s3_bucket_name: string
+    :param s3_bucket_name: S3 bucket name to store actual messages
+    :param kwargs: other options of SQSExtendedMessage
+    :rtype: AsyncSQSExtendedMessage
+    :return: instance which the extended methods refer to
+    """
+    event = 'creating-client-class.sqs'
+    sqs = AsyncSQSExtendedMessage(s3_client, s3_bucket_name, **kwargs)
+    session.register(event, sqs.add_send_message_extended(event))
+    session.register(event, sqs.add_receive_message_extended(event))
+    session.register(event, sqs.add_delete_message_extended(event))
+    session.register(event, sqs.add_send_message_batch_extended(event))
+    session.register(event, sqs.add_delete_message_batch_extended(event))
+    session.register(event, sqs.add_change_message_visibility_extended(event))
+    session.register(
+        event, sqs.add_change_message_visibility_batch_extended(event))
+
+    return sqs
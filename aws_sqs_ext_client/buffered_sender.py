@@ -0,0 +1,271 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+import typing
+
+from .constants import SQSExtendedConstants
+
+logger = logging.getLogger(__name__)
+
+
+class BatchEntryError(Exception):
+    """Error of an entry reported in `Failed` of the batch method.
+    :type failed: dict
+    :param failed: failed result, like
+        `{'Id': ..., 'SenderFault': ..., 'Code': ..., 'Message': ...}`
+    """
+
+    def __init__(self, failed: dict) -> None:
+        super().__init__(f"{failed.get('Code')}: {failed.get('Message')}")
+        self.failed = failed
+
+
+class _Batch(object):
+    """Messages buffered for a queue."""
+
+    def __init__(self, queue_url: str) -> None:
+        self.queue_url = queue_url
+        self.entries = []
+        self.futures = []
+        self.size = 0
+        self.deadline = None
+
+
+class BufferedSender(object):
+    """Sender that buffers messages of `send_message` per queue and sends
+    them together by `send_message_batch_extended`, like
+    AmazonSQSBufferedAsyncClient of the Java SDK.
+    Buffered messages are sent when the number of them reaches
+    max_batch_size, when the total size reaches max_batch_bytes,
+    or when max_wait_seconds has elapsed since the first one was buffered.
+    Whether messages are stored in S3 is decided by
+    send_message_batch_extended for the whole batch, and the size of each
+    message is estimated by `get_batch_entry_size_extended` of the client
+    with the same options.
+    Batches of different queues are sent concurrently, while batches of
+    a FIFO queue are sent one by one in order not to change the order of
+    messages in each MessageGroupId.
+    :type client: object
+    :param client: SQS client extended by SQSExtendedSession
+    :type max_batch_size: int
+    :param max_batch_size: max number of messages in a batch
+        (optional: by default, it's 10, which is the SQS limitation)
+    :type max_batch_bytes: int
+    :param max_batch_bytes: max total size of messages in a batch
+        (optional: by default, it's the SQS limitation 262,144)
+    :type max_wait_seconds: float
+    :param max_wait_seconds: max time to buffer a message
+        (optional: by default, it's 0.2)
+    :type max_workers: int
+    :param max_workers: number of threads to send batches concurrently
+        (optional: by default, it's 10)
+    """
+
+    def __init__(
+        self, client: typing.Any,
+        max_batch_size: int = (
+            SQSExtendedConstants.MAX_BATCH_ENTRIES.value),
+        max_batch_bytes: int = SQSExtendedConstants.MAX_BATCH_SIZE.value,
+        max_wait_seconds: float = (
+            SQSExtendedConstants.DEFAULT_MAX_BATCH_WAIT_SECONDS.value),
+        max_workers: int = SQSExtendedConstants.DEFAULT_MAX_WORKERS.value,
+    ) -> None:
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.max_wait_seconds = max_wait_seconds
+        self._batches = {}
+        # batches waiting for the previous one of the same FIFO queue,
+        # and the future of each, keyed by the queue URL
+        self._fifo_batches = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='sqs-buffered-sender')
+        self._thread = threading.Thread(
+            target=self._run, name='sqs-buffered-sender-timer', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'BufferedSender':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def send_message(self, **kwargs) -> concurrent.futures.Future:
+        """Buffer a message to be sent.
+        This accepts the same arguments as send_message of the client,
+        like QueueUrl, MessageBody, and MessageAttributes.
+        :rtype: concurrent.futures.Future
+        :return: future of the result, like
+            `{'MessageId': ..., 'MD5OfMessageBody': ...}`. if the message
+            is reported as failed, the future raises BatchEntryError
+        """
+        queue_url = kwargs.pop('QueueUrl', None)
+        if queue_url is None:
+            raise ValueError('QueueUrl is required')
+        if kwargs.get('MessageBody') is None:
+            raise ValueError('message body is required')
+
+        size = self.client.get_batch_entry_size_extended(**kwargs)
+        future = concurrent.futures.Future()
+        ready = []
+        with self._condition:
+            if self._closed:
+                raise ValueError('sender was already closed')
+
+            batch = self._batches.get(queue_url)
+            if batch is not None and (
+                    batch.size + size > self.max_batch_bytes):
+                ready.append(self._batches.pop(queue_url))
+                batch = None
+
+            if batch is None:
+                batch = _Batch(queue_url)
+                batch.deadline = time.monotonic() + self.max_wait_seconds
+                self._batches[queue_url] = batch
+                self._condition.notify()
+
+            batch.entries.append(kwargs)
+            batch.futures.append(future)
+            batch.size += size
+            if len(batch.entries) >= self.max_batch_size:
+                ready.append(self._batches.pop(queue_url))
+
+        for batch in ready:
+            self._dispatch(batch)
+
+        return future
+
+    def flush(self) -> None:
+        """Send all buffered messages, and wait for the results."""
+        with self._condition:
+            batches = list(self._batches.values())
+            self._batches.clear()
+
+        futures = [self._dispatch(batch) for batch in batches]
+        concurrent.futures.wait(futures)
+
+    def close(self) -> None:
+        """Send all buffered messages, and stop the sender."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+
+        self._thread.join()
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def _run(self) -> None:
+        """Send batches whose max_wait_seconds has elapsed."""
+        while True:
+            with self._condition:
+                while not self._closed:
+                    now = time.monotonic()
+                    deadlines = [b.deadline for b in self._batches.values()]
+                    if deadlines and min(deadlines) <= now:
+                        break
+                    self._condition.wait(
+                        min(deadlines) - now if deadlines else None)
+
+                if self._closed:
+                    return
+
+                now = time.monotonic()
+                ready = [
+                    self._batches.pop(url)
+                    for url, batch in list(self._batches.items())
+                    if batch.deadline <= now]
+
+            for batch in ready:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch: _Batch) -> concurrent.futures.Future:
+        """Send the batch on the thread pool. Batches of a FIFO queue
+        are sent after the previous one of the same queue.
+        """
+        if not batch.queue_url.endswith(
+                SQSExtendedConstants.FIFO_QUEUE_SUFFIX.value):
+            return self._executor.submit(self._send_batch, batch)
+
+        future = concurrent.futures.Future()
+        with self._condition:
+            pending = self._fifo_batches.setdefault(
+                batch.queue_url, collections.deque())
+            pending.append((batch, future))
+            if len(pending) > 1:
+                # sent when the previous one is done
+                return future
+
+        self._executor.submit(self._send_fifo_batches, batch.queue_url)
+        return future
+
+    def _send_fifo_batches(self, queue_url: str) -> None:
+        """Send the first pending batch of the FIFO queue, and then
+        submit the next one.
+        :type queue_url: str
+        :param queue_url: URL of the FIFO queue
+        """
+        with self._condition:
+            batch, future = self._fifo_batches[queue_url][0]
+
+        try:
+            self._send_batch(batch)
+        finally:
+            with self._condition:
+                pending = self._fifo_batches[queue_url]
+                pending.popleft()
+                if not pending:
+                    del self._fifo_batches[queue_url]
+            # the next one is submitted before flush finds this one done
+            if pending:
+                self._executor.submit(self._send_fifo_batches, queue_url)
+            future.set_result(None)
+
+    def _send_batch(self, batch: _Batch) -> None:
+        """Send the batch, and set the result of each message."""
+        entries = [
+            {**entry, 'Id': str(i)} for i, entry in enumerate(batch.entries)]
+        try:
+            response = self.client.send_message_batch_extended(
+                QueueUrl=batch.queue_url, Entries=entries)
+        except Exception as e:
+            logger.warning(f'failed to send messages: {e}')
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+
+        for result in response.get('Successful', []):
+            result = dict(result)
+            batch.futures[int(result.pop('Id'))].set_result(result)
+        for failed in response.get('Failed', []):
+            batch.futures[int(failed['Id'])].set_exception(
+                BatchEntryError(failed))
@@ -0,0 +1,312 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+import re
+import threading
+import time
+import typing
+
+from .constants import SQSExtendedConstants
+
+logger = logging.getLogger(__name__)
+
+
+class ByteBudget(object):
+    """Budget of bytes of messages got from S3 and not released yet,
+    which bounds memory used by received messages.
+    Messages are held by their MessageIds from receiving until they are
+    released or deleted by the extended methods, and receiving waits until
+    the whole batch fits into the budget. A batch larger than the budget
+    is accepted when nothing is held not to wait forever.
+    A message received again, like after its visibility timeout, replaces
+    the hold of the previous delivery, and holds can be released by their
+    receipt handles as well.
+    The same budget can be shared by extended clients of a process.
+    :type max_bytes: int
+    :param max_bytes: max total size of messages held at once
+    :type hold_timeout: float
+    :param hold_timeout: seconds after which messages never released,
+        like ones received by other consumers after their visibility
+        timeout, are released automatically. receiving with
+        VisibilityTimeout holds messages for it instead
+        (optional: by default, it's 30, which is the default visibility
+        timeout of SQS. None holds them until released)
+    """
+
+    def __init__(
+        self, max_bytes: int, hold_timeout: typing.Optional[float] = (
+            SQSExtendedConstants.DEFAULT_BUDGET_HOLD_TIMEOUT.value),
+    ) -> None:
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be positive')
+
+        self.max_bytes = max_bytes
+        self.hold_timeout = hold_timeout
+        self.used = 0
+        self.waiting = 0
+        self.wait_seconds = 0.0
+        self.expired = 0
+        # (size, deadline, original receipt handle) keyed by MessageId
+        self._holds = {}
+        # MessageId keyed by the original receipt handle
+        self._handles = {}
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._holds)
+
+    def stats(self) -> dict:
+        """Return gauges of the budget.
+        :rtype: dict
+        :return: held bytes and messages, number of waiting callers,
+            total seconds spent waiting, and number of expired holds
+        """
+        with self._condition:
+            return {
+                'max_bytes': self.max_bytes,
+                'used_bytes': self.used,
+                'holds': len(self._holds),
+                'waiting': self.waiting,
+                'wait_seconds': self.wait_seconds,
+                'expired': self.expired,
+            }
+
+    def acquire(
+        self, message_id: str, size: int,
+        timeout: typing.Optional[float] = None,
+        receipt_handle: typing.Optional[str] = None,
+    ) -> float:
+        """Hold bytes of the message, and wait until they fit.
+        :type message_id: str
+        :param message_id: MessageId of the message
+        :type size: int
+        :param size: size of the message
+        :type timeout: float
+        :param timeout: max seconds to wait (optional: wait forever)
+        :type receipt_handle: str
+        :param receipt_handle: receipt handle of the message, by which
+            the hold can be released as well (optional)
+        :rtype: float
+        :return: seconds spent waiting
+        """
+        return self.acquire_all(
+            {message_id: size}, timeout,
+            {message_id: receipt_handle} if receipt_handle else None)
+
+    def acquire_all(
+        self, sizes: typing.Dict[str, int],
+        timeout: typing.Optional[float] = None,
+        receipt_handles: typing.Optional[typing.Dict[str, str]] = None,
+        hold_timeout: typing.Optional[float] = None,
+    ) -> float:
+        """Hold bytes of messages together, and wait until all fit.
+        :type sizes: dict
+        :param sizes: size of each message keyed by its MessageId
+        :type timeout: float
+        :param timeout: max seconds to wait (optional: wait forever)
+        :type receipt_handles: dict
+        :param receipt_handles: receipt handle of each message keyed by its
+            MessageId, by which the hold can be released as well (optional)
+        :type hold_timeout: float
+        :param hold_timeout: seconds to hold messages until released
+            (optional: by default, hold_timeout of the budget)
+        :rtype: float
+        :return: seconds spent waiting
+        """
+        receipt_handles = receipt_handles or {}
+        total = sum(sizes.values())
+        start = time.monotonic()
+        with self._condition:
+            # the previous delivery of a message received again is replaced
+            if sum(self._remove(key) for key in sizes):
+                self._condition.notify_all()
+
+            self.waiting += 1
+            try:
+                while not self._fits(total):
+                    if (timeout is not None
+                            and time.monotonic() - start >= timeout):
+                        raise TimeoutError(
+                            f'{total} bytes could not be held in {timeout}s')
+                    self._condition.wait(self._wait_seconds(start, timeout))
+            finally:
+                self.waiting -= 1
+
+            waited = time.monotonic() - start
+            self.wait_seconds += waited
+            deadline = self._deadline(hold_timeout)
+            for key, size in sizes.items():
+                # removed again if acquired by another caller while waiting
+                self._remove(key)
+                receipt_handle = receipt_handles.get(key)
+                if receipt_handle is not None:
+                    receipt_handle = _original(receipt_handle)
+                    self._handles[receipt_handle] = key
+                self._holds[key] = (size, deadline, receipt_handle)
+                self.used += size
+
+        if waited > 0.001:
+            logger.info(f'waited {waited:.3f}s to hold {total} bytes')
+        return waited
+
+    def release(self, key: str) -> int:
+        """Release bytes of the message.
+        :type key: str
+        :param key: MessageId or receipt handle of the message, which may
+            be the extended one
+        :rtype: int
+        :return: released size (0 if not held)
+        """
+        return self.release_all([key])
+
+    def release_all(self, keys: typing.Iterable[str]) -> int:
+        """Release bytes of messages.
+        :type keys: iterable
+        :param keys: MessageIds or receipt handles of messages, which may
+            be extended ones
+        :rtype: int
+        :return: total released size
+        """
+        with self._condition:
+            released = sum(self._remove(self._find(key)) for key in keys)
+            if released:
+                self._condition.notify_all()
+            return released
+
+    def renew_all(
+        self, keys: typing.Iterable[str],
+        hold_timeout: typing.Optional[float] = None,
+    ) -> None:
+        """Hold messages longer, like when their visibility timeout
+        is extended.
+        :type keys: iterable
+        :param keys: MessageIds or receipt handles of messages, which may
+            be extended ones
+        :type hold_timeout: float
+        :param hold_timeout: seconds to hold messages from now
+            (optional: by default, hold_timeout of the budget)
+        """
+        deadline = self._deadline(hold_timeout)
+        with self._condition:
+            for key in map(self._find, keys):
+                if key in self._holds:
+                    size, _, receipt_handle = self._holds[key]
+                    self._holds[key] = (size, deadline, receipt_handle)
+            # waiters recalculate the next expiration
+            self._condition.notify_all()
+
+    def _deadline(
+        self, hold_timeout: typing.Optional[float],
+    ) -> typing.Optional[float]:
+        """Return the monotonic time when holds expire.
+        :type hold_timeout: float
+        :param hold_timeout: seconds to hold messages
+            (None for hold_timeout of the budget)
+        :rtype: float
+        :return: deadline (None if they never expire)
+        """
+        if hold_timeout is None:
+            hold_timeout = self.hold_timeout
+
+        return (
+            time.monotonic() + hold_timeout if hold_timeout is not None
+            else None)
+
+    def _find(self, key: str) -> str:
+        """Return MessageId of the hold. Called with the lock.
+        :type key: str
+        :param key: MessageId or receipt handle (extended or not)
+        :rtype: str
+        :return: MessageId (the given key if it's not a receipt handle)
+        """
+        if key in self._holds:
+            return key
+
+        original = _original(key)
+        return self._handles.get(original, original)
+
+    def _fits(self, size: int) -> bool:
+        """Check whether the size fits into the budget after releasing
+        expired holds. Called with the lock.
+        :type size: int
+        :param size: size to be held
+        :rtype: bool
+        :return: True if it fits, or nothing is held
+        """
+        now = time.monotonic()
+        for key, (_, deadline, _) in list(self._holds.items()):
+            if deadline is not None and deadline <= now:
+                self._remove(key)
+                self.expired += 1
+                logger.warning(f'hold of {key} expired')
+
+        return not self._holds or self.used + size <= self.max_bytes
+
+    def _wait_seconds(
+        self, start: float, timeout: typing.Optional[float],
+    ) -> typing.Optional[float]:
+        """Return seconds to wait for the next release or expiration.
+        Called with the lock.
+        :type start: float
+        :param start: monotonic time when waiting started
+        :type timeout: float
+        :param timeout: max seconds to wait
+        :rtype: float
+        :return: seconds to wait (None to wait for the next release)
+        """
+        limits = [
+            deadline - time.monotonic()
+            for _, deadline, _ in self._holds.values()
+            if deadline is not None]
+        if timeout is not None:
+            limits.append(start + timeout - time.monotonic())
+
+        return max(min(limits), 0) if limits else None
+
+    def _remove(self, key: str) -> int:
+        """Remove the hold. Called with the lock.
+        :type key: str
+        :param key: MessageId
+        :rtype: int
+        :return: removed size (0 if not held)
+        """
+        size, _, receipt_handle = self._holds.pop(key, (0, None, None))
+        if receipt_handle is not None:
+            self._handles.pop(receipt_handle, None)
+        self.used -= size
+        return size
+
+
+def _original(receipt_handle: str) -> str:
+    """Return the original receipt handle of the extended one.
+    :type receipt_handle: str
+    :param receipt_handle: receipt handle (extended or not)
+    :rtype: str
+    :return: original receipt handle
+    """
+    match = re.match(
+        SQSExtendedConstants.RECEIPT_HANDLER_MATCHER.value, receipt_handle)
+    return match.group(3) if match is not None else receipt_handle
@@ -0,0 +1,292 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import gzip
+import typing
+import zlib
+
+
+class _BufferedCompressor(object):
+    """Incremental (de)compressor which buffers all chunks and processes
+    them at once by flush, for codecs without streaming support.
+    :type func: callable
+    :param func: `compress` or `decompress` of the codec
+    """
+
+    def __init__(self, func: typing.Callable[[bytes], bytes]) -> None:
+        self._func = func
+        self._chunks = []
+
+    def compress(self, data: bytes) -> bytes:
+        self._chunks.append(bytes(data))
+        return b''
+
+    decompress = compress
+
+    def flush(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return self._func(data)
+
+
+class PayloadCodec(object):
+    """Base class of codecs to compress message payloads stored in S3.
+    A codec is identified by its name, which is recorded with the stored
+    payload so that the receiver can choose the codec to decompress it.
+    Subclasses should override `name`, `compress`, and `decompress`,
+    and may override `compressor` and `decompressor` to process large
+    payloads chunk by chunk.
+    """
+
+    name = None
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def compressor(self) -> typing.Any:
+        """Return an incremental compressor, which has `compress(chunk)`
+        and `flush()` like zlib.compressobj. By default, it buffers all
+        chunks in memory and compresses them by flush.
+        """
+        return _BufferedCompressor(self.compress)
+
+    def decompressor(self) -> typing.Any:
+        """Return an incremental decompressor, which has
+        `decompress(chunk)` and `flush()` like zlib.decompressobj.
+        By default, it buffers all chunks in memory and decompresses
+        them by flush.
+        """
+        return _BufferedCompressor(self.decompress)
+
+
+class GzipCodec(PayloadCodec):
+    """Codec with gzip in the standard library.
+    :type level: int
+    :param level: compression level from 0 to 9 (optional: 6 by default)
+    """
+
+    name = 'gzip'
+
+    def __init__(self, level: int = 6) -> None:
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # without the current time in the header, the same data is
+        # compressed into the same bytes, like by the compressor below
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+    def compressor(self) -> typing.Any:
+        # wbits for the gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def decompressor(self) -> typing.Any:
+        return _GzipDecompressor()
+
+
+class ZlibCodec(PayloadCodec):
+    """Codec with zlib in the standard library, which has smaller header
+    than gzip, so that it's used for messages compressed to be kept in SQS.
+    :type level: int
+    :param level: compression level from 0 to 9 (optional: 6 by default)
+    """
+
+    name = 'zlib'
+
+    def __init__(self, level: int = 6) -> None:
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+    def compressor(self) -> typing.Any:
+        return zlib.compressobj(self.level)
+
+    def decompressor(self) -> typing.Any:
+        return zlib.decompressobj()
+
+
+class ZstdCodec(PayloadCodec):
+    """Codec with Zstandard, which requires `zstandard` package.
+    `pip install aws-sqs-ext-client[zstd]` installs it.
+    :type level: int
+    :param level: compression level from 1 to 22 (optional: 3 by default)
+    """
+
+    name = 'zstd'
+
+    def __init__(self, level: int = 3) -> None:
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstd compression requires zstandard package')
+
+        # compressors and decompressors are not thread-safe, so that
+        # they are created by each call for codecs shared by threads
+        self._zstandard = zstandard
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return self._zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        # frames written by `compress` always have the content size,
+        # but decompressobj also accepts frames without it
+        return self._zstandard.ZstdDecompressor().decompressobj().decompress(
+            data)
+
+    def compressor(self) -> typing.Any:
+        return self._zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self) -> typing.Any:
+        return _FlushlessDecompressor(
+            self._zstandard.ZstdDecompressor().decompressobj())
+
+
+class Lz4Codec(PayloadCodec):
+    """Codec with LZ4 frame format, which requires `lz4` package.
+    `pip install aws-sqs-ext-client[lz4]` installs it.
+    :type level: int
+    :param level: compression level from 0 to 16 (optional: 0 by default)
+    """
+
+    name = 'lz4'
+
+    def __init__(self, level: int = 0) -> None:
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ValueError('lz4 compression requires lz4 package')
+
+        self._frame = lz4.frame
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return self._frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._frame.decompress(data)
+
+    def compressor(self) -> typing.Any:
+        return _Lz4Compressor(
+            self._frame.LZ4FrameCompressor(compression_level=self.level))
+
+    def decompressor(self) -> typing.Any:
+        return _FlushlessDecompressor(self._frame.LZ4FrameDecompressor())
+
+
+class _GzipDecompressor(object):
+    """Incremental decompressor of gzip, which accepts multiple members
+    like gzip.decompress."""
+
+    def __init__(self) -> None:
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> bytes:
+        chunks = [self._decompressor.decompress(data)]
+        while self._decompressor.eof and self._decompressor.unused_data:
+            data = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunks.append(self._decompressor.decompress(data))
+
+        return b''.join(chunks)
+
+    def flush(self) -> bytes:
+        return self._decompressor.flush()
+
+
+class _FlushlessDecompressor(object):
+    """Incremental decompressor for the ones without flush."""
+
+    def __init__(self, decompressor: typing.Any) -> None:
+        self._decompressor = decompressor
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+    def flush(self) -> bytes:
+        return b''
+
+
+class _Lz4Compressor(object):
+    """Incremental compressor of LZ4 frame, which writes the frame header
+    with the first chunk."""
+
+    def __init__(self, compressor: typing.Any) -> None:
+        self._compressor = compressor
+        self._header = compressor.begin()
+
+    def compress(self, data: bytes) -> bytes:
+        header, self._header = self._header, b''
+        return header + self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        header, self._header = self._header, b''
+        return header + self._compressor.flush()
+
+
+CODECS = {
+    GzipCodec.name: GzipCodec,
+    ZlibCodec.name: ZlibCodec,
+    ZstdCodec.name: ZstdCodec,
+    Lz4Codec.name: Lz4Codec,
+}
+
+
+def register_codec(codec: typing.Type[PayloadCodec]) -> None:
+    """Register a custom codec so that received payloads compressed with it
+    can be decompressed.
+    :type codec: type
+    :param codec: subclass of PayloadCodec which has the unique name
+    """
+    if not codec.name:
+        raise ValueError('codec must have its name')
+
+    CODECS[codec.name] = codec
+
+
+def get_codec(
+    codec: typing.Union[str, PayloadCodec, None]
+) -> typing.Optional[PayloadCodec]:
+    """Return the codec instance from the given name or instance.
+    :type codec: str or PayloadCodec
+    :param codec: codec name, like 'gzip', or codec instance
+    :rtype: PayloadCodec
+    :return: codec instance (None if None is given)
+    """
+    if codec is None or isinstance(codec, PayloadCodec):
+        return codec
+
+    if codec not in CODECS:
+        raise ValueError(f'unsupported compression: {codec}')
+
+    return CODECS[codec]()
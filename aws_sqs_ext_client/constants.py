@@ -26,9 +26,40 @@ from enum import Enum
 
 class SQSExtendedConstants(Enum):
     RESERVED_ATTRIBUTE_NAME = "ExtendedPayloadSize"
+    RESERVED_ENCODING_ATTRIBUTE_NAME = "ExtendedPayloadEncoding"
+    RESERVED_REFERENCE_ATTRIBUTE_NAME = "ExtendedPayloadReference"
     MESSAGE_POINTER_CLASS = (
         'software.amazon.payloadoffloading.PayloadS3Pointer')
     DEFAULT_MESSAGE_SIZE_THRESHOLD = 2**18
+    DEFAULT_MAX_WORKERS = 10
+    MAX_BATCH_ENTRIES = 10
+    MAX_BATCH_SIZE = 2**18
+    MAX_MESSAGE_ATTRIBUTES = 10
+    FIFO_QUEUE_SUFFIX = ".fifo"
+    DEFAULT_MAX_BATCH_WAIT_SECONDS = 0.2
+    DEFAULT_BATCH_OVERFLOW_STRATEGY = "auto"
+    DEFAULT_PREFETCH_BATCHES = 2
+    DEFAULT_WAIT_TIME_SECONDS = 20
+    DEFAULT_VISIBILITY_MARGIN_SECONDS = 5
+    DEFAULT_RECEIVE_RETRY_SECONDS = 1.0
+    MAX_RECEIVE_RETRY_SECONDS = 20.0
+    DEFAULT_HEARTBEAT_VISIBILITY_TIMEOUT = 30
+    DEFAULT_BUDGET_HOLD_TIMEOUT = 30
+    DEFAULT_ACK_WAIT_SECONDS = 1.0
+    MAX_DELETE_OBJECTS = 1000
+    DEFAULT_PAYLOAD_CACHE_SIZE = 64 * 2**20
+    DIGEST_CHUNKSIZE = 2**20
+    DIGEST_INLINE_VALUE_SIZE = 2**12
+    DEFAULT_PAYLOAD_DISK_CACHE_SIZE = 2**30
+    DEFAULT_MULTIPART_THRESHOLD = 8 * 2**20
+    DEFAULT_MULTIPART_CHUNKSIZE = 8 * 2**20
+    S3_CHECKSUM_ALGORITHMS = ("CRC32", "CRC32C", "CRC64NVME", "SHA1", "SHA256")
+    COMPRESSION_METADATA_NAME = "payload-compression"
+    INLINE_COMPRESSION = "zlib"
+    BASE64_ENCODING = "base64"
+    REFERENCE_MARKER_INFIX = ".refs/"
+    PACKED_KEY_INFIX = ".parts-"
+    ACK_MARKER_INFIX = ".acks/"
     S3_BUCKET_NAME_MARKER = "-..s3BucketName..-"
     S3_KEY_MARKER = "-..s3Key..-"
     RECEIPT_HANDLER_MATCHER = (
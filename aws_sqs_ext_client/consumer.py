@@ -0,0 +1,848 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+import typing
+
+from .buffered_sender import BatchEntryError
+from .constants import SQSExtendedConstants
+
+logger = logging.getLogger(__name__)
+
+
+def _release_messages(client: typing.Any, messages: typing.List[dict]) -> None:
+    """Release messages not processed anymore from the byte budget
+    of the extended client.
+    :type client: object
+    :param client: SQS client extended by SQSExtendedSession
+    :type messages: list
+    :param messages: received messages
+    """
+    for message in messages:
+        try:
+            client.release_message_extended(
+                ReceiptHandle=message['ReceiptHandle'])
+        except Exception as e:
+            logger.warning(f'failed to release message: {e}')
+
+
+class _ReceivedBatch(object):
+    """Messages received by one call, and their visibility deadline."""
+
+    def __init__(self, messages: typing.List[dict], deadline: float) -> None:
+        self.messages = messages
+        self.deadline = deadline
+
+
+class MessageConsumer(object):
+    """Iterator of messages received by `receive_message_extended`, which
+    long-polls and gets messages stored in S3 in the background while
+    the caller processes the current messages.
+    Received batches are kept in a buffer of prefetch_batches, and the
+    background thread waits while the buffer is full. Messages whose
+    visibility timeout would expire within visibility_margin have it
+    extended by `change_message_visibility_batch_extended` not to get them
+    from S3 again, and are counted in extended. Ones whose visibility
+    timeout could not be extended in time are dropped instead of being
+    given, because they can be received by other consumers at the same
+    time. Dropped messages are counted in expired, and received again
+    after their visibility timeout.
+    Messages still buffered when the consumer is closed are not deleted,
+    and received again after their visibility timeout as well.
+    Dropped messages are released from the byte budget of the client.
+    Errors of receiving messages are retried with exponential backoff
+    until the consumer is closed, and counted in receive_errors.
+    :type client: object
+    :param client: SQS client extended by SQSExtendedSession
+    :type queue_url: str
+    :param queue_url: URL of the queue
+    :type prefetch_batches: int
+    :param prefetch_batches: max number of received batches buffered
+        (optional: by default, it's 2)
+    :type visibility_timeout: int
+    :param visibility_timeout: VisibilityTimeout given to receive_message
+        (optional: by default, the attribute of the queue is got and used)
+    :type visibility_margin: float
+    :param visibility_margin: seconds for which at least messages must be
+        invisible when they are given (optional: by default, it's 5)
+    :type stop_when_empty: bool
+    :param stop_when_empty: stop iteration when no messages are received
+        (optional: by default, it's False and waits for new messages)
+    :type retry_seconds: float
+    :param retry_seconds: seconds to wait before the first retry of
+        receiving, which is doubled on each error
+        (optional: by default, it's 1)
+    :type max_retry_seconds: float
+    :param max_retry_seconds: max seconds to wait before retrying
+        (optional: by default, it's 20)
+    :type receive_kwargs: dict
+    :param receive_kwargs: other arguments of receive_message, like
+        MessageAttributeNames (MaxNumberOfMessages and WaitTimeSeconds
+        are 10 and 20 by default)
+    """
+
+    def __init__(
+        self, client: typing.Any, queue_url: str,
+        prefetch_batches: int = (
+            SQSExtendedConstants.DEFAULT_PREFETCH_BATCHES.value),
+        visibility_timeout: typing.Optional[int] = None,
+        visibility_margin: float = (
+            SQSExtendedConstants.DEFAULT_VISIBILITY_MARGIN_SECONDS.value),
+        stop_when_empty: bool = False,
+        retry_seconds: float = (
+            SQSExtendedConstants.DEFAULT_RECEIVE_RETRY_SECONDS.value),
+        max_retry_seconds: float = (
+            SQSExtendedConstants.MAX_RECEIVE_RETRY_SECONDS.value),
+        **receive_kwargs,
+    ) -> None:
+        if prefetch_batches < 1:
+            raise ValueError('prefetch_batches must be positive')
+        if retry_seconds <= 0 or max_retry_seconds < retry_seconds:
+            raise ValueError(
+                'retry_seconds must be positive and up to max_retry_seconds')
+
+        self.client = client
+        self.queue_url = queue_url
+        self.visibility_timeout = (
+            visibility_timeout if visibility_timeout is not None
+            else self._get_visibility_timeout())
+        self.visibility_margin = visibility_margin
+        self.stop_when_empty = stop_when_empty
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.receive_kwargs = {
+            'MaxNumberOfMessages': (
+                SQSExtendedConstants.MAX_BATCH_ENTRIES.value),
+            'WaitTimeSeconds': (
+                SQSExtendedConstants.DEFAULT_WAIT_TIME_SECONDS.value),
+            **receive_kwargs,
+            'VisibilityTimeout': self.visibility_timeout,
+        }
+        self.expired = 0
+        self.extended = 0
+        self.receive_errors = 0
+        self._buffer = queue.Queue(maxsize=prefetch_batches)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='sqs-extended-consumer', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'MessageConsumer':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __iter__(self) -> typing.Iterator[dict]:
+        for batch in self._iter_received():
+            i = 0
+            while i < len(batch.messages):
+                # the caller may process messages longer than expected
+                if not (self._is_fresh(batch)
+                        or self._extend_visibility(batch, i)):
+                    break
+
+                yield batch.messages[i]
+                i += 1
+
+    def _get_visibility_timeout(self) -> int:
+        """Get the visibility timeout of the queue.
+        :rtype: int
+        :return: visibility timeout in seconds
+        """
+        res = self.client.get_queue_attributes(
+            QueueUrl=self.queue_url, AttributeNames=['VisibilityTimeout'])
+        return int(res['Attributes']['VisibilityTimeout'])
+
+    def iter_batches(self) -> typing.Iterator[typing.List[dict]]:
+        """Iterate messages by each received batch.
+        :rtype: iterator
+        :return: iterator of lists of received messages,
+            like `Messages` of receive_message
+        """
+        for batch in self._iter_received():
+            if self._is_fresh(batch) or self._extend_visibility(batch, 0):
+                yield batch.messages
+
+    def close(self) -> None:
+        """Stop receiving messages, and wait for the background thread."""
+        self._closed.set()
+        while self._thread.is_alive():
+            # release the background thread waiting for the full buffer
+            self._drain()
+            self._thread.join(0.1)
+        self._drain()
+
+    def _iter_received(self) -> typing.Iterator[_ReceivedBatch]:
+        """Iterate buffered batches until the consumer is stopped.
+        :rtype: iterator
+        :return: iterator of received batches
+        """
+        while True:
+            batch = self._get_batch()
+            if batch is None:
+                return
+
+            yield batch
+
+    def _get_batch(self) -> typing.Optional[_ReceivedBatch]:
+        """Get the next buffered batch.
+        :rtype: _ReceivedBatch
+        :return: received batch (None if the consumer was stopped)
+        """
+        while True:
+            try:
+                return self._buffer.get(timeout=0.1)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return None
+                if not self._thread.is_alive():
+                    # the last batch may be put just before stopping
+                    try:
+                        return self._buffer.get_nowait()
+                    except queue.Empty:
+                        return None
+
+    def _is_fresh(self, batch: _ReceivedBatch) -> bool:
+        """Check whether messages of the batch are invisible to others
+        for visibility_margin at least.
+        :type batch: _ReceivedBatch
+        :param batch: received batch
+        :rtype: bool
+        :return: True if they can be given to the caller
+        """
+        return time.monotonic() + self.visibility_margin <= batch.deadline
+
+    def _extend_visibility(self, batch: _ReceivedBatch, start: int) -> bool:
+        """Extend the visibility timeout of messages of the batch from
+        start, which would expire soon, not to get them from S3 again.
+        Messages whose visibility timeout could not be extended before
+        it expired are dropped. In FIFO queue, the following messages of
+        the same MessageGroupId are dropped as well not to give them ahead
+        of the dropped one, and all the following messages are dropped
+        if the group is unknown because MessageGroupId isn't received.
+        :type batch: _ReceivedBatch
+        :param batch: received batch, whose messages and deadline are
+            updated in place
+        :type start: int
+        :param start: index of the first message not given yet
+        :rtype: bool
+        :return: True if any of them can be given
+        """
+        messages = batch.messages[start:]
+        succeeded = set()
+        # the deadline is counted from before the call conservatively
+        started = time.monotonic()
+        if started < batch.deadline:
+            try:
+                res = self.client.change_message_visibility_batch_extended(
+                    QueueUrl=self.queue_url, Entries=[{
+                        'Id': str(i), 'ReceiptHandle': m['ReceiptHandle'],
+                        'VisibilityTimeout': self.visibility_timeout,
+                    } for i, m in enumerate(messages)])
+                succeeded = {r['Id'] for r in res.get('Successful', [])}
+            except Exception as e:
+                logger.warning(f'failed to extend visibility timeout: {e}')
+
+        extended, dropped = self._split_extended(messages, succeeded)
+        if dropped:
+            self._drop_expired(dropped)
+        self.extended += len(extended)
+        batch.messages = batch.messages[:start] + extended
+        batch.deadline = started + self.visibility_timeout
+        return bool(extended)
+
+    def _split_extended(
+        self, messages: typing.List[dict], succeeded: typing.Set[str],
+    ) -> typing.Tuple[typing.List[dict], typing.List[dict]]:
+        """Split messages into ones to be given and ones to be dropped
+        by the result of extending their visibility timeout.
+        :type messages: list
+        :param messages: messages whose visibility timeout was extended
+        :type succeeded: set
+        :param succeeded: entry Ids (indices) of extended messages
+        :rtype: tuple
+        :return: tuple of messages to be given and dropped
+        """
+        fifo = self.queue_url.endswith(
+            SQSExtendedConstants.FIFO_QUEUE_SUFFIX.value)
+        failed_groups = set()
+        extended = []
+        dropped = []
+        for i, message in enumerate(messages):
+            group = message.get('Attributes', {}).get('MessageGroupId')
+            if str(i) in succeeded and not (fifo and (
+                    None in failed_groups or group in failed_groups)):
+                extended.append(message)
+                continue
+
+            dropped.append(message)
+            failed_groups.add(group)
+
+        return extended, dropped
+
+    def _drop_expired(self, messages: typing.List[dict]) -> None:
+        """Drop messages whose visibility timeout would expire soon.
+        :type messages: list
+        :param messages: dropped messages
+        """
+        logger.warning(
+            f'{len(messages)} messages were dropped '
+            'because their visibility timeout would expire')
+        self.expired += len(messages)
+        _release_messages(self.client, messages)
+
+    def _drain(self) -> None:
+        """Discard all buffered batches."""
+        while True:
+            try:
+                batch = self._buffer.get_nowait()
+            except queue.Empty:
+                return
+            _release_messages(self.client, batch.messages)
+
+    def _put(self, item: _ReceivedBatch) -> bool:
+        """Put the item into the buffer, waiting while it's full.
+        :rtype: bool
+        :return: False if the consumer was closed
+        """
+        while not self._closed.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _run(self) -> None:
+        """Receive messages until closed, and buffer them.
+        Errors are retried with exponential backoff.
+        """
+        retry_seconds = self.retry_seconds
+        while not self._closed.is_set():
+            # the deadline is counted from before the call conservatively
+            started = time.monotonic()
+            try:
+                res = self.client.receive_message_extended(
+                    QueueUrl=self.queue_url, **self.receive_kwargs)
+            except Exception as e:
+                self.receive_errors += 1
+                logger.warning(
+                    f'failed to receive messages, retrying in '
+                    f'{retry_seconds}s: {e}')
+                self._closed.wait(retry_seconds)
+                retry_seconds = min(retry_seconds * 2, self.max_retry_seconds)
+                continue
+
+            retry_seconds = self.retry_seconds
+
+            messages = res.get('Messages', [])
+            if not messages:
+                if self.stop_when_empty:
+                    return
+                continue
+
+            batch = _ReceivedBatch(
+                messages, started + self.visibility_timeout)
+            if not self._put(batch):
+                return
+
+
+class _AckBatch(object):
+    """Messages buffered to be deleted from a queue."""
+
+    def __init__(self, queue_url: str, deadline: float) -> None:
+        self.queue_url = queue_url
+        self.receipt_handles = []
+        self.futures = []
+        self.deadline = deadline
+
+
+class AckBatcher(object):
+    """Acknowledger that buffers messages processed successfully per queue
+    and deletes them together by `delete_message_batch_extended`.
+    Buffered messages are deleted when the number of them reaches
+    max_batch_size, or when max_wait_seconds has elapsed since the first
+    one was buffered. Messages given with a group, like MessageGroupId,
+    are buffered per group, so that each group can be flushed.
+    :type client: object
+    :param client: SQS client extended by SQSExtendedSession
+    :type max_batch_size: int
+    :param max_batch_size: max number of messages deleted by a call
+        (optional: by default, it's 10, which is the SQS limitation)
+    :type max_wait_seconds: float
+    :param max_wait_seconds: max time to buffer a message
+        (optional: by default, it's 1)
+    """
+
+    def __init__(
+        self, client: typing.Any,
+        max_batch_size: int = SQSExtendedConstants.MAX_BATCH_ENTRIES.value,
+        max_wait_seconds: float = (
+            SQSExtendedConstants.DEFAULT_ACK_WAIT_SECONDS.value),
+    ) -> None:
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._batches = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name='sqs-extended-ack', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'AckBatcher':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def ack(
+        self, queue_url: str, receipt_handle: str,
+        group: typing.Optional[str] = None,
+    ) -> concurrent.futures.Future:
+        """Buffer the message to be deleted.
+        :type queue_url: str
+        :param queue_url: URL of the queue
+        :type receipt_handle: str
+        :param receipt_handle: receipt handle of the received message,
+            which may be the extended one
+        :type group: str
+        :param group: group to buffer the message separately
+            (optional: by default, messages are buffered per queue)
+        :rtype: concurrent.futures.Future
+        :return: future of the result. if the message is reported as
+            failed, the future raises BatchEntryError
+        """
+        future = concurrent.futures.Future()
+        with self._condition:
+            if self._closed:
+                raise ValueError('acknowledger was already closed')
+
+            batch = self._batches.get((queue_url, group))
+            if batch is None:
+                batch = _AckBatch(
+                    queue_url, time.monotonic() + self.max_wait_seconds)
+                self._batches[(queue_url, group)] = batch
+                self._condition.notify()
+
+            batch.receipt_handles.append(receipt_handle)
+            batch.futures.append(future)
+            ready = (
+                self._batches.pop((queue_url, group))
+                if len(batch.receipt_handles) >= self.max_batch_size
+                else None)
+
+        if ready is not None:
+            self._delete(ready)
+
+        return future
+
+    def flush(
+        self, queue_url: typing.Optional[str] = None,
+        group: typing.Optional[str] = None,
+    ) -> None:
+        """Delete buffered messages.
+        :type queue_url: str
+        :param queue_url: URL of the queue whose messages are deleted
+            (optional: by default, messages of all queues are deleted)
+        :type group: str
+        :param group: group whose messages are deleted with queue_url
+        """
+        with self._condition:
+            if queue_url is None:
+                batches = list(self._batches.values())
+                self._batches.clear()
+            else:
+                batch = self._batches.pop((queue_url, group), None)
+                batches = [batch] if batch is not None else []
+
+        for batch in batches:
+            self._delete(batch)
+
+    def close(self) -> None:
+        """Delete all buffered messages, and stop the acknowledger."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+
+        self._thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        """Delete batches whose max_wait_seconds has elapsed."""
+        while True:
+            with self._condition:
+                while not self._closed:
+                    now = time.monotonic()
+                    deadlines = [b.deadline for b in self._batches.values()]
+                    if deadlines and min(deadlines) <= now:
+                        break
+                    self._condition.wait(
+                        min(deadlines) - now if deadlines else None)
+
+                if self._closed:
+                    return
+
+                now = time.monotonic()
+                ready = [
+                    self._batches.pop(key)
+                    for key, batch in list(self._batches.items())
+                    if batch.deadline <= now]
+
+            for batch in ready:
+                self._delete(batch)
+
+    def _delete(self, batch: _AckBatch) -> None:
+        """Delete the messages, and set the result of each message."""
+        try:
+            response = self.client.delete_message_batch_extended(
+                QueueUrl=batch.queue_url, Entries=[
+                    {'Id': str(i), 'ReceiptHandle': receipt_handle}
+                    for i, receipt_handle in enumerate(
+                        batch.receipt_handles)])
+        except Exception as e:
+            logger.warning(f'failed to delete messages: {e}')
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+
+        for result in response.get('Successful', []):
+            batch.futures[int(result['Id'])].set_result(result)
+        for failed in response.get('Failed', []):
+            logger.warning(
+                'failed to delete message: '
+                f"{failed.get('Code')}: {failed.get('Message')}")
+            batch.futures[int(failed['Id'])].set_exception(
+                BatchEntryError(failed))
+
+
+class WorkerPoolConsumer(object):
+    """Consumer which receives messages by MessageConsumer, processes them
+    by the handler on a pool of thread or process workers, and deletes
+    messages processed successfully together by AckBatcher.
+    Messages are received only while a worker is free. Messages whose
+    handler raised an error are not deleted, and received again after
+    their visibility timeout (or moved to the dead-letter queue).
+    :type client: object
+    :param client: SQS client extended by SQSExtendedSession
+    :type queue_url: str
+    :param queue_url: URL of the queue
+    :type handler: callable
+    :param handler: function called with each received message, like
+        `{'Body': ..., 'MessageAttributes': ..., ...}`. with process
+        workers, it must be picklable, e.g. a module-level function,
+        and lazy_payload cannot be used
+    :type max_workers: int
+    :param max_workers: number of workers (optional: by default, it's 10)
+    :type use_processes: bool
+    :param use_processes: run the handler on processes instead of threads
+        (optional: by default, it's False)
+    :type ack_batch_size: int
+    :param ack_batch_size: max_batch_size of AckBatcher
+        (optional: by default, it's 10)
+    :type ack_wait_seconds: float
+    :param ack_wait_seconds: max_wait_seconds of AckBatcher
+        (optional: by default, it's 1)
+    :type heartbeat: VisibilityHeartbeat
+    :param heartbeat: heartbeat to extend the visibility timeout of
+        messages while they are processed (optional: by default, not used)
+    :type consumer_kwargs: dict
+    :param consumer_kwargs: other arguments of MessageConsumer, like
+        prefetch_batches, stop_when_empty, and MessageAttributeNames
+    """
+
+    def __init__(
+        self, client: typing.Any, queue_url: str,
+        handler: typing.Callable[[dict], typing.Any],
+        max_workers: int = SQSExtendedConstants.DEFAULT_MAX_WORKERS.value,
+        use_processes: bool = False,
+        ack_batch_size: int = SQSExtendedConstants.MAX_BATCH_ENTRIES.value,
+        ack_wait_seconds: float = (
+            SQSExtendedConstants.DEFAULT_ACK_WAIT_SECONDS.value),
+        heartbeat: typing.Any = None, **consumer_kwargs,
+    ) -> None:
+        self.client = client
+        self.queue_url = queue_url
+        self.handler = handler
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.ack_batch_size = ack_batch_size
+        self.ack_wait_seconds = ack_wait_seconds
+        self.heartbeat = heartbeat
+        self.consumer_kwargs = consumer_kwargs
+        self.processed = 0
+        self.failed = 0
+        self._consumer = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def __enter__(self) -> 'WorkerPoolConsumer':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def run(self) -> None:
+        """Receive and process messages until stopped, or until no
+        messages are received with stop_when_empty. Processing messages
+        and buffered acknowledgements are completed before returning.
+        """
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            self._consumer = MessageConsumer(
+                self.client, self.queue_url, **self.consumer_kwargs)
+
+        executor = (
+            concurrent.futures.ProcessPoolExecutor(self.max_workers)
+            if self.use_processes
+            else concurrent.futures.ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix='sqs-extended-worker'))
+        max_pending = self._get_max_pending()
+        slots = threading.Semaphore(max_pending)
+        acks = AckBatcher(
+            self.client, self.ack_batch_size, self.ack_wait_seconds)
+        try:
+            for message in self._iter_when_free(slots):
+                self._submit(executor, acks, slots, message)
+        finally:
+            self._consumer.close()
+            # wait for all taken messages to be processed
+            for _ in range(max_pending):
+                slots.acquire()
+            executor.shutdown(wait=True)
+            acks.close()
+
+    def stop(self) -> None:
+        """Stop receiving messages. `run` returns after processing
+        messages already received."""
+        with self._lock:
+            self._stopped.set()
+            consumer = self._consumer
+
+        if consumer is not None:
+            consumer.close()
+
+    def _get_max_pending(self) -> int:
+        """Return the max number of messages taken but not processed.
+        :rtype: int
+        :return: number of messages
+        """
+        return self.max_workers
+
+    def _iter_when_free(
+            self, slots: threading.Semaphore) -> typing.Iterator[dict]:
+        """Iterate received messages, waiting for a free slot before
+        taking each message.
+        :type slots: threading.Semaphore
+        :param slots: semaphore of messages which can be taken
+        :rtype: iterator
+        :return: iterator of messages
+        """
+        iterator = iter(self._consumer)
+        while not self._stopped.is_set():
+            slots.acquire()
+            try:
+                message = next(iterator)
+            except StopIteration:
+                slots.release()
+                return
+            except BaseException:
+                slots.release()
+                raise
+
+            yield message
+
+    def _submit(
+        self, executor: concurrent.futures.Executor, acks: AckBatcher,
+        slots: threading.Semaphore, message: dict,
+    ) -> None:
+        """Process the message on the worker, and acknowledge it
+        if the handler succeeds."""
+        receipt_handle = message['ReceiptHandle']
+        if self.heartbeat is not None:
+            self.heartbeat.add(self.queue_url, receipt_handle)
+
+        def done(future: concurrent.futures.Future) -> None:
+            try:
+                error = future.exception()
+                if error is None:
+                    acks.ack(self.queue_url, receipt_handle)
+                else:
+                    logger.warning(f'failed to process message: {error}')
+                    _release_messages(self.client, [message])
+
+                with self._lock:
+                    if error is None:
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+            finally:
+                if self.heartbeat is not None:
+                    self.heartbeat.discard(self.queue_url, receipt_handle)
+                slots.release()
+
+        executor.submit(self.handler, message).add_done_callback(done)
+
+
+class FifoWorkerPoolConsumer(WorkerPoolConsumer):
+    """WorkerPoolConsumer for FIFO queues, which processes messages of
+    different MessageGroupId in parallel, and ones of the same group
+    one by one in the received order.
+    Messages of a group are deleted together when the group has no more
+    messages to be processed, or when 10 messages are processed, because
+    SQS doesn't give the next messages of the group until they are
+    deleted. If the handler raises an error, the following messages of
+    the group taken within the visibility timeout are skipped without
+    processing, and received again after their visibility timeout
+    following the failed one.
+    Messages stored in S3 are still got concurrently across groups by
+    `receive_message_extended` and MessageConsumer.
+    :type max_pending_messages: int
+    :param max_pending_messages: max number of messages taken but not
+        processed, including ones waiting for their group
+        (optional: by default, it's 10 times max_workers)
+    :param kwargs: arguments of WorkerPoolConsumer
+    """
+
+    def __init__(
+        self, *args, max_pending_messages: typing.Optional[int] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_pending_messages = max_pending_messages
+        self.skipped = 0
+        self._groups = {}
+        # deadline to skip messages keyed by failed group
+        self._failed_groups = {}
+
+        # receive MessageGroupId of each message
+        attribute_names = list(self.consumer_kwargs.get('AttributeNames', []))
+        if not {'All', 'MessageGroupId'} & set(attribute_names):
+            attribute_names.append('MessageGroupId')
+        self.consumer_kwargs['AttributeNames'] = attribute_names
+
+    def _get_max_pending(self) -> int:
+        """Return the max number of messages taken but not processed.
+        :rtype: int
+        :return: number of messages
+        """
+        if self.max_pending_messages is not None:
+            return self.max_pending_messages
+
+        return self.max_workers * SQSExtendedConstants.MAX_BATCH_ENTRIES.value
+
+    def _submit(
+        self, executor: concurrent.futures.Executor, acks: AckBatcher,
+        slots: threading.Semaphore, message: dict,
+    ) -> None:
+        """Process the message on the worker if no messages of the group
+        are being processed, otherwise wait for them."""
+        group = message.get('Attributes', {}).get('MessageGroupId')
+        with self._lock:
+            deadline = self._failed_groups.get(group)
+            if deadline is not None and time.monotonic() < deadline:
+                # the failed message will be received before this one
+                self.skipped += 1
+                _release_messages(self.client, [message])
+                slots.release()
+                return
+            self._failed_groups.pop(group, None)
+
+            pending = self._groups.get(group)
+            if pending is not None:
+                pending.append(message)
+                return
+
+            self._groups[group] = collections.deque()
+
+        self._process(executor, acks, slots, group, message)
+
+    def _process(
+        self, executor: concurrent.futures.Executor, acks: AckBatcher,
+        slots: threading.Semaphore, group: typing.Optional[str],
+        message: dict,
+    ) -> None:
+        """Process the message on the worker, and the next message of
+        the group after that."""
+        receipt_handle = message['ReceiptHandle']
+        if self.heartbeat is not None:
+            self.heartbeat.add(self.queue_url, receipt_handle)
+
+        def done(future: concurrent.futures.Future) -> None:
+            try:
+                error = future.exception()
+                if error is None:
+                    acks.ack(self.queue_url, receipt_handle, group=group)
+            except Exception as e:
+                # the message not deleted is received again like failed ones
+                error = e
+            if error is not None:
+                logger.warning(f'failed to process message: {error}')
+                _release_messages(self.client, [message])
+
+            with self._lock:
+                pending = self._groups[group]
+                skipped = []
+                if error is None:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+                    # keep the order of the group in the next delivery
+                    skipped = list(pending)
+                    pending.clear()
+                    self.skipped += len(skipped)
+                    self._failed_groups[group] = (
+                        time.monotonic() + self._consumer.visibility_timeout)
+
+                following = pending.popleft() if pending else None
+                if following is None:
+                    del self._groups[group]
+
+            try:
+                if self.heartbeat is not None:
+                    self.heartbeat.discard(self.queue_url, receipt_handle)
+                if skipped:
+                    logger.warning(
+                        f'{len(skipped)} messages of group {group} '
+                        'were skipped')
+                    _release_messages(self.client, skipped)
+                if following is None:
+                    acks.flush(self.queue_url, group)
+            finally:
+                for _ in range(len(skipped) + 1):
+                    slots.release()
+                if following is not None:
+                    self._process(executor, acks, slots, group, following)
+
+        executor.submit(self.handler, message).add_done_callback(done)
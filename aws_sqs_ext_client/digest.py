@@ -0,0 +1,139 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib
+import logging
+import tempfile
+import typing
+
+from .constants import SQSExtendedConstants
+
+logger = logging.getLogger(__name__)
+
+# transport types of attribute values in the digest
+_STRING = b'\x01'
+_BINARY = b'\x02'
+
+
+class DigestSpooledFile(tempfile.SpooledTemporaryFile):
+    """Spooled file which calculates MD5 of the written data while
+    messages stream in from S3, so that it's not read again to calculate
+    MD5OfBody. The digest covers all data written into the file.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._md5 = hashlib.md5()
+
+    def write(self, s: typing.Any) -> int:
+        self._md5.update(s)
+        return super().write(s)
+
+    def hexdigest(self) -> str:
+        """Return MD5 of the written data.
+        :rtype: str
+        :return: hex digest
+        """
+        return self._md5.hexdigest()
+
+
+def md5_of_body(
+    body: typing.Any,
+    chunk_size: int = SQSExtendedConstants.DIGEST_CHUNKSIZE.value,
+) -> str:
+    """Calculate MD5 of the message body, which is same as MD5OfBody
+    calculated by SQS for str.
+    str is encoded by chunks not to copy the whole body, bytes-like objects
+    are hashed without copying, and file-like objects are read by chunks
+    and rewound to the current position.
+    :type body: str, bytes-like object, or file-like object
+    :param body: message body
+    :type chunk_size: int
+    :param chunk_size: size of each chunk
+    :rtype: str
+    :return: hex digest
+    """
+    if isinstance(body, DigestSpooledFile):
+        return body.hexdigest()
+
+    md5 = hashlib.md5()
+    if isinstance(body, str):
+        for start in range(0, len(body), chunk_size):
+            md5.update(body[start:start + chunk_size].encode())
+    elif hasattr(body, 'read'):
+        position = body.tell()
+        for chunk in iter(lambda: body.read(chunk_size), b''):
+            md5.update(chunk)
+        body.seek(position)
+    else:
+        md5.update(body)
+
+    return md5.hexdigest()
+
+
+def md5_of_attributes(
+        attributes: typing.Optional[dict]) -> typing.Optional[str]:
+    """Calculate MD5 of message attributes in the same way as SQS,
+    which encodes lengths in big endian.
+    Names, data types, lengths, and small values of attributes are
+    joined into one buffer allocated at once, and large values are fed
+    into the digest as they are, so that nothing is concatenated
+    repeatedly or copied.
+    :type attributes: dict
+    :param attributes: message attributes
+    :rtype: str
+    :return: hex digest (None if no attributes are given)
+    """
+    if not attributes or not isinstance(attributes, dict):
+        return None
+
+    inline = SQSExtendedConstants.DIGEST_INLINE_VALUE_SIZE.value
+    md5 = hashlib.md5()
+    parts = []
+    for name, attribute in sorted(attributes.items()):
+        value = (
+            attribute['StringValue'].encode() if 'StringValue' in attribute
+            else attribute.get('BinaryValue'))
+        if value is None:
+            # this case never happens when called by receive method
+            # because send method refuses to send the invalid attrs
+            logger.warning(f'there are no supported attribute value in {name}')
+            continue
+
+        name = name.encode()
+        data_type = attribute['DataType'].encode()
+        parts += (
+            len(name).to_bytes(4, 'big'), name,
+            len(data_type).to_bytes(4, 'big'), data_type,
+            _BINARY if data_type.startswith(b'Binary') else _STRING,
+            len(value).to_bytes(4, 'big'))
+        if len(value) < inline:
+            parts.append(value)
+        else:
+            md5.update(b''.join(parts))
+            md5.update(value)
+            parts.clear()
+    md5.update(b''.join(parts))
+
+    return md5.hexdigest()
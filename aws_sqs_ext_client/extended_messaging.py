@@ -21,15 +21,31 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
-import copy
+import base64
+import concurrent.futures
+import contextlib
+import functools
 import hashlib
+import io
+import itertools
 import logging
+import mmap
+import os
 import re
+import tempfile
+import threading
 import typing
 import uuid
 
+import boto3.s3.transfer
+import botocore.exceptions
+
+from .compression import PayloadCodec, get_codec
 from .constants import SQSExtendedConstants
+from .digest import DigestSpooledFile, md5_of_attributes, md5_of_body
+from .models.lazy_payload import LazyPayload
 from .models.payload_s3_pointer import PayloadS3Pointer
+from .streams import MemoryViewReader
 
 logger = logging.getLogger(__name__)
 
@@ -47,16 +63,1296 @@ class SQSExtendedMessage(object):
     :type message_size_threshold: int
     :param message_size_threshold: threshold to put actual message in S3
         (optional: default value is the SQS limitation 262,144)
+    :type max_workers: int
+    :param max_workers: number of threads to put/get messages on S3
+        concurrently in batch sending and receiving (optional: by default,
+        it's 10, which is the max number of messages in a SQS batch)
+    :type compression: str or PayloadCodec
+    :param compression: codec to compress messages stored in S3, like
+        'gzip', 'zstd', and 'lz4'. the codec name is recorded in the object
+        metadata, and received messages are decompressed by that codec
+        regardless of this option (optional: by default, it's None)
+    :type compress_to_fit: bool
+    :param compress_to_fit: if True, try to compress messages larger than
+        threshold with base64 encoding, and keep them in the queue instead
+        of S3 if they fit. the codec is `compression` or zlib if not given
+        (optional: by default, it's False)
+    :type multipart_threshold: int
+    :param multipart_threshold: size of message to be uploaded into S3
+        by multipart upload (optional: by default, it's 8 MB)
+    :type multipart_chunksize: int
+    :param multipart_chunksize: size of each part of multipart upload
+        (optional: by default, it's 8 MB)
+    :type multipart_max_concurrency: int
+    :param multipart_max_concurrency: number of threads to upload parts
+        of one message concurrently (optional: by default, it's 10)
+    :type download_threshold: int
+    :param download_threshold: size of message to be got from S3
+        by concurrent byte-range requests (optional: by default, it's 8 MB)
+    :type download_part_size: int
+    :param download_part_size: size of each byte-range request
+        (optional: by default, it's 8 MB)
+    :type download_max_concurrency: int
+    :param download_max_concurrency: number of threads to get parts
+        of messages concurrently (optional: by default, it's 10)
+    :type lazy_payload: bool
+    :param lazy_payload: if True, received messages stored in S3 have
+        LazyPayload as their bodies, which gets actual message at the first
+        access. MD5OfBody is set when actual message is got, and
+        `models.lazy_payload.prefetch` gets them concurrently
+        (optional: by default, it's False)
+    :type raw_body: bool
+    :param raw_body: if True, received message bodies are bytes-like objects
+        instead of str, which is needed for binary messages. without it,
+        binary messages raise UnicodeDecodeError on receiving
+        (optional: by default, it's False)
+    :type batch_overflow_strategy: str
+    :param batch_overflow_strategy: how to send batch entries whose total
+        size is larger than the SQS limitation 262,144 although each one is
+        under the threshold. 'offload' puts the fewest and largest messages
+        into S3, 'split' sends entries by multiple SQS calls, and 'auto'
+        splits them if it needs as many calls as or fewer calls than
+        the messages to be put into S3 (optional: by default, it's 'auto')
+    :type batch_max_concurrency: int
+    :param batch_max_concurrency: number of threads to send batches
+        concurrently when more than 10 entries are given to the batch
+        sending method. batches of FIFO queue are sent one by one
+        (optional: by default, it's 10)
+    :type content_addressed: bool
+    :param content_addressed: if True, messages are stored with the key of
+        SHA-256 of the stored object, and not uploaded if it already exists,
+        so that the same message sent many times is stored once.
+        each message puts a reference marker `<key>.refs/<id>`, and
+        the stored object is deleted with the last marker. markers are put
+        before checking the object to be seen by concurrent deletion, but
+        a message sent between listing markers and deleting the object
+        by the last deletion points to the deleted object. a lifecycle rule
+        is recommended for such objects (optional: by default, it's False)
+    :type pack_batch: bool
+    :param pack_batch: if True, messages of a batch stored in S3 are packed
+        into one object, and each pointer has the offset and the length
+        of the message got by a byte-range request. deleting a message puts
+        an acknowledgement marker `<key>.acks/<offsets>`, and the object is
+        deleted when all messages are acknowledged. packed messages cannot
+        be received by other clients, like java extended client
+        (optional: by default, it's False)
+    :type payload_cache: PayloadCache
+    :param payload_cache: cache of objects got from S3, which is used for
+        messages received again after visibility timeout, and invalidated
+        when messages are deleted (optional: by default, it's None)
+    :type spool_threshold: int
+    :param spool_threshold: if given, received messages larger than this
+        are streamed from S3 into spooled files, which are kept in memory
+        until they exceed this size, and given as file-like object bodies.
+        streams sent with `compression` are compressed into spooled files
+        as well (optional: by default, it's None)
+    :type spool_directory: str
+    :param spool_directory: directory of spooled files
+        (optional: by default, it's the system temporary directory)
+    :type byte_budget: ByteBudget
+    :param byte_budget: budget of bytes of received messages stored in S3,
+        which can be shared by clients. receiving waits until the messages
+        fit before getting them from S3. messages are held by MessageId,
+        and released by the extended delete methods, by changing their
+        visibility timeout to 0, or by `release_message_extended`.
+        with lazy_payload, messages are not held
+        (optional: by default, it's None)
+    :type calculate_md5: bool
+    :param calculate_md5: if False, MD5OfBody and MD5OfMessageAttributes
+        of messages reverted from S3 or encoding are removed instead of
+        being calculated again, which is for callers not verifying them.
+        messages kept in the queue as they are have ones given by SQS
+        (optional: by default, it's True)
+    :type s3_checksum_algorithm: str
+    :param s3_checksum_algorithm: algorithm of the checksum calculated by
+        S3 for stored messages, like 'CRC32C' and 'SHA256'. the checksum
+        returned by S3 is kept in the pointer, and received messages are
+        got with it by one request verified by S3 and botocore, instead of
+        calculating MD5OfBody. pointers with checksums may not be received
+        by other clients (optional: by default, it's None)
     """
 
     def __init__(
             self, session, s3_bucket_name, always_through_s3=False,
             message_size_threshold=(
-                SQSExtendedConstants.DEFAULT_MESSAGE_SIZE_THRESHOLD.value)):
-        self.s3 = session.resource('s3')
+                SQSExtendedConstants.DEFAULT_MESSAGE_SIZE_THRESHOLD.value),
+            max_workers=SQSExtendedConstants.DEFAULT_MAX_WORKERS.value,
+            compression=None, compress_to_fit=False,
+            multipart_threshold=(
+                SQSExtendedConstants.DEFAULT_MULTIPART_THRESHOLD.value),
+            multipart_chunksize=(
+                SQSExtendedConstants.DEFAULT_MULTIPART_CHUNKSIZE.value),
+            multipart_max_concurrency=(
+                SQSExtendedConstants.DEFAULT_MAX_WORKERS.value),
+            download_threshold=(
+                SQSExtendedConstants.DEFAULT_MULTIPART_THRESHOLD.value),
+            download_part_size=(
+                SQSExtendedConstants.DEFAULT_MULTIPART_CHUNKSIZE.value),
+            download_max_concurrency=(
+                SQSExtendedConstants.DEFAULT_MAX_WORKERS.value),
+            lazy_payload=False, raw_body=False,
+            batch_overflow_strategy=(
+                SQSExtendedConstants.DEFAULT_BATCH_OVERFLOW_STRATEGY.value),
+            batch_max_concurrency=(
+                SQSExtendedConstants.DEFAULT_MAX_WORKERS.value),
+            content_addressed=False, pack_batch=False, payload_cache=None,
+            spool_threshold=None, spool_directory=None, byte_budget=None,
+            calculate_md5=True, s3_checksum_algorithm=None):
+        if batch_overflow_strategy not in ('auto', 'offload', 'split'):
+            raise ValueError(
+                'unsupported batch_overflow_strategy: '
+                f'{batch_overflow_strategy}')
+        if content_addressed and pack_batch:
+            raise ValueError(
+                'content_addressed and pack_batch cannot be used together')
+        if s3_checksum_algorithm not in (
+                None, *SQSExtendedConstants.S3_CHECKSUM_ALGORITHMS.value):
+            raise ValueError(
+                f'unsupported s3_checksum_algorithm: {s3_checksum_algorithm}')
+
+        self.s3 = self._create_s3_resource(session)
         self.s3_bucket_name = s3_bucket_name
         self.message_size_threshold = message_size_threshold
         self.always_through_s3 = always_through_s3
+        self.max_workers = max_workers
+        self.compression = get_codec(compression)
+        self.compress_to_fit = compress_to_fit
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.multipart_max_concurrency = multipart_max_concurrency
+        self.download_threshold = download_threshold
+        self.download_part_size = download_part_size
+        self.download_max_concurrency = download_max_concurrency
+        self.lazy_payload = lazy_payload
+        self.raw_body = raw_body
+        self.batch_overflow_strategy = batch_overflow_strategy
+        self.batch_max_concurrency = batch_max_concurrency
+        self.content_addressed = content_addressed
+        self.pack_batch = pack_batch
+        self.payload_cache = payload_cache
+        self.spool_threshold = spool_threshold
+        self.spool_directory = spool_directory
+        self.byte_budget = byte_budget
+        self.calculate_md5 = calculate_md5
+        self.s3_checksum_algorithm = s3_checksum_algorithm
+        self._executors = {}
+        self._executor_lock = threading.Lock()
+
+    def _create_s3_resource(self, session) -> typing.Any:
+        """Create S3 resource to store actual messages.
+        :type session: object
+        :param session: boto3 session
+        :rtype: object
+        :return: S3 resource
+        """
+        return session.resource('s3')
+
+    def _get_executor(
+        self, name: str = 'sqs-extended',
+        max_workers: typing.Optional[int] = None,
+    ) -> concurrent.futures.Executor:
+        """Return the thread pool shared by batch methods.
+        The pool is created at the first call so that instances which only
+        handle single messages don't start any threads.
+        Tasks which wait for other tasks, like a message waiting for its
+        parts, must use another pool not to exhaust the same one.
+        :type name: str
+        :param name: name of the pool used as the thread name prefix
+        :type max_workers: int
+        :param max_workers: size of the pool (optional: max_workers)
+        :rtype: concurrent.futures.Executor
+        :return: thread pool bounded by max_workers
+        """
+        with self._executor_lock:
+            if name not in self._executors:
+                self._executors[name] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_workers or self.max_workers,
+                    thread_name_prefix=name)
+            return self._executors[name]
+
+    def _submit_all(
+        self, func: typing.Callable, args: typing.Dict[typing.Any, tuple],
+    ) -> typing.Dict[typing.Any, concurrent.futures.Future]:
+        """Call the given function with each argument on the thread pool.
+        If there is only one call, it's done in the current thread
+        to avoid the overhead of the thread pool.
+        :type func: callable
+        :param func: function to be called
+        :type args: dict
+        :param args: argument (or tuple of arguments) of each call
+            keyed by any identifier, like entry index
+        :rtype: dict
+        :return: futures of each call keyed by the same identifier
+        """
+        def call(arg):
+            return func(*arg) if isinstance(arg, tuple) else func(arg)
+
+        if len(args) <= 1 or self.max_workers <= 1:
+            futures = {}
+            for k, arg in args.items():
+                futures[k] = concurrent.futures.Future()
+                try:
+                    futures[k].set_result(call(arg))
+                except Exception as e:
+                    futures[k].set_exception(e)
+            return futures
+
+        executor = self._get_executor()
+        return {k: executor.submit(call, arg) for k, arg in args.items()}
+
+    def _get_stream_size(self, body: typing.Any) -> int:
+        """Return the size of the file-like object or the file path
+        without reading it.
+        :type body: file-like object or os.PathLike
+        :param body: message body given as a stream
+        :rtype: int
+        :return: size in bytes from the current position to the end
+        """
+        if isinstance(body, os.PathLike):
+            return os.path.getsize(body)
+
+        if not (hasattr(body, 'seekable') and body.seekable()):
+            raise ValueError('file-like message body must be seekable')
+
+        position = body.tell()
+        size = body.seek(0, io.SEEK_END) - position
+        body.seek(position)
+
+        return size
+
+    def _prepare_attributes_and_message(
+        self, attributes: dict, body: typing.Any,
+    ) -> typing.Tuple[dict, typing.Any, typing.Any]:
+        """Check whether the message should be stored in S3.
+        If so, the reserved attribute is added into the given attributes.
+        With compress_to_fit, the message is compressed at first,
+        and kept in the queue if the compressed one is under the threshold.
+        File-like objects and file paths are always stored in S3
+        without being loaded into memory. Bytes-like objects are stored
+        without copying them, or kept in the queue with base64 encoding.
+        :type attributes: dict
+        :param attributes: message attributes
+        :type body: str, bytes-like object, file-like object, or os.PathLike
+        :param body: message body
+        :rtype: tuple
+        :return: tuple of attributes, message body, and encoded body
+            (or stream) to be put into S3 (None if the message can be sent
+            as it is)
+        """
+        if self.is_stream(body):
+            attributes = self._set_reserved_attributes(
+                attributes, self._get_stream_size(body))
+
+            return attributes, body, body
+
+        is_binary = isinstance(body, (bytes, bytearray, memoryview, mmap.mmap))
+        encoded = self._encode_body(body)
+        if not self.always_through_s3:
+            if not (is_binary or
+                    self._is_message_larger(attributes, encoded)):
+                return attributes, body, None
+
+            # try to keep the base64 encoded or compressed message
+            # in the queue
+            codecs = [None] if is_binary else []
+            if self.compress_to_fit:
+                codecs.append(self.compression or get_codec(
+                    SQSExtendedConstants.INLINE_COMPRESSION.value))
+            for codec in codecs:
+                encoded_attributes, encoded_body = self._encode_message(
+                    attributes, encoded, codec)
+                if not self._is_message_larger(
+                        encoded_attributes, encoded_body):
+                    return encoded_attributes, encoded_body.decode(), None
+
+        # build the new attr
+        attributes = self._set_reserved_attributes(attributes, len(encoded))
+
+        return attributes, body, encoded
+
+    def _set_reserved_attributes(self, attributes: dict, size: int) -> dict:
+        """Add the reserved attributes of the message stored in S3
+        into the given attributes.
+        With content_addressed, the reference ID is added as well.
+        :type attributes: dict
+        :param attributes: message attributes
+        :type size: int
+        :param size: size of the message
+        :rtype: dict
+        :return: the given attributes
+        """
+        attributes[SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value] = {
+            'DataType': 'Number', 'StringValue': str(size)}
+        if self.content_addressed:
+            attributes[
+                SQSExtendedConstants.RESERVED_REFERENCE_ATTRIBUTE_NAME.value
+            ] = {'DataType': 'String', 'StringValue': str(uuid.uuid4())}
+        self._check_attribute_count(attributes)
+
+        return attributes
+
+    @staticmethod
+    def _check_attribute_count(attributes: dict) -> None:
+        """Check that the attributes including the reserved ones don't
+        exceed the max number of message attributes of SQS.
+        :type attributes: dict
+        :param attributes: message attributes with the reserved ones
+        """
+        limit = SQSExtendedConstants.MAX_MESSAGE_ATTRIBUTES.value
+        if len(attributes) > limit:
+            raise ValueError(
+                f'{len(attributes)} message attributes including reserved '
+                f'ones exceed {limit}, the max number of SQS')
+
+    def _get_reference(
+            self, attributes: typing.Optional[dict]) -> typing.Optional[str]:
+        """Return the reference ID of the message stored in S3.
+        :type attributes: dict
+        :param attributes: message attributes
+        :rtype: str
+        :return: reference ID (None if not content addressed)
+        """
+        reference = (attributes or {}).get(
+            SQSExtendedConstants.RESERVED_REFERENCE_ATTRIBUTE_NAME.value)
+
+        return reference.get('StringValue') if reference else None
+
+    def _reference_key(self, key: str, reference: str) -> str:
+        """Return the key of the reference marker of the stored object.
+        :type key: str
+        :param key: key of the stored object
+        :type reference: str
+        :param reference: reference ID (empty for the prefix of all)
+        :rtype: str
+        :return: key of the marker
+        """
+        return (
+            f'{key}{SQSExtendedConstants.REFERENCE_MARKER_INFIX.value}'
+            f'{reference}')
+
+    def _get_referenced_key(self, key: str) -> typing.Optional[str]:
+        """Return the key of the stored object referred by the marker.
+        :type key: str
+        :param key: key in the receipt handle
+        :rtype: str
+        :return: key of the stored object (None if it's not a marker)
+        """
+        infix = SQSExtendedConstants.REFERENCE_MARKER_INFIX.value
+        if infix not in key:
+            return None
+
+        return key.rsplit(infix, 1)[0]
+
+    def _hash_payload(self, encoded: typing.Any) -> str:
+        """Calculate SHA-256 of the object to be stored as its key.
+        Streams are read by chunk, and rewound to the current position.
+        :type encoded: bytes-like object, file-like object, or os.PathLike
+        :param encoded: message body to be stored
+        :rtype: str
+        :return: hex digest
+        """
+        digest = hashlib.sha256()
+        if isinstance(encoded, os.PathLike):
+            with open(encoded, 'rb') as f:
+                for chunk in iter(
+                        functools.partial(f.read, self.multipart_chunksize),
+                        b''):
+                    digest.update(chunk)
+        elif hasattr(encoded, 'read'):
+            position = encoded.tell()
+            for chunk in iter(
+                    functools.partial(encoded.read, self.multipart_chunksize),
+                    b''):
+                digest.update(chunk)
+            encoded.seek(position)
+        else:
+            digest.update(encoded)
+
+        return digest.hexdigest()
+
+    def _put_reference(
+            self, params: dict, reference: str) -> typing.Optional[dict]:
+        """Put the reference marker of the message, and then check whether
+        the object to be stored already exists.
+        With s3_checksum_algorithm, the checksum of the existing object
+        is got as well.
+        :type params: dict
+        :param params: parameters for s3.put_object including Bucket and Key
+        :type reference: str
+        :param reference: reference ID of the message
+        :rtype: dict
+        :return: response of head_object (None if the object doesn't exist)
+        """
+        marker = {k: v for k, v in params.items() if k != 'Metadata'}
+        marker['Key'] = self._reference_key(params['Key'], reference)
+        self.s3.meta.client.put_object(Body=b'', **marker)
+        try:
+            response = self.s3.meta.client.head_object(
+                **self._head_object_params(params))
+        except botocore.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in (
+                    '404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+        logger.info(
+            f"{params['Key']} already exists in {params['Bucket']}")
+        return response
+
+    def _head_object_params(self, params: dict) -> dict:
+        """Build parameters of head_object for the stored object,
+        which get its checksum with s3_checksum_algorithm.
+        :type params: dict
+        :param params: parameters for s3.put_object including Bucket and Key
+        :rtype: dict
+        :return: parameters for s3.head_object
+        """
+        head = {'Bucket': params['Bucket'], 'Key': params['Key']}
+        if self.s3_checksum_algorithm is not None:
+            head['ChecksumMode'] = 'ENABLED'
+
+        return head
+
+    @staticmethod
+    def is_stream(body: typing.Any) -> bool:
+        """Check whether the message body is given as a stream, which is
+        stored in S3 without being loaded into memory.
+        mmap is not a stream but a bytes-like object though it has read.
+        :type body: any
+        :param body: message body
+        :rtype: bool
+        :return: True if it's a file-like object or a file path
+        """
+        return isinstance(body, os.PathLike) or (
+            hasattr(body, 'read') and not isinstance(body, mmap.mmap))
+
+    @staticmethod
+    def _encode_body(body: typing.Any) -> typing.Any:
+        """Return the message body as a bytes-like object without copying
+        bytes-like ones.
+        :type body: str or bytes-like object
+        :param body: message body
+        :rtype: bytes-like object
+        :return: encoded message body
+        """
+        if isinstance(body, (memoryview, mmap.mmap)):
+            return memoryview(body).cast('B')
+        if isinstance(body, (bytes, bytearray)):
+            return body
+
+        return body.encode()
+
+    def _get_pointer_size(self) -> int:
+        """Return the size of the pointer sent instead of the message.
+        :rtype: int
+        :return: size in bytes
+        """
+        if not self.pack_batch:
+            # the longest checksum is SHA256 of the multipart upload
+            # with the number of parts, like '<base64>-10000'
+            checksum = (
+                'x' * 50 if self.s3_checksum_algorithm is not None else None)
+            return len(PayloadS3Pointer(
+                self.s3_bucket_name, str(uuid.uuid4()),
+                checksum_algorithm=self.s3_checksum_algorithm,
+                checksum=checksum).toJSON().encode())
+
+        # the largest offset and length of a packed object in S3
+        return len(PayloadS3Pointer(
+            self.s3_bucket_name, self._packed_key(10**4),
+            5 * 2**40, 5 * 2**40).toJSON().encode())
+
+    def _packed_key(self, count: int) -> str:
+        """Return a new key of the object packing messages,
+        which has the number of them.
+        :type count: int
+        :param count: number of packed messages
+        :rtype: str
+        :return: object key
+        """
+        return (
+            f'{uuid.uuid4()}{SQSExtendedConstants.PACKED_KEY_INFIX.value}'
+            f'{count}')
+
+    def _ack_key(self, key: str, offsets: typing.Iterable[int]) -> str:
+        """Return the key of the acknowledgement marker of packed messages.
+        :type key: str
+        :param key: key of the object packing messages
+        :type offsets: iterable
+        :param offsets: offsets of acknowledged messages
+        :rtype: str
+        :return: key of the marker
+        """
+        return (
+            f'{key}{SQSExtendedConstants.ACK_MARKER_INFIX.value}'
+            f'{"-".join(str(offset) for offset in sorted(offsets))}')
+
+    def _parse_ack_key(
+        self, key: str,
+    ) -> typing.Optional[typing.Tuple[str, typing.List[int]]]:
+        """Parse the key of the acknowledgement marker.
+        :type key: str
+        :param key: key in the receipt handle or of the marker
+        :rtype: tuple
+        :return: tuple of the key of the object packing messages and
+            acknowledged offsets (None if it's not a marker)
+        """
+        infix = SQSExtendedConstants.ACK_MARKER_INFIX.value
+        if infix not in key:
+            return None
+
+        key, offsets = key.rsplit(infix, 1)
+        return key, [int(offset) for offset in offsets.split('-') if offset]
+
+    def _pack_messages(
+        self, encodeds: typing.List[typing.Any],
+    ) -> typing.Tuple[dict, bytearray, typing.List[typing.Tuple[int, int]]]:
+        """Pack messages into one object. Each message is compressed
+        separately so that it can be decompressed from its range.
+        :type encodeds: list
+        :param encodeds: encoded bodies to be stored
+        :rtype: tuple
+        :return: tuple of parameters for s3.put_object including Bucket and
+            Key, packed data, and offset and length of each message
+        """
+        params = {
+            'ACL': 'private', 'Bucket': self.s3_bucket_name,
+            'Key': self._packed_key(len(encodeds))}
+        if self.s3_checksum_algorithm is not None:
+            # this verifies only the upload because S3 returns no checksum
+            # of ranges, so that packed pointers don't have checksums
+            params['ChecksumAlgorithm'] = self.s3_checksum_algorithm
+        if self.compression is not None:
+            encodeds = [self.compression.compress(e) for e in encodeds]
+            params['Metadata'] = {
+                SQSExtendedConstants.COMPRESSION_METADATA_NAME.value: (
+                    self.compression.name)}
+
+        data = bytearray(sum(len(encoded) for encoded in encodeds))
+        ranges = []
+        offset = 0
+        for encoded in encodeds:
+            data[offset:offset + len(encoded)] = encoded
+            ranges.append((offset, len(encoded)))
+            offset += len(encoded)
+
+        return params, data, ranges
+
+    def _split_packed_uploads(
+            self, uploads: typing.Dict[int, typing.Any]) -> typing.List[int]:
+        """Return entry indices whose messages are packed into one object.
+        Streams are not packed not to load them into memory.
+        :type uploads: dict
+        :param uploads: encoded bodies to be stored keyed by entry index
+        :rtype: list
+        :return: entry indices (empty if packing is not needed)
+        """
+        if not self.pack_batch:
+            return []
+
+        indices = [
+            i for i, encoded in uploads.items()
+            if not self.is_stream(encoded)]
+
+        return indices if len(indices) > 1 else []
+
+    def _put_packed_messages_to_s3(
+        self, entries: typing.List[dict], uploads: typing.Dict[int, bytes],
+    ) -> typing.Dict[int, dict]:
+        """Put messages of batch entries into S3 packing them into one
+        object if pack_batch is enabled.
+        MessageBody of each entry is replaced with the pointer on success.
+        :type entries: list
+        :param entries: entries of send_message_batch
+        :type uploads: dict
+        :param uploads: encoded bodies to be stored keyed by entry index
+        :rtype: dict
+        :return: failed results, like `Failed` of send_message_batch,
+            keyed by entry index
+        """
+        packed = self._split_packed_uploads(uploads)
+        failed = self._put_messages_to_s3(entries, {
+            i: encoded for i, encoded in uploads.items() if i not in packed})
+        if not packed:
+            return failed
+
+        params, data, ranges = self._pack_messages(
+            [uploads[i] for i in packed])
+        try:
+            if len(data) >= self.multipart_threshold:
+                self._upload_message_to_s3(MemoryViewReader(data), params)
+            else:
+                self.s3.meta.client.put_object(
+                    Body=data, ContentLength=len(data), **params)
+                logger.info(
+                    f"{params['Key']} was written into {params['Bucket']}")
+        except Exception as e:
+            logger.warning(f'failed to put packed messages: {e}')
+            failed.update({
+                i: self._failed_entry(entries[i], i, e) for i in packed})
+            return failed
+
+        for i, (offset, length) in zip(packed, ranges):
+            entries[i]['MessageBody'] = PayloadS3Pointer(
+                params['Bucket'], params['Key'], offset, length).toJSON()
+
+        return failed
+
+    def _pack_entries(
+        self, sizes: typing.Dict[int, int], keep_order: bool,
+    ) -> typing.List[typing.List[int]]:
+        """Pack batch entries into as few batches as possible
+        under the SQS limitation of the total size.
+        Entries are packed by first-fit decreasing, or in the given order
+        not to change the order of messages in FIFO queue.
+        :type sizes: dict
+        :param sizes: size of each entry keyed by entry index
+        :type keep_order: bool
+        :param keep_order: if True, each batch has consecutive entries
+        :rtype: list
+        :return: entry indices of each batch in ascending order
+        """
+        limit = SQSExtendedConstants.MAX_BATCH_SIZE.value
+        if sum(sizes.values()) <= limit:
+            return [list(sizes)]
+
+        order = (
+            list(sizes) if keep_order
+            else sorted(sizes, key=sizes.get, reverse=True))
+        batches = []
+        for i in order:
+            for batch in (batches[-1:] if keep_order else batches):
+                if batch[0] + sizes[i] <= limit:
+                    batch[0] += sizes[i]
+                    batch[1].append(i)
+                    break
+            else:
+                batches.append([sizes[i], [i]])
+
+        return [sorted(indices) for _, indices in batches]
+
+    def _plan_batch(
+        self, sizes: typing.Dict[int, int], offloads: typing.Dict[int, int],
+        keep_order: bool,
+    ) -> typing.Tuple[typing.List[int], typing.List[typing.List[int]]]:
+        """Plan how to send batch entries under the SQS limitation
+        of the total size, by putting messages into S3 and/or splitting
+        entries into multiple batches along batch_overflow_strategy.
+        :type sizes: dict
+        :param sizes: size of each entry keyed by entry index
+        :type offloads: dict
+        :param offloads: size of each entry kept in the queue if its message
+            is put into S3 instead, keyed by entry index
+        :type keep_order: bool
+        :param keep_order: if True, each batch has consecutive entries
+        :rtype: tuple
+        :return: tuple of entry indices to be put into S3 and entry indices
+            of each batch
+        """
+        limit = SQSExtendedConstants.MAX_BATCH_SIZE.value
+        batches = self._pack_entries(sizes, keep_order)
+        if len(batches) == 1 or self.batch_overflow_strategy == 'split':
+            return [], batches
+
+        # the fewest and largest messages to fit in a batch
+        total = sum(sizes.values())
+        offloaded = []
+        for i in sorted(
+                offloads, key=lambda i: sizes[i] - offloads[i],
+                reverse=True):
+            if total <= limit:
+                break
+            total -= sizes[i] - offloads[i]
+            offloaded.append(i)
+
+        if (self.batch_overflow_strategy == 'auto' and
+                len(batches) - 1 <= len(offloaded)):
+            return [], batches
+
+        # split the rest if it doesn't fit even after offloading all
+        sizes = {**sizes, **{i: offloads[i] for i in offloaded}}
+
+        return offloaded, self._pack_entries(sizes, keep_order)
+
+    def _call_batches(
+        self, func: typing.Callable, args: tuple, kwargs: dict,
+        batches: typing.List[typing.List[int]],
+        failed: typing.Dict[int, dict], keep_order: bool = False,
+    ) -> dict:
+        """Call the original batch method for each planned batch
+        concurrently, and merge the responses into one.
+        If a call raises an error, its entries are reported as failed ones
+        not to lose the results of the other calls.
+        :type func: callable
+        :param func: original batch method
+        :type args: tuple
+        :param args: positional arguments of the original method
+        :type kwargs: dict
+        :param kwargs: keyword arguments of the original method
+        :type batches: list
+        :param batches: entry indices of each batch
+        :type failed: dict
+        :param failed: failed results keyed by entry index
+        :type keep_order: bool
+        :param keep_order: if True, batches are sent one by one, and entries
+            following a failed one of the same MessageGroupId are not sent
+        :rtype: dict
+        :return: merged response in the order of the given entries
+        """
+        if len(batches) == 1 and not (keep_order and failed):
+            return self._call_batch_wo_failed(func, args, kwargs, failed)
+
+        entries = kwargs['Entries']
+
+        def call(batch):
+            return func(
+                *args, **{**kwargs, 'Entries': [entries[i] for i in batch]})
+
+        if keep_order:
+            failed_groups = set()
+            sent = []
+            results = []
+            for batch in batches:
+                batch = self._skip_failed_groups(
+                    entries, batch, failed, failed_groups)
+                if not batch:
+                    continue
+                try:
+                    res = call(batch)
+                except Exception as e:
+                    res = e
+                self._add_failed_groups(entries, batch, res, failed_groups)
+                sent.append(batch)
+                results.append(res)
+
+            return self._merge_batch_responses(
+                entries, sent, results, failed)
+
+        batches = [
+            [i for i in batch if i not in failed] for batch in batches]
+        batches = [batch for batch in batches if batch]
+        if self.batch_max_concurrency <= 1:
+            futures = []
+            for batch in batches:
+                futures.append(concurrent.futures.Future())
+                try:
+                    futures[-1].set_result(call(batch))
+                except Exception as e:
+                    futures[-1].set_exception(e)
+        else:
+            # another pool not to wait for the uploading threads
+            executor = self._get_executor(
+                'sqs-extended-batch', self.batch_max_concurrency)
+            futures = [executor.submit(call, batch) for batch in batches]
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+
+        return self._merge_batch_responses(entries, batches, results, failed)
+
+    def _skip_failed_groups(
+        self, entries: typing.List[dict], batch: typing.List[int],
+        failed: typing.Dict[int, dict], failed_groups: typing.Set[str],
+    ) -> typing.List[int]:
+        """Remove entries whose previous entry of the same MessageGroupId
+        failed from the batch, and report them as failed ones,
+        not to enqueue them ahead of the failed one in FIFO queue.
+        :type entries: list
+        :param entries: all entries of the batch method
+        :type batch: list
+        :param batch: entry indices of the batch
+        :type failed: dict
+        :param failed: failed results keyed by entry index,
+            which the removed entries are added to
+        :type failed_groups: set
+        :param failed_groups: MessageGroupIds which had failed entries,
+            which the groups of failed entries in the batch are added to
+        :rtype: list
+        :return: entry indices to be sent
+        """
+        sent = []
+        for i in batch:
+            group = entries[i].get('MessageGroupId')
+            if i in failed:
+                failed_groups.add(group)
+            elif group is not None and group in failed_groups:
+                failed[i] = {
+                    'Id': entries[i].get('Id'),
+                    'SenderFault': False,
+                    'Code': 'PreviousEntryFailed',
+                    'Message': (
+                        f'previous entry of group {group} failed, '
+                        f'found in {i}'),
+                }
+            else:
+                sent.append(i)
+
+        return sent
+
+    def _add_failed_groups(
+        self, entries: typing.List[dict], batch: typing.List[int],
+        result: typing.Any, failed_groups: typing.Set[str],
+    ) -> None:
+        """Add MessageGroupIds of entries which failed in the batch.
+        :type entries: list
+        :param entries: all entries of the batch method
+        :type batch: list
+        :param batch: entry indices of the sent batch
+        :type result: dict or Exception
+        :param result: response or error of the batch
+        :type failed_groups: set
+        :param failed_groups: MessageGroupIds which had failed entries
+        """
+        if isinstance(result, Exception):
+            indices = batch
+        else:
+            ids = {r.get('Id') for r in result.get('Failed', [])}
+            indices = [i for i in batch if entries[i].get('Id') in ids]
+        failed_groups.update(
+            entries[i].get('MessageGroupId') for i in indices)
+
+    def _merge_batch_responses(
+        self, entries: typing.List[dict],
+        batches: typing.List[typing.List[int]], results: list,
+        failed: typing.Dict[int, dict],
+    ) -> dict:
+        """Merge the responses of batches into one.
+        :type entries: list
+        :param entries: all entries of the batch method
+        :type batches: list
+        :param batches: entry indices of each batch
+        :type results: list
+        :param results: response or error of each batch
+        :type failed: dict
+        :param failed: failed results keyed by entry index
+        :rtype: dict
+        :return: merged response in the order of the given entries
+        """
+        response = {'Successful': [], 'Failed': []}
+        for batch, res in zip(batches, results):
+            if isinstance(res, Exception):
+                logger.warning(f'failed to send batch {batch}: {res}')
+                response['Failed'].extend(
+                    self._failed_entry(entries[i], i, res) for i in batch)
+                continue
+            response['Successful'].extend(res.get('Successful', []))
+            response['Failed'].extend(res.get('Failed', []))
+        response['Failed'].extend(failed.values())
+
+        order = {entry.get('Id'): i for i, entry in enumerate(entries)}
+        for results in response.values():
+            results.sort(key=lambda r: order.get(r.get('Id'), len(order)))
+
+        return response
+
+    def _prepare_batch_entries(
+        self, entries: typing.List[dict],
+    ) -> typing.Tuple[
+            typing.Dict[int, typing.Any], typing.List[typing.List[int]], bool]:
+        """Prepare entries of send_message_batch in place, and plan batches
+        under the SQS limitations of the number of entries and the total size.
+        :type entries: list
+        :param entries: entries of send_message_batch
+        :rtype: tuple
+        :return: tuple of encoded bodies (or streams) to be put into S3
+            keyed by entry index, entry indices of each batch, and whether
+            the order of entries must be kept
+        """
+        uploads = {}
+        originals = {}
+        for i, entry in enumerate(entries):
+            attributes = entry.get('MessageAttributes', {})
+            reserved = self._find_reserved_attribute(attributes)
+            if reserved is not None:
+                raise ValueError(
+                    f'{reserved} is reserved name, found in {i}')
+
+            body = entry.get('MessageBody')
+            if body is None:
+                raise ValueError(f'message body is required, found in {i}')
+
+            if not self.is_stream(body):
+                originals[i] = (dict(attributes), body)
+            entry['MessageAttributes'], entry['MessageBody'], encoded = (
+                self._prepare_attributes_and_message(attributes, body))
+            if encoded is not None:
+                uploads[i] = encoded
+
+        # the total size of entries must be under the SQS limitation
+        # as well as each entry
+        pointer_size = self._get_pointer_size()
+        sizes = {}
+        offloads = {}
+        for i, entry in enumerate(entries):
+            if i in uploads:
+                sizes[i] = pointer_size + self.get_message_size(
+                    entry['MessageAttributes'], '')
+                continue
+
+            sizes[i] = self.get_message_size(
+                entry['MessageAttributes'], entry['MessageBody'])
+            attributes, body = originals[i]
+            encoded = self._encode_body(body)
+            originals[i] = (
+                self._set_reserved_attributes(attributes, len(encoded)),
+                encoded)
+            offloads[i] = pointer_size + self.get_message_size(
+                originals[i][0], '')
+
+        # plan each chunk of max entries in a SQS batch
+        keep_order = any('MessageGroupId' in entry for entry in entries)
+        max_entries = SQSExtendedConstants.MAX_BATCH_ENTRIES.value
+        offloaded = []
+        batches = []
+        for start in range(0, len(entries), max_entries):
+            chunk = range(start, min(start + max_entries, len(entries)))
+            chunk_offloaded, chunk_batches = self._plan_batch(
+                {i: sizes[i] for i in chunk},
+                {i: offloads[i] for i in chunk if i in offloads},
+                keep_order)
+            offloaded.extend(chunk_offloaded)
+            batches.extend(chunk_batches)
+        for i in offloaded:
+            entries[i]['MessageAttributes'], uploads[i] = originals[i]
+
+        return uploads, batches or [[]], keep_order
+
+    def _get_batch_entry_size(self, entry: dict) -> int:
+        """Estimate the size of the entry counted in the total size of
+        send_message_batch_extended, in the same way as batches are planned.
+        Messages to be stored in S3 are counted as their pointers, and ones
+        kept in the queue with base64 encoding or compression as encoded.
+        :type entry: dict
+        :param entry: entry of send_message_batch, which is not changed
+        :rtype: int
+        :return: size in bytes
+        """
+        attributes, body, encoded = self._prepare_attributes_and_message(
+            dict(entry.get('MessageAttributes', {})), entry['MessageBody'])
+        if encoded is not None:
+            return self._get_pointer_size() + self.get_message_size(
+                attributes, '')
+
+        return self.get_message_size(attributes, body)
+
+    def _encode_message(
+        self, attributes: dict, encoded: typing.Any,
+        codec: typing.Optional[PayloadCodec] = None,
+    ) -> typing.Tuple[dict, bytes]:
+        """Encode the message with base64 (and compress it before that)
+        to be kept in the queue.
+        :type attributes: dict
+        :param attributes: message attributes
+        :type encoded: bytes-like object
+        :param encoded: message body
+        :type codec: PayloadCodec
+        :param codec: codec to compress the message (optional)
+        :rtype: tuple
+        :return: tuple of attributes with the reserved encoding attribute
+            and base64 encoded message body
+        """
+        encodings = [SQSExtendedConstants.BASE64_ENCODING.value]
+        if codec is not None:
+            encoded = codec.compress(encoded)
+            encodings.insert(0, codec.name)
+
+        encoding = {'DataType': 'String', 'StringValue': '+'.join(encodings)}
+        name = SQSExtendedConstants.RESERVED_ENCODING_ATTRIBUTE_NAME.value
+        attributes = {**attributes, name: encoding}
+        self._check_attribute_count(attributes)
+
+        return attributes, base64.b64encode(encoded)
+
+    def _put_message_to_s3(
+        self, encoded: typing.Any, s3_put_params: dict = {'ACL': 'private'},
+        reference: typing.Optional[str] = None,
+    ) -> str:
+        """Put actual message into S3 and return the pointer to it.
+        This uses the low-level client, which is thread-safe unlike
+        the resource, so that it can be called from the thread pool.
+        Streams and messages larger than multipart_threshold are uploaded
+        by multipart upload of the S3 transfer manager.
+        :type encoded: bytes-like object, file-like object, or os.PathLike
+        :param encoded: message body to be stored
+        :type s3_put_params: dict
+        :param s3_put_params: parameters for s3.put_object
+        :type reference: str
+        :param reference: reference ID of the message with content_addressed
+        :rtype: str
+        :return: serialized PayloadS3Pointer
+        """
+        params, compressed = self._build_put_params(encoded, s3_put_params)
+        if self.is_stream(compressed) and compressed is not encoded:
+            # the spooled file of the stream compressed by spooled mode
+            # is removed after uploaded
+            with compressed:
+                return self._put_object_to_s3(compressed, params, reference)
+
+        return self._put_object_to_s3(compressed, params, reference)
+
+    def _put_object_to_s3(
+        self, encoded: typing.Any, params: dict,
+        reference: typing.Optional[str] = None,
+    ) -> str:
+        """Put the encoded (and compressed) message into S3.
+        :type encoded: bytes-like object, file-like object, or os.PathLike
+        :param encoded: message body to be stored
+        :type params: dict
+        :param params: parameters for s3.put_object including Bucket and Key
+        :type reference: str
+        :param reference: reference ID of the message with content_addressed
+        :rtype: str
+        :return: serialized PayloadS3Pointer
+        """
+        if reference is not None:
+            params['Key'] = self._hash_payload(encoded)
+            existing = self._put_reference(params, reference)
+            if existing is not None:
+                return self._build_pointer(params, existing)
+
+        if self.is_stream(encoded):
+            self._upload_message_to_s3(encoded, params)
+            return self._build_pointer(
+                params, self._head_checksum(params))
+
+        if len(encoded) >= self.multipart_threshold:
+            self._upload_message_to_s3(MemoryViewReader(encoded), params)
+            return self._build_pointer(
+                params, self._head_checksum(params))
+
+        # memoryview is not accepted by put_object, and read without copying
+        params['Body'] = (
+            MemoryViewReader(encoded) if isinstance(encoded, memoryview)
+            else encoded)
+        params['ContentLength'] = len(encoded)
+        # if error happens, this raises exception,
+        # like botocore.errorfactory.NoSuchBucket.
+        # as well, that exception doesn't have to be catched
+        # because it happens before sending a message into queue.
+        response = self.s3.meta.client.put_object(**params)
+        logger.info(
+            f"{params['Key']} was written into {self.s3_bucket_name}")
+
+        return self._build_pointer(params, response)
+
+    def _build_pointer(self, params: dict, response: dict) -> str:
+        """Build the pointer to the stored object with its checksum
+        returned by S3 if s3_checksum_algorithm is given.
+        :type params: dict
+        :param params: parameters for s3.put_object including Bucket and Key
+        :type response: dict
+        :param response: response of put_object or head_object
+        :rtype: str
+        :return: serialized PayloadS3Pointer
+        """
+        algorithm = self.s3_checksum_algorithm
+        checksum = (
+            response.get(f'Checksum{algorithm}') if algorithm is not None
+            else None)
+        if algorithm is not None and checksum is None:
+            # e.g. the existing object stored without the checksum
+            logger.warning(
+                f"{params['Key']} has no {algorithm} checksum, "
+                'and is not verified on receiving')
+
+        return PayloadS3Pointer(
+            params['Bucket'], params['Key'],
+            checksum_algorithm=algorithm if checksum is not None else None,
+            checksum=checksum).toJSON()
+
+    def _head_checksum(self, params: dict) -> dict:
+        """Get the checksum of the object uploaded by the S3 transfer
+        manager, which doesn't return it.
+        :type params: dict
+        :param params: parameters for s3.put_object including Bucket and Key
+        :rtype: dict
+        :return: response of head_object (empty without
+            s3_checksum_algorithm)
+        """
+        if self.s3_checksum_algorithm is None:
+            return {}
+
+        return self.s3.meta.client.head_object(
+            **self._head_object_params(params))
+
+    def _build_put_params(
+        self, encoded: typing.Any, s3_put_params: dict,
+    ) -> typing.Tuple[dict, typing.Any]:
+        """Build parameters to put the message into S3 with a new key,
+        and compress the message if needed.
+        :type encoded: bytes-like object, file-like object, or os.PathLike
+        :param encoded: message body to be stored
+        :type s3_put_params: dict
+        :param s3_put_params: parameters for s3.put_object
+        :rtype: tuple
+        :return: tuple of parameters including Bucket and Key,
+            and message body to be stored
+        """
+        # copy params not to share the key among threads via the default arg
+        params = dict(s3_put_params)
+        params['Bucket'] = self.s3_bucket_name
+        params['Key'] = str(uuid.uuid4())
+        if self.s3_checksum_algorithm is not None:
+            params['ChecksumAlgorithm'] = self.s3_checksum_algorithm
+        if self.compression is None:
+            return params, encoded
+
+        if self.is_stream(encoded):
+            # streams are not compressed not to load them into memory,
+            # except that they are compressed into a file by spooled mode
+            if self.spool_threshold is None:
+                return params, encoded
+            encoded = self._compress_stream(encoded)
+        else:
+            encoded = self.compression.compress(encoded)
+        params['Metadata'] = {
+                **params.get('Metadata', {}),
+                SQSExtendedConstants.COMPRESSION_METADATA_NAME.value: (
+                    self.compression.name),
+            }
+
+        return params, encoded
+
+    def _compress_stream(self, stream: typing.Any) -> typing.IO[bytes]:
+        """Compress the stream by chunks into the spooled file, which is
+        kept in memory until it exceeds spool_threshold.
+        :type stream: file-like object or os.PathLike
+        :param stream: message body to be stored
+        :rtype: file-like object
+        :return: spooled file of the compressed message at the beginning
+        """
+        spooled = tempfile.SpooledTemporaryFile(
+            max_size=self.spool_threshold, dir=self.spool_directory)
+        compressor = self.compression.compressor()
+        with contextlib.ExitStack() as stack:
+            if isinstance(stream, os.PathLike):
+                stream = stack.enter_context(open(stream, 'rb'))
+            for chunk in iter(
+                    functools.partial(stream.read, self.multipart_chunksize),
+                    b''):
+                spooled.write(compressor.compress(chunk))
+            spooled.write(compressor.flush())
+        spooled.seek(0)
+
+        return spooled
+
+    def _upload_message_to_s3(self, stream: typing.Any, params: dict) -> None:
+        """Upload actual message into S3 by the S3 transfer manager,
+        which switches to multipart upload with concurrent parts
+        if the size is larger than multipart_threshold.
+        :type stream: file-like object or os.PathLike
+        :param stream: message body to be stored
+        :type params: dict
+        :param params: parameters for s3.put_object including Bucket and Key
+        """
+        extra_args = {
+            k: v for k, v in params.items() if k not in ('Bucket', 'Key')}
+        config = boto3.s3.transfer.TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.multipart_max_concurrency)
+
+        # if error happens, this raises exception,
+        # like boto3.exceptions.S3UploadFailedError.
+        if isinstance(stream, os.PathLike):
+            self.s3.meta.client.upload_file(
+                os.fspath(stream), params['Bucket'], params['Key'],
+                ExtraArgs=extra_args, Config=config)
+        else:
+            self.s3.meta.client.upload_fileobj(
+                stream, params['Bucket'], params['Key'],
+                ExtraArgs=extra_args, Config=config)
+        logger.info(
+            f"{params['Key']} was uploaded into {params['Bucket']}")
+
+    def _put_messages_to_s3(
+        self, entries: typing.List[dict], uploads: typing.Dict[int, bytes],
+    ) -> typing.Dict[int, dict]:
+        """Put messages of batch entries into S3 concurrently.
+        MessageBody of each entry is replaced with the pointer on success.
+        :type entries: list
+        :param entries: entries of send_message_batch
+        :type uploads: dict
+        :param uploads: encoded bodies to be stored keyed by entry index
+        :rtype: dict
+        :return: failed results, like `Failed` of send_message_batch,
+            keyed by entry index
+        """
+        def put(encoded, reference):
+            return self._put_message_to_s3(encoded, reference=reference)
+
+        futures = self._submit_all(put, {
+            i: (encoded, self._get_reference(entries[i]['MessageAttributes']))
+            for i, encoded in uploads.items()})
+
+        failed = {}
+        for i, future in futures.items():
+            try:
+                entries[i]['MessageBody'] = future.result()
+            except Exception as e:
+                logger.warning(f'failed to put message of entry {i}: {e}')
+                failed[i] = self._failed_entry(entries[i], i, e)
+
+        return failed
+
+    def _failed_entry(
+            self, entry: dict, index: int, error: Exception) -> dict:
+        """Build a failed result of the given entry from the error
+        in the same format as `Failed` of SQS batch methods.
+        :type entry: dict
+        :param entry: entry of batch method
+        :type index: int
+        :param index: position of the entry in the given entries
+        :type error: Exception
+        :param error: error that happened on the entry
+        :rtype: dict
+        :return: failed result
+        """
+        code = type(error).__name__
+        if isinstance(error, botocore.exceptions.ClientError):
+            code = error.response.get('Error', {}).get('Code', code)
+
+        return {
+            'Id': entry.get('Id'),
+            'SenderFault': False,
+            'Code': code,
+            'Message': f'{error}, found in {index}',
+        }
+
+    def _call_batch_wo_failed(
+        self, func: typing.Callable, args: tuple, kwargs: dict,
+        failed: typing.Dict[int, dict],
+    ) -> dict:
+        """Call the original batch method only with entries which
+        didn't fail on S3, and report the others as failed ones
+        in the same way as SQS does.
+        :type func: callable
+        :param func: original batch method
+        :type args: tuple
+        :param args: positional arguments of the original method
+        :type kwargs: dict
+        :param kwargs: keyword arguments of the original method
+        :type failed: dict
+        :param failed: failed results keyed by entry index
+        :rtype: dict
+        :return: response of the original method including failed ones
+        """
+        if not failed:
+            return func(*args, **kwargs)
+
+        kwargs['Entries'] = [
+            entry for i, entry in enumerate(kwargs['Entries'])
+            if i not in failed]
+        response = (
+            func(*args, **kwargs) if kwargs['Entries']
+            else {'Successful': []})
+        response.setdefault('Failed', []).extend(failed.values())
+
+        return response
 
     def _build_attributes_and_message(
         self, attributes: dict, body: str,
@@ -77,33 +1373,14 @@ class SQSExtendedMessage(object):
         :rtype: tuple
         :return: tuple of re-built attributes and message body
         """
-        encoded = body.encode()
-        if not (self.always_through_s3 or
-                self._is_message_larger(attributes, encoded)):
+        attributes, body, encoded = self._prepare_attributes_and_message(
+            attributes, body)
+        if encoded is None:
             return attributes, body
 
-        # build the new attr
-        reserved = {
-            'DataType': 'Number', 'StringValue': str(len(encoded))}
-        attributes[
-            SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value
-        ] = reserved
-
-        # put actual message into S3
-        s3_put_params['Key'] = str(uuid.uuid4())
-        s3_put_params['Body'] = encoded
-        s3_put_params['ContentLength'] = len(encoded)
-        # if error happens, this raises exception,
-        # like botocore.errorfactory.NoSuchBucket.
-        # as well, that exception doesn't have to be catched
-        # because it happens before sending a message into queue.
-        self.s3.Bucket(self.s3_bucket_name).put_object(**s3_put_params)
-        logger.info(
-            f"{s3_put_params['Key']} was written into {self.s3_bucket_name}")
-
         # build the new message
-        body = PayloadS3Pointer(
-            self.s3_bucket_name, s3_put_params['Key']).toJSON()
+        body = self._put_message_to_s3(
+            encoded, s3_put_params, self._get_reference(attributes))
 
         return attributes, body
 
@@ -121,8 +1398,17 @@ class SQSExtendedMessage(object):
         :rtype: tuple
         :return: tuple of re-built attributes, message body, and receipt handle
         """
-        if (attributes is None or attributes.get(
-                SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value) is None):
+        if attributes is None:
+            return attributes, body, receipt_handle
+
+        if attributes.get(
+                SQSExtendedConstants.RESERVED_ENCODING_ATTRIBUTE_NAME.value
+        ) is not None:
+            return self._decode_inline_message(
+                attributes, body, receipt_handle)
+
+        if attributes.get(
+                SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value) is None:
             return attributes, body, receipt_handle
 
         payload = PayloadS3Pointer.fromJSON(body)
@@ -131,38 +1417,567 @@ class SQSExtendedMessage(object):
         # like botocore.errorfactory.NoSuchBucket.
         # as well, that exception doesn't have to be catched, and
         # stored message should be remained before deleting.
-        data = self.s3.Bucket(payload.s3BucketName).Object(
-            payload.s3Key).get()
-        data = data['Body'].read().decode()
-        logger.info(
-            f"{payload.s3Key} was read from {payload.s3BucketName}")
+        size = attributes[SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value]
+        size = int(size.get('StringValue', 0))
+        if self.lazy_payload:
+            data = LazyPayload(
+                functools.partial(self._get_message_from_s3, payload, size),
+                self._get_executor())
+        else:
+            data = self._get_message_from_s3(payload, size)
 
         # pop special attribute for s3 association
-        attr = copy.deepcopy(attributes)
-        del attr[SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value]
-        if not attr:
-            attr = None
-
-        # for deletion, edit receipt handle
-        # this follows java extended client way
-        # https://github.com/awslabs/amazon-sqs-java-extended-client-lib/blob/0208e1ad81351e5b90d5e3a413b5caea260ceb5f/src/main/java/com/amazon/sqs/javamessaging/AmazonSQSExtendedClient.java#L1138
-        receipt_handle = (
+        attr = self._pop_reserved_attribute(
+            attributes, SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value,
+            SQSExtendedConstants.RESERVED_REFERENCE_ATTRIBUTE_NAME.value)
+
+        return attr, data, self._build_receipt_handle(
+            payload, receipt_handle, self._get_reference(attributes))
+
+    def _pop_reserved_attribute(
+            self, attributes: dict, *names: str) -> typing.Optional[dict]:
+        """Return the shallow copy of attributes without the reserved
+        attributes. Values, which may have large BinaryValue, are shared
+        with the given attributes instead of being copied.
+        :type attributes: dict
+        :param attributes: message attributes
+        :type names: str
+        :param names: reserved attribute names
+        :rtype: dict
+        :return: attributes (None if no attributes remain)
+        """
+        attr = {k: v for k, v in attributes.items() if k not in names}
+
+        return attr or None
+
+    def _build_receipt_handle(
+        self, payload: PayloadS3Pointer, receipt_handle: str,
+        reference: typing.Optional[str] = None,
+    ) -> str:
+        """Build the receipt handle with the pointer to the stored message
+        for deletion. With the reference ID or the offset of the packed
+        message, the key of the marker is built in instead of the key
+        of the stored object.
+        This follows java extended client way
+        https://github.com/awslabs/amazon-sqs-java-extended-client-lib/blob/0208e1ad81351e5b90d5e3a413b5caea260ceb5f/src/main/java/com/amazon/sqs/javamessaging/AmazonSQSExtendedClient.java#L1138
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :type receipt_handle: str
+        :param receipt_handle: identifier to handle received message
+        :type reference: str
+        :param reference: reference ID of the message
+        :rtype: str
+        :return: extended receipt handle
+        """
+        key = payload.s3Key
+        if payload.s3Offset is not None:
+            key = self._ack_key(key, [payload.s3Offset])
+        elif reference is not None:
+            key = self._reference_key(key, reference)
+        return (
             f'{SQSExtendedConstants.S3_BUCKET_NAME_MARKER.value}'
             f'{payload.s3BucketName}'
             f'{SQSExtendedConstants.S3_BUCKET_NAME_MARKER.value}'
-            f'{SQSExtendedConstants.S3_KEY_MARKER.value}{payload.s3Key}'
+            f'{SQSExtendedConstants.S3_KEY_MARKER.value}{key}'
             f'{SQSExtendedConstants.S3_KEY_MARKER.value}'
             f'{receipt_handle}'
         )
 
-        return attr, data, receipt_handle
+    def _decode_inline_message(
+        self, attributes: dict, body: str, receipt_handle: str,
+    ) -> typing.Tuple[typing.Optional[dict], str, str]:
+        """Decode message encoded to be kept in the queue.
+        The reserved attribute has the names of encodings applied in order,
+        like 'zlib+base64', so that they are reverted in reverse order.
+        :type attributes: dict
+        :param attributes: message attributes
+        :type body: str
+        :param body: encoded message body
+        :type receipt_handle: str
+        :param receipt_handle: identifier to handle received message
+        :rtype: tuple
+        :return: tuple of re-built attributes, message body, and receipt handle
+        """
+        name = SQSExtendedConstants.RESERVED_ENCODING_ATTRIBUTE_NAME.value
+        encodings = attributes[name]['StringValue'].split('+')
+
+        data = body.encode()
+        for encoding in reversed(encodings):
+            if encoding == SQSExtendedConstants.BASE64_ENCODING.value:
+                data = base64.b64decode(data)
+            else:
+                data = self._get_codec(encoding).decompress(data)
+
+        # pop special attribute for encoding
+        attr = self._pop_reserved_attribute(attributes, name)
+
+        return attr, self._decode_body(data), receipt_handle
+
+    def _decode_body(self, data: typing.Any) -> typing.Any:
+        """Decode the message got from S3 or the queue into str.
+        With raw_body, the message is returned as it is. Without it,
+        binary messages which cannot be decoded raise UnicodeDecodeError.
+        :type data: bytes-like object
+        :param data: actual message
+        :rtype: str or bytes-like object
+        :return: message body
+        """
+        if self.raw_body:
+            return data
+
+        return data.decode()
+
+    def _md5_of_body(self, body: typing.Any) -> typing.Optional[str]:
+        """Calculate md5 digest of message body, which is same as
+        MD5OfBody calculated by SQS for str.
+        :type body: str, bytes-like object, or file-like object
+        :param body: message body
+        :rtype: str
+        :return: md5 of the given body (None without calculate_md5)
+        """
+        if not self.calculate_md5:
+            return None
+
+        return md5_of_body(body)
+
+    def _get_codec(self, name: str) -> PayloadCodec:
+        """Return the codec to decompress received messages.
+        :type name: str
+        :param name: codec name recorded with the stored message
+        :rtype: PayloadCodec
+        :return: codec instance
+        """
+        if self.compression is not None and self.compression.name == name:
+            return self.compression
+
+        return get_codec(name)
+
+    def _get_object_by_ranges(
+        self, payload: PayloadS3Pointer,
+    ) -> typing.Tuple[bytearray, dict]:
+        """Get the stored object by concurrent byte-range requests.
+        The first part tells the total size of the object, and then
+        the other parts are got concurrently into the preallocated buffer.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :rtype: tuple
+        :return: tuple of the object data and its metadata
+        """
+        part_size = self.download_part_size
+        response = self.s3.meta.client.get_object(
+            Bucket=payload.s3BucketName, Key=payload.s3Key,
+            Range=f'bytes=0-{part_size - 1}')
+        # like 'bytes 0-8388607/104857600'
+        total = int(response['ContentRange'].split('/')[-1])
+        buffer = bytearray(total)
+        view = memoryview(buffer)
+        first = response['Body'].read()
+        view[0:len(first)] = first
+
+        def get_part(start: int) -> None:
+            end = min(start + part_size, total)
+            # IfMatch fails if the object is overwritten while getting parts
+            res = self.s3.meta.client.get_object(
+                Bucket=payload.s3BucketName, Key=payload.s3Key,
+                Range=f'bytes={start}-{end - 1}', IfMatch=response['ETag'])
+            part = res['Body'].read()
+            if len(part) != end - start:
+                raise ValueError(
+                    f'{payload.s3Key} was truncated at {start + len(part)}')
+            view[start:end] = part
+
+        executor = self._get_executor(
+            'sqs-extended-range', self.download_max_concurrency)
+        futures = [
+            executor.submit(get_part, start)
+            for start in range(len(first), total, part_size)]
+        for future in futures:
+            future.result()
+
+        return buffer, response.get('Metadata', {})
+
+    def _get_message_from_s3(
+        self, payload: PayloadS3Pointer, size: typing.Optional[int] = None,
+    ) -> str:
+        """Get actual message stored in S3.
+        This uses the low-level client, which is thread-safe unlike
+        the resource, so that it can be called from the thread pool.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :type size: int
+        :param size: size of the message given by the reserved attribute.
+            if it's larger than download_threshold, the message is got
+            by concurrent byte-range requests, and if it's larger than
+            spool_threshold, the message is spooled into the file
+        :rtype: str, bytes-like object, or file-like object
+        :return: actual message body (bytes-like object with raw_body,
+            or file-like object in spooled mode)
+        """
+        cached = self._get_cached_object(payload)
+        if cached is not None:
+            return self._decode_object(*cached)
+
+        if (self.spool_threshold is not None and size is not None
+                and size >= self.spool_threshold):
+            return self._spool_message_from_s3(payload)
+
+        if self._is_got_by_ranges(payload, size):
+            data, metadata = self._get_object_by_ranges(payload)
+        else:
+            response = self.s3.meta.client.get_object(
+                **self._get_object_params(payload))
+            self._verify_checksum(payload, response)
+            data = response['Body'].read()
+            metadata = response.get('Metadata', {})
+
+        logger.info(
+            f"{payload.s3Key} was read from {payload.s3BucketName}")
+        self._cache_object(payload, data, metadata)
+
+        return self._decode_object(data, metadata)
+
+    def _is_got_by_ranges(
+        self, payload: PayloadS3Pointer, size: typing.Optional[int],
+    ) -> bool:
+        """Check whether the message is got by concurrent byte-range
+        requests. Packed messages are got by their own ranges, and messages
+        with full object checksums are got by one request to be verified
+        by botocore.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :type size: int
+        :param size: size of the message given by the reserved attribute
+        :rtype: bool
+        :return: True if the message is larger than download_threshold
+        """
+        return (
+            payload.s3Offset is None and
+            not self._has_full_object_checksum(payload) and
+            size is not None and size >= self.download_threshold)
+
+    @staticmethod
+    def _has_full_object_checksum(payload: PayloadS3Pointer) -> bool:
+        """Check whether the pointer has the checksum of the whole object.
+        Objects uploaded by multipart upload have composite checksums of
+        their parts, like `<base64>-<number of parts>`, which botocore
+        doesn't validate the body against.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :rtype: bool
+        :return: True if the body is validated by the checksum
+        """
+        return payload.s3Checksum is not None and '-' not in payload.s3Checksum
+
+    def _get_object_params(self, payload: PayloadS3Pointer) -> dict:
+        """Build parameters to get the stored message by one request.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :rtype: dict
+        :return: parameters for s3.get_object
+        """
+        params = {'Bucket': payload.s3BucketName, 'Key': payload.s3Key}
+        if payload.s3Offset is not None:
+            # the message packed with others
+            params['Range'] = self._packed_range(payload)
+        if payload.s3Checksum is not None:
+            # botocore validates the body while it's read, except composite
+            # checksums, which are still compared with the pointer
+            params['ChecksumMode'] = 'ENABLED'
+
+        return params
+
+    def _verify_checksum(
+            self, payload: PayloadS3Pointer, response: dict) -> None:
+        """Check that the checksum of the got object is same as the one
+        in the pointer, which finds the object overwritten or corrupted
+        in S3. The body itself is validated against the returned checksum
+        by botocore while it's read.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :type response: dict
+        :param response: response of get_object
+        """
+        if payload.s3Checksum is None:
+            return
+
+        checksum = response.get(f'Checksum{payload.s3ChecksumAlgorithm}')
+        if checksum is None:
+            logger.warning(
+                f'{payload.s3Key} was got without the checksum to verify')
+            return
+
+        if checksum != payload.s3Checksum:
+            raise ValueError(
+                f'{payload.s3Key} has checksum {checksum}, '
+                f'but {payload.s3Checksum} is expected')
+
+    def _spool_message_from_s3(
+            self, payload: PayloadS3Pointer) -> typing.IO[bytes]:
+        """Get actual message stored in S3 into the spooled file,
+        which is kept in memory until it exceeds spool_threshold.
+        The object is read by chunks from the single streaming request,
+        and decompressed on the fly. Spooled messages are not cached.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :rtype: file-like object
+        :return: spooled file of the message at the beginning
+        """
+        response = self.s3.meta.client.get_object(
+            **self._get_object_params(payload))
+        self._verify_checksum(payload, response)
+        # objects without the metadata, like ones put by java client,
+        # are not compressed
+        compression = response.get('Metadata', {}).get(
+            SQSExtendedConstants.COMPRESSION_METADATA_NAME.value)
+        decompressor = (
+            self._get_codec(compression).decompressor()
+            if compression is not None else None)
+
+        # MD5 is calculated while spooling not to read the file again
+        spooled = DigestSpooledFile(
+            max_size=self.spool_threshold, dir=self.spool_directory)
+        try:
+            for chunk in response['Body'].iter_chunks(
+                    self.download_part_size):
+                spooled.write(
+                    decompressor.decompress(chunk) if decompressor else chunk)
+            if decompressor is not None:
+                spooled.write(decompressor.flush())
+        except Exception:
+            spooled.close()
+            raise
+        spooled.seek(0)
+        logger.info(
+            f"{payload.s3Key} was spooled from {payload.s3BucketName}")
+
+        return spooled
+
+    def _cache_key(self, payload: PayloadS3Pointer) -> str:
+        """Return the key of the cached object of the message.
+        Packed messages are cached by the key of their own
+        acknowledgement marker, which is in the receipt handle.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :rtype: str
+        :return: key of the cached object
+        """
+        if payload.s3Offset is not None:
+            return self._ack_key(payload.s3Key, [payload.s3Offset])
+
+        return payload.s3Key
+
+    def _get_cached_object(
+        self, payload: PayloadS3Pointer,
+    ) -> typing.Optional[typing.Tuple[bytes, dict]]:
+        """Get the object of the message from payload_cache.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :rtype: tuple
+        :return: tuple of object data and metadata
+            (None if not cached or payload_cache is not given)
+        """
+        if self.payload_cache is None:
+            return None
+
+        return self.payload_cache.get(
+            payload.s3BucketName, self._cache_key(payload))
+
+    def _cache_object(
+        self, payload: PayloadS3Pointer, data: typing.Any, metadata: dict,
+    ) -> None:
+        """Put the object got from S3 into payload_cache if given.
+        The data is copied into bytes not to share the buffer with
+        the received message.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer to the stored message
+        :type data: bytes-like object
+        :param data: object data
+        :type metadata: dict
+        :param metadata: object metadata
+        """
+        if self.payload_cache is not None:
+            self.payload_cache.put(
+                payload.s3BucketName, self._cache_key(payload),
+                bytes(data), metadata)
+
+    def _invalidate_cached_objects(
+            self, receipt_handles: typing.Iterable[str]) -> None:
+        """Remove objects of the deleted messages from payload_cache.
+        :type receipt_handles: iterable
+        :param receipt_handles: extended receipt handles
+        """
+        if self.payload_cache is None:
+            return
+
+        for receipt_handle in receipt_handles:
+            bucket, key, _ = self._parse_receipt_handle(receipt_handle)
+            packed = self._parse_ack_key(key)
+            keys = (
+                [self._ack_key(packed[0], [offset]) for offset in packed[1]]
+                if packed is not None
+                else [self._get_referenced_key(key) or key])
+            for key in keys:
+                self.payload_cache.invalidate(bucket, key)
+
+    def _get_stored_sizes(
+        self, is_client: bool, messages: list, parsed: list,
+    ) -> typing.Dict[str, typing.Tuple[int, str]]:
+        """Return sizes of received messages got from S3 on receiving.
+        With lazy_payload, no messages are returned because they are got
+        at the first access of their bodies.
+        :type is_client: bool
+        :param is_client: True if the caller is client
+        :type messages: list
+        :param messages: received messages (dict or sqs.Message)
+        :type parsed: list
+        :param parsed: attributes, body, and receipt handle of messages
+        :rtype: dict
+        :return: size and receipt handle of each message
+            keyed by its MessageId
+        """
+        if self.lazy_payload:
+            return {}
+
+        name = SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value
+        return {
+            self._get_message_id(is_client, message): (
+                int(attributes[name].get('StringValue', 0)), receipt_handle)
+            for message, (attributes, _, receipt_handle) in zip(
+                messages, parsed)
+            if attributes and attributes.get(name)}
+
+    def _acquire_budget(
+        self, sizes: typing.Dict[str, typing.Tuple[int, str]],
+        hold_timeout: typing.Optional[float] = None,
+    ) -> None:
+        """Wait until received messages fit into byte_budget if given.
+        :type sizes: dict
+        :param sizes: size and receipt handle of each message
+            keyed by its MessageId
+        :type hold_timeout: float
+        :param hold_timeout: seconds to hold them, like VisibilityTimeout
+            of the receiving call (optional: by default, hold_timeout of
+            the budget)
+        """
+        if self.byte_budget is not None and sizes:
+            self.byte_budget.acquire_all(
+                {key: size for key, (size, _) in sizes.items()},
+                receipt_handles={
+                    key: receipt_handle
+                    for key, (_, receipt_handle) in sizes.items()},
+                hold_timeout=hold_timeout)
+
+    def _release_budget(self, keys: typing.Iterable[str]) -> None:
+        """Release messages from byte_budget if given.
+        :type keys: iterable
+        :param keys: MessageIds or receipt handles (extended or not)
+        """
+        if self.byte_budget is not None:
+            self.byte_budget.release_all(keys)
+
+    def _change_budget_holds(
+        self, timeouts: typing.Iterable[typing.Tuple[str, typing.Any]],
+    ) -> None:
+        """Release messages made visible again from byte_budget if given,
+        and hold messages whose visibility timeout is changed longer.
+        :type timeouts: iterable
+        :param timeouts: pairs of receipt handle (extended or not)
+            and new visibility timeout
+        """
+        if self.byte_budget is None:
+            return
+
+        for receipt_handle, timeout in timeouts:
+            if timeout is None:
+                continue
+            if int(timeout) <= 0:
+                self.byte_budget.release(receipt_handle)
+            else:
+                self.byte_budget.renew_all([receipt_handle], int(timeout))
+
+    def _packed_range(self, payload: PayloadS3Pointer) -> str:
+        """Return the byte range of the packed message.
+        :type payload: PayloadS3Pointer
+        :param payload: pointer with the offset and the length
+        :rtype: str
+        :return: value of Range header
+        """
+        end = payload.s3Offset + payload.s3Length - 1
+        return f'bytes={payload.s3Offset}-{end}'
+
+    def _decode_object(self, data: typing.Any, metadata: dict) -> typing.Any:
+        """Decompress and decode the object got from S3.
+        :type data: bytes-like object
+        :param data: object data
+        :type metadata: dict
+        :param metadata: object metadata
+        :rtype: str or bytes-like object
+        :return: actual message body (bytes-like object with raw_body)
+        """
+        # objects without the metadata, like ones put by java client,
+        # are not compressed
+        compression = metadata.get(
+            SQSExtendedConstants.COMPRESSION_METADATA_NAME.value)
+        if compression is not None:
+            data = self._get_codec(compression).decompress(data)
+
+        return self._decode_body(data)
+
+    def _revert_received_messages(
+        self, is_client: bool, messages: list,
+        visibility_timeout: typing.Optional[int] = None,
+    ) -> None:
+        """Revert all received messages in place.
+        Messages stored in S3 are got concurrently on the thread pool,
+        and the others are reverted in the current thread.
+        With lazy_payload, all messages are reverted in the current thread
+        because no messages are got from S3 here.
+        :type is_client: bool
+        :param is_client: True if the caller is client
+        :type messages: list
+        :param messages: received messages (dict or sqs.Message)
+        :type visibility_timeout: int
+        :param visibility_timeout: VisibilityTimeout of the receiving call,
+            for which messages are held in byte_budget
+        """
+        parsed = [
+            self._parse_received_message(is_client, message)
+            for message in messages]
+        sizes = self._get_stored_sizes(is_client, messages, parsed)
+        self._acquire_budget(sizes, visibility_timeout)
+        extended = {
+            i: args for i, args in enumerate(parsed)
+            if not self.lazy_payload and
+            self._find_reserved_attribute(args[0]) is not None}
+        futures = self._submit_all(
+            self._revert_attributes_and_message, extended)
+
+        # keep the order of messages, and raise the first error if happens
+        try:
+            for i, message in enumerate(messages):
+                attributes, body, receipt_handle = (
+                    futures[i].result() if i in futures
+                    else self._revert_attributes_and_message(*parsed[i]))
+
+                self._update_received_message(
+                    message, is_client, attributes, body, receipt_handle)
+        except Exception:
+            self._release_budget(sizes)
+            raise
 
     def _delete_message_from_s3(self, receipt_handle: str) -> None:
         """Delete message stored in S3.
         :type receipt_handle: str
         :param receipt_handle: identifier to handle received message
         """
+        self._invalidate_cached_objects([receipt_handle])
+        self._release_budget([receipt_handle])
         bucket, key, _ = self._parse_receipt_handle(receipt_handle)
+        packed = self._parse_ack_key(key)
+        if packed is not None:
+            self._acknowledge_packed_messages(bucket, *packed)
+            return
+
         # if error happens, this raises exception,
         # like botocore.errorfactory.NoSuchBucket.
         # as well, that exception doesn't have to be catched
@@ -171,9 +1986,368 @@ class SQSExtendedMessage(object):
         logger.info(
             f"{key} was deleted from {bucket}")
 
-    def _is_message_larger(self, attributes: dict, body: str):
+        content_key = self._get_referenced_key(key)
+        if content_key is not None:
+            self._delete_unreferenced_objects(bucket, [content_key])
+
+    def _acknowledge_packed_messages(
+            self, bucket: str, key: str, offsets: typing.List[int]) -> None:
+        """Put the acknowledgement marker of packed messages, and delete
+        the object if all messages packed in it are acknowledged.
+        The marker is put by the first request, and errors after that
+        are only logged and the object is left for the lifecycle rule.
+        :type bucket: str
+        :param bucket: bucket name
+        :type key: str
+        :param key: key of the object packing messages
+        :type offsets: list
+        :param offsets: offsets of acknowledged messages
+        """
+        self.s3.meta.client.put_object(
+            Bucket=bucket, Key=self._ack_key(key, offsets), Body=b'')
+        logger.info(f"{key} was acknowledged at {offsets} in {bucket}")
+
+        try:
+            markers = []
+            paginator = self.s3.meta.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(
+                    Bucket=bucket, Prefix=self._ack_key(key, [])):
+                markers.extend(o['Key'] for o in page.get('Contents', []))
+
+            if not self._is_all_acknowledged(key, markers):
+                return
+
+            res = self.s3.meta.client.delete_objects(
+                Bucket=bucket, Delete={
+                    'Objects': [{'Key': k} for k in [key] + markers],
+                    'Quiet': True,
+                })
+        except Exception as e:
+            res = e
+        self._log_deleted_objects(bucket, [key], res)
+
+    def _is_all_acknowledged(
+            self, key: str, markers: typing.List[str]) -> bool:
+        """Check whether all messages packed in the object are acknowledged
+        by the given markers.
+        :type key: str
+        :param key: key of the object packing messages
+        :type markers: list
+        :param markers: keys of the acknowledgement markers
+        :rtype: bool
+        :return: True if all messages are acknowledged
+        """
+        count = int(
+            key.rsplit(SQSExtendedConstants.PACKED_KEY_INFIX.value, 1)[-1])
+        acknowledged = set()
+        for marker in markers:
+            acknowledged.update(self._parse_ack_key(marker)[1])
+
+        return len(acknowledged) >= count
+
+    def _is_referenced(self, bucket: str, key: str) -> bool:
+        """Check whether any reference marker of the stored object remains.
+        :type bucket: str
+        :param bucket: bucket name
+        :type key: str
+        :param key: key of the stored object
+        :rtype: bool
+        :return: True if referenced
+        """
+        res = self.s3.meta.client.list_objects_v2(
+            Bucket=bucket, Prefix=self._reference_key(key, ''), MaxKeys=1)
+
+        return res.get('KeyCount', 0) > 0
+
+    def _delete_unreferenced_objects(
+            self, bucket: str, keys: typing.List[str]) -> None:
+        """Delete stored objects whose reference markers were all deleted.
+        Errors are only logged because messages don't refer to them anymore,
+        and the objects are left for the lifecycle rule.
+        :type bucket: str
+        :param bucket: bucket name
+        :type keys: list
+        :param keys: keys of the stored objects
+        """
+        futures = self._submit_all(
+            functools.partial(self._is_referenced, bucket),
+            {key: key for key in keys})
+        unreferenced = []
+        for key, future in futures.items():
+            try:
+                if not future.result():
+                    unreferenced.append(key)
+            except Exception as e:
+                logger.warning(f'failed to list references of {key}: {e}')
+
+        limit = SQSExtendedConstants.MAX_DELETE_OBJECTS.value
+        for n in range(0, len(unreferenced), limit):
+            chunk = unreferenced[n:n + limit]
+            try:
+                res = self.s3.meta.client.delete_objects(
+                    Bucket=bucket, Delete={
+                        'Objects': [{'Key': key} for key in chunk],
+                        'Quiet': True,
+                    })
+            except Exception as e:
+                res = e
+            self._log_deleted_objects(bucket, chunk, res)
+
+    def _log_deleted_objects(
+        self, bucket: str, keys: typing.List[str], response: typing.Any,
+    ) -> None:
+        """Log the result of DeleteObjects for unreferenced objects.
+        :type bucket: str
+        :param bucket: bucket name
+        :type keys: list
+        :param keys: deleted keys
+        :type response: dict or Exception
+        :param response: response or error of DeleteObjects
+        """
+        if isinstance(response, Exception):
+            logger.warning(
+                f'failed to delete objects in {bucket}: {response}')
+            return
+
+        errors = {
+            error['Key']: error for error in response.get('Errors', [])}
+        for key in keys:
+            if key in errors:
+                logger.warning(
+                    f"failed to delete {key} from {bucket}: "
+                    f"{errors[key].get('Message')}")
+            else:
+                logger.info(f"{key} was deleted from {bucket}")
+
+    def _find_referenced_keys(
+        self, chunks: typing.List[
+            typing.Tuple[str, typing.Dict[str, typing.List[int]]]],
+        failed: typing.Dict[int, dict],
+    ) -> typing.Dict[str, typing.List[str]]:
+        """Find stored objects referred by the deleted reference markers.
+        :type chunks: list
+        :param chunks: deleted objects grouped by _group_objects_to_delete
+        :type failed: dict
+        :param failed: failed results keyed by entry index
+        :rtype: dict
+        :return: keys of the stored objects keyed by bucket name
+        """
+        referenced = {}
+        for bucket, chunk in chunks:
+            for key, indices in chunk.items():
+                content_key = self._get_referenced_key(key)
+                if content_key is None or any(i in failed for i in indices):
+                    continue
+                keys = referenced.setdefault(bucket, [])
+                if content_key not in keys:
+                    keys.append(content_key)
+
+        return referenced
+
+    def _delete_messages_from_s3(
+        self, entries: typing.List[dict],
+        receipt_handles: typing.Dict[int, str],
+    ) -> typing.Dict[int, dict]:
+        """Delete messages of batch entries stored in S3.
+        Objects are grouped by bucket and deleted by DeleteObjects,
+        which accepts up to 1000 keys, instead of deleting one by one.
+        Packed messages are acknowledged by one marker of each object.
+        :type entries: list
+        :param entries: entries of delete_message_batch
+        :type receipt_handles: dict
+        :param receipt_handles: extended receipt handles keyed by entry index
+        :rtype: dict
+        :return: failed results, like `Failed` of delete_message_batch,
+            keyed by entry index
+        """
+        self._invalidate_cached_objects(receipt_handles.values())
+        self._release_budget(receipt_handles.values())
+        packed, receipt_handles = self._group_packed_messages(
+            receipt_handles)
+        futures = self._submit_all(self._acknowledge_packed_messages, {
+            target: (*target, list(offsets))
+            for target, offsets in packed.items()})
+
+        failed = {}
+        for target, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                failed.update(self._failed_packed_messages(
+                    entries, target, packed[target], e))
+
+        chunks = self._group_objects_to_delete(receipt_handles)
+        for bucket, chunk in chunks:
+            try:
+                res = self.s3.meta.client.delete_objects(
+                    Bucket=bucket, Delete={
+                        'Objects': [{'Key': key} for key in chunk],
+                        'Quiet': True,
+                    })
+            except Exception as e:
+                res = e
+            failed.update(
+                self._check_deleted_objects(entries, bucket, chunk, res))
+
+        # reference markers were deleted instead of shared objects
+        for bucket, keys in self._find_referenced_keys(
+                chunks, failed).items():
+            self._delete_unreferenced_objects(bucket, keys)
+
+        return failed
+
+    def _group_packed_messages(
+        self, receipt_handles: typing.Dict[int, str],
+    ) -> typing.Tuple[
+            typing.Dict[typing.Tuple[str, str], typing.Dict[int, list]],
+            typing.Dict[int, str]]:
+        """Group packed messages of batch entries by object.
+        :type receipt_handles: dict
+        :param receipt_handles: extended receipt handles keyed by entry index
+        :rtype: tuple
+        :return: tuple of entry indices keyed by offset keyed by
+            bucket and key of each object, and the other receipt handles
+        """
+        packed = {}
+        others = {}
+        for i, receipt_handle in receipt_handles.items():
+            bucket, key, _ = self._parse_receipt_handle(receipt_handle)
+            parsed = self._parse_ack_key(key)
+            if parsed is None:
+                others[i] = receipt_handle
+                continue
+
+            offsets = packed.setdefault((bucket, parsed[0]), {})
+            for offset in parsed[1]:
+                offsets.setdefault(offset, []).append(i)
+
+        return packed, others
+
+    def _failed_packed_messages(
+        self, entries: typing.List[dict], target: typing.Tuple[str, str],
+        offsets: typing.Dict[int, list], error: Exception,
+    ) -> typing.Dict[int, dict]:
+        """Build failed results of packed messages not acknowledged.
+        :type entries: list
+        :param entries: entries of delete_message_batch
+        :type target: tuple
+        :param target: bucket and key of the object packing messages
+        :type offsets: dict
+        :param offsets: entry indices keyed by offset
+        :type error: Exception
+        :param error: error that happened on the acknowledgement
+        :rtype: dict
+        :return: failed results keyed by entry index
+        """
+        logger.warning(f'failed to acknowledge messages in {target}: {error}')
+
+        return {
+            i: self._failed_entry(entries[i], i, error)
+            for i in itertools.chain(*offsets.values())}
+
+    def _group_objects_to_delete(
+        self, receipt_handles: typing.Dict[int, str],
+    ) -> typing.List[typing.Tuple[str, typing.Dict[str, typing.List[int]]]]:
+        """Group stored messages of batch entries by bucket into chunks
+        of DeleteObjects, which accepts up to 1000 keys.
+        :type receipt_handles: dict
+        :param receipt_handles: extended receipt handles keyed by entry index
+        :rtype: list
+        :return: list of bucket and entry indices keyed by object key
+        """
+        buckets = {}
+        for i, receipt_handle in receipt_handles.items():
+            bucket, key, _ = self._parse_receipt_handle(receipt_handle)
+            buckets.setdefault(bucket, {}).setdefault(key, []).append(i)
+
+        chunks = []
+        limit = SQSExtendedConstants.MAX_DELETE_OBJECTS.value
+        for bucket, keys in buckets.items():
+            keys = list(keys.items())
+            for n in range(0, len(keys), limit):
+                chunks.append((bucket, dict(keys[n:n + limit])))
+
+        return chunks
+
+    def _check_deleted_objects(
+        self, entries: typing.List[dict], bucket: str,
+        chunk: typing.Dict[str, typing.List[int]], response: typing.Any,
+    ) -> typing.Dict[int, dict]:
+        """Check the response of DeleteObjects.
+        :type entries: list
+        :param entries: entries of delete_message_batch
+        :type bucket: str
+        :param bucket: bucket name
+        :type chunk: dict
+        :param chunk: entry indices keyed by object key
+        :type response: dict or Exception
+        :param response: response or error of DeleteObjects
+        :rtype: dict
+        :return: failed results, like `Failed` of delete_message_batch,
+            keyed by entry index
+        """
+        failed = {}
+        if isinstance(response, Exception):
+            logger.warning(
+                f'failed to delete objects in {bucket}: {response}')
+            for i in itertools.chain(*chunk.values()):
+                failed[i] = self._failed_entry(entries[i], i, response)
+            return failed
+
+        errors = {
+            error['Key']: error for error in response.get('Errors', [])}
+        for key, indices in chunk.items():
+            if key not in errors:
+                logger.info(f"{key} was deleted from {bucket}")
+                continue
+
+            error = errors[key]
+            logger.warning(
+                f"failed to delete {key} from {bucket}: "
+                f"{error.get('Message')}")
+            for i in indices:
+                failed[i] = {
+                    'Id': entries[i].get('Id'),
+                    'SenderFault': False,
+                    'Code': error.get('Code'),
+                    'Message': f"{error.get('Message')}, found in {i}",
+                }
+
+        return failed
+
+    def _find_reserved_attribute(
+            self, attributes: typing.Optional[dict]) -> typing.Optional[str]:
+        """Return the reserved attribute name found in the given attributes.
+        :type attributes: dict
+        :param attributes: message attributes
+        :rtype: str
+        :return: reserved name (None if not found)
+        """
+        if not attributes:
+            return None
+
+        for name in (
+                SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value,
+                SQSExtendedConstants.RESERVED_ENCODING_ATTRIBUTE_NAME.value,
+                SQSExtendedConstants.RESERVED_REFERENCE_ATTRIBUTE_NAME.value):
+            if attributes.get(name):
+                return name
+
+        return None
+
+    @staticmethod
+    def get_message_size(attributes: dict, body: typing.Any) -> int:
+        """Calculate the size of message and attributes in the same way
+        as SQS counts it for the size limitation.
+        :type attributes: dict
+        :param attributes: message attributes
+        :type body: str or bytes-like object
+        :param body: message body
+        :rtype: int
+        :return: size in bytes
+        """
         total = 0
-        total += len(body)
+        total += len(body.encode() if isinstance(body, str) else body)
         for key, value in attributes.items():
             total += len(key.encode())
             total += (
@@ -189,7 +2363,12 @@ class SQSExtendedMessage(object):
                 # send_message occures error anyway
                 total += len(value['BinaryValue'])
 
-        return total > self.message_size_threshold
+        return total
+
+    def _is_message_larger(self, attributes: dict, body: str):
+        return (
+            self.get_message_size(attributes, body) >
+            self.message_size_threshold)
 
     def _parse_received_response(
         self, sqs_response: typing.Any
@@ -206,9 +2385,9 @@ class SQSExtendedMessage(object):
         if isinstance(sqs_response, dict):
             is_client = True
             messages = sqs_response.get('Messages', [])
-            metadata = copy.deepcopy(sqs_response)
-            if 'Messages' in sqs_response:
-                del metadata['Messages']
+            # messages are updated in place, and the others are shared
+            metadata = {
+                k: v for k, v in sqs_response.items() if k != 'Messages'}
 
         return is_client, messages, metadata
 
@@ -234,6 +2413,17 @@ class SQSExtendedMessage(object):
 
         return attributes, body, receipt_handle
 
+    def _get_message_id(self, is_client: bool, message: typing.Any) -> str:
+        """Return MessageId of the received message.
+        :type is_client: bool
+        :param is_client: True if the caller is client
+        :type message: any (dict or sqs.Message that depend on caller)
+        :param message: received message
+        :rtype: str
+        :return: MessageId
+        """
+        return message.get('MessageId') if is_client else message.message_id
+
     def _update_received_message(
         self, message: typing.Any, is_client: bool,
         attributes: typing.Optional[dict], body: str, receipt_handle: str,
@@ -252,41 +2442,105 @@ class SQSExtendedMessage(object):
         :rtype: (dict, str, str)
         :return: three values of attributes, body, and receipt handle
         """
-        # calculate md5 digest for both body and attributes
-        md5_of_body = hashlib.md5(body.encode()).hexdigest()
-        md5_of_message_attributes = self._md5attributes(attributes)
+        # messages kept in the queue as they are have MD5 given by SQS
+        original_attributes, original_body, _ = (
+            self._parse_received_message(is_client, message))
+        data = message if is_client else message.meta.data
+        md5_of_body = data.get('MD5OfBody')
+        # messages verified by S3 checksums don't need MD5 of body
+        verified = self._is_verified_by_checksum(
+            original_attributes, original_body)
+        if isinstance(body, LazyPayload):
+            # md5 of body is calculated when actual message is got
+            body.add_resolved_callback(functools.partial(
+                self._update_resolved_message, message, is_client,
+                verified=verified))
+            md5_of_body = None
+        else:
+            if body is not original_body:
+                md5_of_body = (
+                    self._md5_of_body(body) if not verified else None)
+            if self.raw_body and isinstance(body, str):
+                body = body.encode()
+        md5_of_message_attributes = data.get('MD5OfMessageAttributes')
+        if attributes is not original_attributes and self.calculate_md5:
+            md5_of_message_attributes = md5_of_attributes(attributes)
+        elif attributes is not original_attributes:
+            md5_of_message_attributes = None
 
         # update message with modified body and attributes
-        if is_client:
-            if attributes:
-                message['MessageAttributes'] = attributes
-                message['MD5OfMessageAttributes'] = md5_of_message_attributes
-            elif 'MessageAttributes' in message:
-                # in this case, message.attributes includes only our attribute
-                del message['MessageAttributes']
-                del message['MD5OfMessageAttributes']
-
-            message['Body'] = body
-            message['ReceiptHandle'] = receipt_handle
-            message['MD5OfBody'] = md5_of_body
+        if attributes:
+            data['MessageAttributes'] = attributes
+            self._set_digest(
+                data, 'MD5OfMessageAttributes', md5_of_message_attributes)
+        else:
+            # in this case, message.attributes includes only our attribute
+            data.pop('MessageAttributes', None)
+            data.pop('MD5OfMessageAttributes', None)
+
+        data['Body'] = body
+        # NOTE:
+        # attributes of class identifiers of sqs.Message are read-only.
+        # https://github.com/boto/boto3/blob/master/boto3/resources/factory.py#L284
+        # so that we have to take two receipt handles carefully on methods
+        # to use receipt handle, like delete_message
+        data['ReceiptHandle'] = receipt_handle
+        self._set_digest(data, 'MD5OfBody', md5_of_body)
+
+    @staticmethod
+    def _set_digest(
+            data: dict, name: str, digest: typing.Optional[str]) -> None:
+        """Set the digest into the message, or remove it if not calculated.
+        :type data: dict
+        :param data: received message (or meta.data of sqs.Message)
+        :type name: str
+        :param name: MD5OfBody or MD5OfMessageAttributes
+        :type digest: str
+        :param digest: hex digest (None to remove)
+        """
+        if digest is not None:
+            data[name] = digest
         else:
-            if attributes:
-                message.meta.data['MessageAttributes'] = attributes
-                message.meta.data['MD5OfMessageAttributes'] = (
-                    md5_of_message_attributes)
-            elif 'MessageAttributes' in message.meta.data:
-                # in this case, message.attributes includes only our attribute
-                del message.meta.data['MessageAttributes']
-                del message.meta.data['MD5OfMessageAttributes']
-
-            message.meta.data['Body'] = body
-            # NOTE:
-            # attributes of class identifiers are read-only.
-            # https://github.com/boto/boto3/blob/master/boto3/resources/factory.py#L284
-            # so that we have to take two receipt handles carefully on methods
-            # to use receipt handle, like delete_message
-            message.meta.data['ReceiptHandle'] = receipt_handle
-            message.meta.data['MD5OfBody'] = md5_of_body
+            data.pop(name, None)
+
+    def _update_resolved_message(
+        self, message: typing.Any, is_client: bool, body: str,
+        verified: bool = False,
+    ) -> None:
+        """Replace the lazy body of received message with actual message.
+        :type message: any (dict or sqs.Message that depend on caller)
+        :param message: received message to be updated
+        :type is_client: bool
+        :param is_client: True if the caller is client
+        :type body: str
+        :param body: actual message body
+        :type verified: bool
+        :param verified: True if the message is verified by S3 checksum,
+            and MD5 of body is not calculated
+        """
+        data = message if is_client else message.meta.data
+        data['Body'] = body
+        self._set_digest(
+            data, 'MD5OfBody',
+            self._md5_of_body(body) if not verified else None)
+
+    def _is_verified_by_checksum(
+            self, attributes: typing.Optional[dict], body: str) -> bool:
+        """Check whether the received message is got from S3 with
+        the full object checksum in its pointer, against which botocore
+        validates the body.
+        :type attributes: dict
+        :param attributes: original message attributes
+        :type body: str
+        :param body: original message body
+        :rtype: bool
+        :return: True if the pointer has the full object checksum
+        """
+        if not (attributes and attributes.get(
+                SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value)):
+            return False
+
+        return self._has_full_object_checksum(PayloadS3Pointer.fromJSON(body))
 
     def _is_extended_receipt_handle(self, receipt_handle: str) -> bool:
         """Check if the given receipt handle associates with extended message.
@@ -326,42 +2580,6 @@ class SQSExtendedMessage(object):
             (match.group(1), match.group(2), match.group(3))
             if match is not None else None)
 
-    def _md5attributes(self, attributes: dict) -> str:
-        """Calcuate md5 digest of message attributes.
-        Note that AWS SQS calculates it with big endian.
-        :type attributes: dict
-        :param attributes: sqs message attributes
-        :rtype: str
-        :return: md5 of the given message attributes
-        """
-        if not attributes or not isinstance(attributes, dict):
-            return None
-
-        seq = b''
-        items = sorted(attributes.items())
-        for k, v in items:
-            val = (
-                v['StringValue'].encode() if 'StringValue' in v else
-                v['BinaryValue'] if 'BinaryValue' in v else None)
-            if val is None:
-                # this case never happens when called by receive method
-                # because send method refuses to send the invalid attrs
-                logger.warn(f'thera are no supported attribute value in {k}')
-                continue
-
-            seq += len(k.encode()).to_bytes(4, 'big')
-            seq += k.encode()
-            seq += len(v['DataType'].encode()).to_bytes(4, 'big')
-            seq += v['DataType'].encode()
-            seq += (
-                bytes([1])
-                if v['DataType'] == 'String' or v['DataType'] == 'Number' else
-                bytes([2]))
-            seq += len(val).to_bytes(4, 'big')
-            seq += val
-
-        return hashlib.md5(seq).hexdigest()
-
     def _send_message_extended(self, func: typing.Callable) -> typing.Callable:
         """This method returns inner actual 'extended send method'
         to the client/resource event handler.
@@ -375,8 +2593,11 @@ class SQSExtendedMessage(object):
             If queue is the standard, the following arguments are required.
             :type QueueUrl: str
             :param QueueUrl: the url of queue (only for client, not resource)
-            :type MessageBody: str
-            :param MessageBody: message body
+            :type MessageBody: str, bytes-like object, file-like object,
+                or os.PathLike
+            :param MessageBody: message body. file-like objects and
+                file paths are always uploaded into S3 as streams, and
+                small bytes-like objects are sent with base64 encoding
             :rtype: any
             :return: depends on the original function.
 
@@ -394,11 +2615,9 @@ class SQSExtendedMessage(object):
             are checked by send_message.
             """
             attributes = kwargs.get('MessageAttributes', {})
-            if attributes.get(
-                    SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value):
-                raise ValueError(
-                    f'{SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value}'
-                    ' is reserved name')
+            reserved = self._find_reserved_attribute(attributes)
+            if reserved is not None:
+                raise ValueError(f'{reserved} is reserved name')
 
             body = kwargs.get('MessageBody', None)
             if body is None:
@@ -411,6 +2630,35 @@ class SQSExtendedMessage(object):
 
         return send_message_extended
 
+    def _add_reserved_attribute_names(self, kwargs: dict) -> None:
+        """Add the reserved attribute names to the arguments of
+        receive_message in place, which are needed to revert messages.
+        :type kwargs: dict
+        :param kwargs: keyword arguments of receive_message
+        """
+        # check attributes names that should be returned from queue
+        # and add necessary one
+        kwargs['AttributeNames'] = kwargs.get('AttributeNames', ['All'])
+        kwargs['MessageAttributeNames'] = kwargs.get(
+            'MessageAttributeNames', [])
+        if (not isinstance(kwargs['AttributeNames'], list) or
+                not isinstance(kwargs['MessageAttributeNames'], list)):
+            raise ValueError(
+                'AttributeNames or MessageAttributeNames must be list')
+
+        if not (
+            'All' in kwargs['MessageAttributeNames'] or
+            '.*' in kwargs['MessageAttributeNames']
+        ):
+            for name in (
+                    SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value,
+                    SQSExtendedConstants.
+                    RESERVED_ENCODING_ATTRIBUTE_NAME.value,
+                    SQSExtendedConstants.
+                    RESERVED_REFERENCE_ATTRIBUTE_NAME.value):
+                if name not in kwargs['MessageAttributeNames']:
+                    kwargs['MessageAttributeNames'].append(name)
+
     def _receive_message_extended(
             self, func: typing.Callable) -> typing.Callable:
         """This method returns inner actual 'extended receive method'
@@ -432,25 +2680,7 @@ class SQSExtendedMessage(object):
             For example, number of keys of MessageAttributes
             (should be less than 10) is checked by receive_message(s).
             """
-            # check attributes names that should be returned from queue
-            # and add necessary one
-            kwargs['AttributeNames'] = kwargs.get('AttributeNames', ['All'])
-            kwargs['MessageAttributeNames'] = kwargs.get(
-                'MessageAttributeNames', [])
-            if (not isinstance(kwargs['AttributeNames'], list) or
-                    not isinstance(kwargs['MessageAttributeNames'], list)):
-                raise ValueError(
-                    'AttributeNames or MessageAttributeNames must be list')
-
-            if not (
-                'All' in kwargs['MessageAttributeNames'] or
-                '.*' in kwargs['MessageAttributeNames']
-            ) and (
-                SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value not in
-                kwargs['MessageAttributeNames']
-            ):
-                kwargs['MessageAttributeNames'].append(
-                    SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value)
+            self._add_reserved_attribute_names(kwargs)
 
             # get message from queue
             response = func(*args, **kwargs)
@@ -458,16 +2688,8 @@ class SQSExtendedMessage(object):
                 response)
 
             # transform messages
-            for message in messages:
-                attributes, body, receipt_handle = (
-                    self._parse_received_message(is_client, message))
-
-                attributes, body, receipt_handle = (
-                    self._revert_attributes_and_message(
-                        attributes, body, receipt_handle))
-
-                self._update_received_message(
-                    message, is_client, attributes, body, receipt_handle)
+            self._revert_received_messages(
+                is_client, messages, kwargs.get('VisibilityTimeout'))
 
             # format response
             if is_client:
@@ -539,6 +2761,9 @@ class SQSExtendedMessage(object):
             If the amount size of message and attributes of each entry
             are larger than the threshold, this method puts original message
             onto S3 bucket and sends metadata as a message into the queue.
+            Any number of entries can be given. They are split into batches
+            under the SQS limitations and sent concurrently, and the results
+            are merged with the given Ids.
             When using client(), the following is required.
             :type QueueUrl: str
             :param QueueUrl: the url of queue (only for client, not resource)
@@ -569,25 +2794,76 @@ class SQSExtendedMessage(object):
             if not isinstance(entries, list):
                 raise ValueError('Entries (list) must be given')
 
-            for i, entry in enumerate(entries):
-                attributes = entry.get('MessageAttributes', {})
-                if attributes.get(
-                        SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value):
-                    raise ValueError(
-                        f'{SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value}'
-                        f' is reserved name, found in {i}')
-
-                body = entry.get('MessageBody')
-                if body is None:
-                    raise ValueError(f'message body is required, found in {i}')
+            uploads, batches, keep_order = self._prepare_batch_entries(
+                entries)
 
-                entry['MessageAttributes'], entry['MessageBody'] = (
-                    self._build_attributes_and_message(attributes, body))
+            # put all offloaded messages into S3 concurrently
+            failed = self._put_packed_messages_to_s3(entries, uploads)
 
-            return func(*args, **kwargs)
+            return self._call_batches(
+                func, args, kwargs, batches, failed, keep_order)
 
         return send_message_batch_extended
 
+    def _get_batch_entry_size_extended(self) -> typing.Callable:
+        """This method returns inner actual 'entry size method'
+        to the client event handler.
+        """
+
+        def get_batch_entry_size_extended(*args, **kwargs) -> int:
+            """Estimate the size of the message counted in the total size
+            of send_message_batch_extended. Messages which will be stored
+            in S3 are counted as their pointers.
+            This accepts the same arguments as an entry of
+            send_message_batch, like MessageBody and MessageAttributes.
+            :rtype: int
+            :return: size in bytes
+            """
+            if kwargs.get('MessageBody') is None:
+                raise ValueError('message body is required')
+
+            return self._get_batch_entry_size(kwargs)
+
+        return get_batch_entry_size_extended
+
+    def _find_extended_receipt_handles(
+            self, entries: typing.List[dict]) -> typing.Dict[int, str]:
+        """Find receipt handles of messages stored in S3 in batch entries.
+        :type entries: list
+        :param entries: entries of delete_message_batch
+        :rtype: dict
+        :return: extended receipt handles keyed by entry index
+        """
+        receipt_handles = {}
+        for i, entry in enumerate(entries):
+            receipt_handle = entry.get('ReceiptHandle')
+            if receipt_handle is None:
+                raise ValueError(f'missing ReceiptHandle, found {i}')
+
+            if self._is_extended_receipt_handle(receipt_handle):
+                receipt_handles[i] = receipt_handle
+
+        return receipt_handles
+
+    def _restore_receipt_handles(
+        self, entries: typing.List[dict],
+        receipt_handles: typing.Dict[int, str],
+        failed: typing.Dict[int, dict],
+    ) -> None:
+        """Replace extended receipt handles of batch entries in place
+        with the original ones except for failed entries.
+        :type entries: list
+        :param entries: entries of delete_message_batch
+        :type receipt_handles: dict
+        :param receipt_handles: extended receipt handles keyed by entry index
+        :type failed: dict
+        :param failed: failed results keyed by entry index
+        """
+        for i, receipt_handle in receipt_handles.items():
+            if i not in failed:
+                entries[i]['ReceiptHandle'] = (
+                    self._get_original_receipt_handle(receipt_handle))
+
     def _delete_message_batch_extended(
             self, func: typing.Callable) -> typing.Callable:
         """This method returns inner actual 'extended batch delete method'
@@ -613,21 +2889,165 @@ class SQSExtendedMessage(object):
             if not isinstance(entries, list):
                 raise ValueError('Entries (list) must be given')
 
-            for i, entry in enumerate(entries):
-                receipt_handle = entry.get('ReceiptHandle')
-                if receipt_handle is None:
-                    raise ValueError(f'missing ReceiptHandle, found {i}')
+            receipt_handles = self._find_extended_receipt_handles(entries)
+
+            # delete stored messages in bulk before deleting from queue
+            # messages whose stored one was not deleted are kept in the queue
+            # so that they can be received and deleted again
+            failed = self._delete_messages_from_s3(entries, receipt_handles)
+            self._restore_receipt_handles(entries, receipt_handles, failed)
+
+            return self._call_batch_wo_failed(func, args, kwargs, failed)
+
+        return delete_message_batch_extended
+
+    def _strip_receipt_handles(
+            self, entries: typing.List[dict]) -> typing.List[dict]:
+        """Return copies of batch entries whose extended receipt handles
+        are replaced with the original ones. Given entries are kept as
+        they are so that the extended ones can be deleted later.
+        :type entries: list
+        :param entries: entries of change_message_visibility_batch
+        :rtype: list
+        :return: entries with the original receipt handles
+        """
+        stripped = []
+        for i, entry in enumerate(entries):
+            receipt_handle = entry.get('ReceiptHandle')
+            if receipt_handle is None:
+                raise ValueError(f'missing ReceiptHandle, found {i}')
+
+            if self._is_extended_receipt_handle(receipt_handle):
+                entry = {
+                    **entry,
+                    'ReceiptHandle': self._get_original_receipt_handle(
+                        receipt_handle),
+                }
+            stripped.append(entry)
+
+        return stripped
 
+    def _change_message_visibility_extended(
+            self, func: typing.Callable) -> typing.Callable:
+        """This method returns inner actual 'extended change visibility
+        method' to the client/resource event handler.
+        """
+
+        def change_message_visibility_extended(*args, **kwargs) -> None:
+            """Change the visibility timeout of the received message.
+            The extended receipt handle is replaced with the original one
+            for SQS, and messages stored in S3 are kept as they are.
+            When using client ver method, the following arguments are required.
+            :type QueueUrl: str
+            :param QueueUrl: the url of queue (only for client, not resource)
+            :type ReceiptHandle: str
+            :param ReceiptHandle: handler associated with received message
+                (only for client, not resource)
+
+            Both client and resource ver require the following.
+            :type VisibilityTimeout: int
+            :param VisibilityTimeout: new timeout in seconds
+            """
+            # resource calls with the original receipt handle identifier
+            # of sqs.Message, and keeps the extended one in meta
+            if 'ReceiptHandle' in kwargs:
+                receipt_handle = kwargs['ReceiptHandle']
                 if self._is_extended_receipt_handle(receipt_handle):
-                    self._delete_message_from_s3(receipt_handle)
+                    kwargs['ReceiptHandle'] = (
+                        self._get_original_receipt_handle(receipt_handle))
+            elif len(args):
+                receipt_handle = args[0].meta.data.get(
+                    'ReceiptHandle', args[0].receipt_handle)
+            else:
+                raise ValueError('invalid call without ReceiptHandle')
 
-                    original = self._get_original_receipt_handle(
-                        receipt_handle)
-                    entry['ReceiptHandle'] = original
+            response = func(*args, **kwargs)
+            self._change_budget_holds(
+                [(receipt_handle, kwargs.get('VisibilityTimeout'))])
 
-            return func(*args, **kwargs)
+            return response
 
-        return delete_message_batch_extended
+        return change_message_visibility_extended
+
+    def _change_message_visibility_batch_extended(
+            self, func: typing.Callable) -> typing.Callable:
+        """This method returns inner actual 'extended batch change
+        visibility method' to the client/resource event handler.
+        """
+
+        def change_message_visibility_batch_extended(*args, **kwargs) -> dict:
+            """Change the visibility timeout of received messages.
+            Extended receipt handles are replaced with the original ones
+            for SQS, and given entries are not changed.
+            When using client ver method, the following arguments are required.
+            :type QueueUrl: str
+            :param QueueUrl: the url of queue (only for client, not resource)
+
+            Both client and resource ver require the following.
+            :type Entries: typing.List[dict]
+            :param Entries: list of `Id`, `ReceiptHandle`,
+                and `VisibilityTimeout`
+
+            :rtype: dict
+            :return: result of change_message_visibility_batch
+            """
+            entries = kwargs.get('Entries')
+            if not isinstance(entries, list):
+                raise ValueError('Entries (list) must be given')
+
+            kwargs['Entries'] = self._strip_receipt_handles(entries)
+
+            response = func(*args, **kwargs)
+            self._change_budget_holds(
+                self._changed_visibility_timeouts(entries, response))
+
+            return response
+
+        return change_message_visibility_batch_extended
+
+    def _changed_visibility_timeouts(
+        self, entries: typing.List[dict], response: typing.Any,
+    ) -> typing.List[typing.Tuple[str, typing.Any]]:
+        """Return visibility timeouts changed successfully.
+        :type entries: list
+        :param entries: entries of change_message_visibility_batch
+        :type response: dict
+        :param response: response of change_message_visibility_batch
+        :rtype: list
+        :return: pairs of receipt handle and new visibility timeout
+        """
+        succeeded = {
+            result.get('Id') for result in (response or {}).get(
+                'Successful', [])}
+        return [
+            (entry['ReceiptHandle'], entry.get('VisibilityTimeout'))
+            for entry in entries
+            if entry.get('Id') in succeeded and 'ReceiptHandle' in entry]
+
+    def _release_message_extended(self) -> typing.Callable:
+        """This method returns inner actual 'release method'
+        to the client event handler.
+        """
+
+        def release_message_extended(*args, **kwargs) -> int:
+            """Release the received message from byte_budget when it's
+            not processed anymore without being deleted, like when its
+            processing failed. Messages deleted or made visible again
+            by the extended methods are released automatically.
+            :type ReceiptHandle: str
+            :param ReceiptHandle: handler associated with received message
+            :rtype: int
+            :return: released size (0 without byte_budget)
+            """
+            receipt_handle = kwargs.get('ReceiptHandle')
+            if receipt_handle is None:
+                raise ValueError('invalid call without ReceiptHandle')
+            if self.byte_budget is None:
+                return 0
+
+            return self.byte_budget.release(receipt_handle)
+
+        return release_message_extended
 
     def add_send_message_extended(self, *args) -> typing.Callable:
         def add_custom_method(class_attributes: dict, **kwargs) -> None:
@@ -642,6 +3062,8 @@ class SQSExtendedMessage(object):
                 class_attributes['receive_message_extended'] = (
                     self._receive_message_extended(
                         class_attributes['receive_message']))
+                class_attributes['release_message_extended'] = (
+                    self._release_message_extended())
             elif event == 'creating-resource-class.sqs.Queue':
                 class_attributes['receive_messages_extended'] = (
                     self._receive_message_extended(
@@ -668,6 +3090,8 @@ class SQSExtendedMessage(object):
                 class_attributes['send_message_batch_extended'] = (
                     self._send_message_batch_extended(
                         class_attributes['send_message_batch']))
+                class_attributes['get_batch_entry_size_extended'] = (
+                    self._get_batch_entry_size_extended())
             elif event == 'creating-resource-class.sqs.Queue':
                 class_attributes['send_messages_extended'] = (
                     self._send_message_batch_extended(
@@ -687,3 +3111,33 @@ class SQSExtendedMessage(object):
                         class_attributes['delete_messages']))
 
         return add_custom_method
+
+    def add_change_message_visibility_extended(
+            self, event: str) -> typing.Callable:
+        def add_custom_method(class_attributes: dict, **kwargs) -> None:
+            if event == 'creating-client-class.sqs':
+                class_attributes['change_message_visibility_extended'] = (
+                    self._change_message_visibility_extended(
+                        class_attributes['change_message_visibility']))
+            elif event == 'creating-resource-class.sqs.Message':
+                class_attributes['change_visibility_extended'] = (
+                    self._change_message_visibility_extended(
+                        class_attributes['change_visibility']))
+
+        return add_custom_method
+
+    def add_change_message_visibility_batch_extended(
+            self, event: str) -> typing.Callable:
+        def add_custom_method(class_attributes: dict, **kwargs) -> None:
+            if event == 'creating-client-class.sqs':
+                class_attributes[
+                    'change_message_visibility_batch_extended'] = (
+                    self._change_message_visibility_batch_extended(
+                        class_attributes['change_message_visibility_batch']))
+            elif event == 'creating-resource-class.sqs.Queue':
+                class_attributes[
+                    'change_message_visibility_batch_extended'] = (
+                    self._change_message_visibility_batch_extended(
+                        class_attributes['change_message_visibility_batch']))
+
+        return add_custom_method
@@ -0,0 +1,182 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import contextlib
+import logging
+import threading
+import typing
+
+from .constants import SQSExtendedConstants
+
+logger = logging.getLogger(__name__)
+
+
+class VisibilityHeartbeat(object):
+    """Scheduler which extends the visibility timeout of in-flight
+    messages periodically while they are processed, so that long
+    processing, like of large messages stored in S3, doesn't let them
+    be received by other consumers.
+    All registered messages of each queue are extended together by
+    `change_message_visibility_batch_extended` every interval seconds,
+    which takes one call per 10 messages. Messages whose extension is
+    reported as failed, e.g. already deleted, are unregistered.
+    :type client: object
+    :param client: SQS client extended by SQSExtendedSession
+    :type visibility_timeout: int
+    :param visibility_timeout: new visibility timeout set every interval
+        (optional: by default, it's 30 seconds)
+    :type interval: float
+    :param interval: seconds between extensions
+        (optional: by default, it's the half of visibility_timeout)
+    """
+
+    def __init__(
+        self, client: typing.Any,
+        visibility_timeout: int = (
+            SQSExtendedConstants.DEFAULT_HEARTBEAT_VISIBILITY_TIMEOUT.value),
+        interval: typing.Optional[float] = None,
+    ) -> None:
+        if interval is None:
+            interval = visibility_timeout / 2
+        if not 0 < interval < visibility_timeout:
+            raise ValueError(
+                'interval must be positive and less than visibility_timeout')
+
+        self.client = client
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval
+        self._messages = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name='sqs-extended-heartbeat', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'VisibilityHeartbeat':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def add(self, queue_url: str, receipt_handle: str) -> None:
+        """Register the message to extend its visibility timeout.
+        :type queue_url: str
+        :param queue_url: URL of the queue
+        :type receipt_handle: str
+        :param receipt_handle: receipt handle of the received message,
+            which may be the extended one
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError('heartbeat was already closed')
+
+            self._messages.setdefault(queue_url, set()).add(receipt_handle)
+
+    def discard(self, queue_url: str, receipt_handle: str) -> None:
+        """Unregister the message, e.g. when it's processed.
+        :type queue_url: str
+        :param queue_url: URL of the queue
+        :type receipt_handle: str
+        :param receipt_handle: receipt handle given to add
+        """
+        with self._condition:
+            receipt_handles = self._messages.get(queue_url, set())
+            receipt_handles.discard(receipt_handle)
+            if not receipt_handles:
+                self._messages.pop(queue_url, None)
+
+    @contextlib.contextmanager
+    def keep(
+        self, queue_url: str, receipt_handle: str,
+    ) -> typing.Iterator[None]:
+        """Extend the visibility timeout of the message in the block.
+        :type queue_url: str
+        :param queue_url: URL of the queue
+        :type receipt_handle: str
+        :param receipt_handle: receipt handle of the received message
+        """
+        self.add(queue_url, receipt_handle)
+        try:
+            yield
+        finally:
+            self.discard(queue_url, receipt_handle)
+
+    def close(self) -> None:
+        """Stop extending visibility timeouts.
+        Registered messages become visible after the last extension.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+        self._thread.join()
+
+    def beat(self) -> None:
+        """Extend visibility timeouts of all registered messages now."""
+        with self._condition:
+            messages = {
+                url: sorted(receipt_handles)
+                for url, receipt_handles in self._messages.items()}
+
+        size = SQSExtendedConstants.MAX_BATCH_ENTRIES.value
+        for queue_url, receipt_handles in messages.items():
+            for i in range(0, len(receipt_handles), size):
+                self._change_visibility(
+                    queue_url, receipt_handles[i:i + size])
+
+    def _change_visibility(
+            self, queue_url: str, receipt_handles: typing.List[str]) -> None:
+        """Extend visibility timeouts of up to 10 messages, and unregister
+        ones reported as failed.
+        :type queue_url: str
+        :param queue_url: URL of the queue
+        :type receipt_handles: list
+        :param receipt_handles: receipt handles of messages
+        """
+        try:
+            res = self.client.change_message_visibility_batch_extended(
+                QueueUrl=queue_url, Entries=[{
+                    'Id': str(i), 'ReceiptHandle': receipt_handle,
+                    'VisibilityTimeout': self.visibility_timeout,
+                } for i, receipt_handle in enumerate(receipt_handles)])
+        except Exception as e:
+            # registered messages are tried again at the next interval
+            logger.warning(f'failed to extend visibility timeout: {e}')
+            return
+
+        for failed in res.get('Failed', []):
+            logger.warning(
+                'failed to extend visibility timeout: '
+                f"{failed.get('Code')}: {failed.get('Message')}")
+            self.discard(queue_url, receipt_handles[int(failed['Id'])])
+
+    def _run(self) -> None:
+        """Extend visibility timeouts every interval until closed."""
+        while True:
+            with self._condition:
+                self._condition.wait(self.interval)
+                if self._closed:
+                    return
+
+            self.beat()
@@ -0,0 +1,161 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import concurrent.futures
+import threading
+import typing
+
+
+class LazyPayload(object):
+    """Proxy of the message body stored in S3, which gets actual message
+    at the first access and caches it.
+    The proxy behaves as the actual message for the common operations,
+    like `str(body)`, `body == 'text'`, `len(body)`, and `body.encode()`,
+    but `resolve()` should be used to get the actual message itself, e.g.
+    for `json.loads`.
+    :type loader: callable
+    :param loader: function to get actual message
+    :type executor: concurrent.futures.Executor
+    :param executor: thread pool used by `prefetch`
+        (optional: by default, `prefetch` resolves in the current thread)
+    """
+
+    def __init__(
+        self, loader: typing.Callable[[], typing.Any],
+        executor: typing.Optional[concurrent.futures.Executor] = None,
+    ) -> None:
+        self._loader = loader
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._resolved = False
+        self._value = None
+
+    @property
+    def resolved(self) -> bool:
+        """True if actual message was already got."""
+        return self._resolved
+
+    def add_resolved_callback(
+            self, callback: typing.Callable[[typing.Any], None]) -> None:
+        """Add the function called with actual message when resolved.
+        If already resolved, the function is called immediately.
+        :type callback: callable
+        :param callback: function called with actual message
+        """
+        with self._lock:
+            if not self._resolved:
+                self._callbacks.append(callback)
+                return
+
+        callback(self._value)
+
+    def resolve(self) -> typing.Any:
+        """Get actual message at the first call, and return it.
+        Concurrent calls get the message only once.
+        :rtype: str
+        :return: actual message
+        """
+        with self._lock:
+            if not self._resolved:
+                self._value = self._loader()
+                self._resolved = True
+                callbacks, self._callbacks = self._callbacks, []
+            else:
+                callbacks = []
+
+        for callback in callbacks:
+            callback(self._value)
+
+        return self._value
+
+    def prefetch(self) -> concurrent.futures.Future:
+        """Start getting actual message on the thread pool.
+        :rtype: concurrent.futures.Future
+        :return: future of actual message
+        """
+        if self._executor is not None and not self._resolved:
+            return self._executor.submit(self.resolve)
+
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(self.resolve())
+        except Exception as e:
+            future.set_exception(e)
+
+        return future
+
+    def __str__(self) -> str:
+        return str(self.resolve())
+
+    def __repr__(self) -> str:
+        if self._resolved:
+            return repr(self._value)
+        return f'<{type(self).__name__} (unresolved)>'
+
+    def __eq__(self, other: typing.Any) -> bool:
+        if isinstance(other, LazyPayload):
+            other = other.resolve()
+        return self.resolve() == other
+
+    def __hash__(self) -> int:
+        return hash(self.resolve())
+
+    def __len__(self) -> int:
+        return len(self.resolve())
+
+    def __iter__(self) -> typing.Iterator:
+        return iter(self.resolve())
+
+    def __contains__(self, item: typing.Any) -> bool:
+        return item in self.resolve()
+
+    def __getitem__(self, key: typing.Any) -> typing.Any:
+        return self.resolve()[key]
+
+    def __getattr__(self, name: str) -> typing.Any:
+        # called only for attributes which the proxy doesn't have
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+
+def prefetch(messages: typing.Iterable[typing.Any]) -> None:
+    """Resolve bodies of the received messages concurrently.
+    Bodies which are not LazyPayload are ignored, and the first error
+    is raised after all bodies are tried.
+    :type messages: list
+    :param messages: received messages (dict of client, or sqs.Message)
+    """
+    futures = []
+    for message in messages:
+        body = (
+            message.get('Body') if isinstance(message, dict)
+            else message.meta.data.get('Body'))
+        if isinstance(body, LazyPayload):
+            futures.append(body.prefetch())
+
+    concurrent.futures.wait(futures)
+    for future in futures:
+        future.result()
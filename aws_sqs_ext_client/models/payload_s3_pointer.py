@@ -36,15 +36,40 @@ class PayloadS3Pointer(object):
     :param s3BucketName: s3 bucket name
     :type s3Key: str
     :param s3Key: s3 object key
+    :type s3Offset: int
+    :param s3Offset: start of the message in the object packing
+        multiple messages (optional)
+    :type s3Length: int
+    :param s3Length: length of the message in the object packing
+        multiple messages (optional)
+    :type s3ChecksumAlgorithm: str
+    :param s3ChecksumAlgorithm: algorithm of the checksum calculated by S3,
+        like 'SHA256' (optional)
+    :type s3Checksum: str
+    :param s3Checksum: base64 checksum of the stored object calculated
+        by S3 (optional)
     """
 
-    def __init__(self, bucket_name: str, key: str) -> None:
+    def __init__(
+        self, bucket_name: str, key: str,
+        offset: typing.Optional[int] = None,
+        length: typing.Optional[int] = None,
+        checksum_algorithm: typing.Optional[str] = None,
+        checksum: typing.Optional[str] = None,
+    ) -> None:
         self.s3BucketName = bucket_name
         self.s3Key = key
+        self.s3Offset = offset
+        self.s3Length = length
+        self.s3ChecksumAlgorithm = checksum_algorithm
+        self.s3Checksum = checksum
 
     def toJSON(self) -> str:
+        # optional fields are omitted for compatibility with other clients
         return json.dumps(
-            self, default=lambda o: o.__dict__, sort_keys=True)
+            self, default=lambda o: {
+                k: v for k, v in o.__dict__.items() if v is not None},
+            sort_keys=True)
 
     @classmethod
     def fromJSON(cls, serialized: str) -> typing.Optional['PayloadS3Pointer']:
@@ -63,4 +88,7 @@ class PayloadS3Pointer(object):
             raise ValueError(
                 'invalid json data. s3BucketName and s3Key must be keys')
 
-        return cls(data.get('s3BucketName'), data.get('s3Key'))
+        return cls(
+            data.get('s3BucketName'), data.get('s3Key'),
+            data.get('s3Offset'), data.get('s3Length'),
+            data.get('s3ChecksumAlgorithm'), data.get('s3Checksum'))
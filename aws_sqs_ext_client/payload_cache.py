@@ -0,0 +1,246 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import typing
+
+from .constants import SQSExtendedConstants
+
+logger = logging.getLogger(__name__)
+
+
+class PayloadCache(object):
+    """LRU cache of objects got from S3 keyed by bucket and key, so that
+    redelivered messages are not downloaded again.
+    Objects are kept in memory up to max_bytes, and the least recently
+    used ones are moved into the directory if given, which keeps them
+    up to max_disk_bytes. Cached objects are invalidated when the
+    messages are deleted by the extended methods.
+    :type max_bytes: int
+    :param max_bytes: max total size of objects kept in memory
+        (optional: default value is 64 MB)
+    :type directory: str
+    :param directory: directory to keep objects evicted from memory
+        (optional: by default, they are discarded)
+    :type max_disk_bytes: int
+    :param max_disk_bytes: max total size of objects kept in the directory
+        (optional: default value is 1 GB)
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = (
+            SQSExtendedConstants.DEFAULT_PAYLOAD_CACHE_SIZE.value),
+        directory: typing.Optional[str] = None,
+        max_disk_bytes: int = (
+            SQSExtendedConstants.DEFAULT_PAYLOAD_DISK_CACHE_SIZE.value),
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._disk = collections.OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._memory) + len(self._disk)
+
+    def stats(self) -> dict:
+        """Return counters and sizes of the cache.
+        :rtype: dict
+        :return: hits, misses, and the number and the total size of
+            objects in memory and in the directory
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_items': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_items': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+            }
+
+    def get(
+        self, bucket: str, key: str,
+    ) -> typing.Optional[typing.Tuple[bytes, dict]]:
+        """Get the cached object, and mark it as recently used.
+        Objects in the directory are moved into memory.
+        :type bucket: str
+        :param bucket: bucket name
+        :type key: str
+        :param key: object key
+        :rtype: tuple
+        :return: tuple of object data and metadata (None if not cached)
+        """
+        with self._lock:
+            cached = self._memory.get((bucket, key))
+            if cached is not None:
+                self._memory.move_to_end((bucket, key))
+                self.hits += 1
+                return cached
+
+            cached = self._pop_from_disk((bucket, key))
+            if cached is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._store(bucket, key, *cached)
+            return cached
+
+    def put(self, bucket: str, key: str, data: bytes, metadata: dict) -> None:
+        """Cache the object got from S3.
+        :type bucket: str
+        :param bucket: bucket name
+        :type key: str
+        :param key: object key
+        :type data: bytes
+        :param data: object data
+        :type metadata: dict
+        :param metadata: object metadata
+        """
+        with self._lock:
+            self._remove((bucket, key))
+            self._store(bucket, key, data, metadata)
+
+    def invalidate(self, bucket: str, key: str) -> None:
+        """Remove the cached object.
+        :type bucket: str
+        :param bucket: bucket name
+        :type key: str
+        :param key: object key
+        """
+        with self._lock:
+            self._remove((bucket, key))
+
+    def clear(self) -> None:
+        """Remove all cached objects. Counters are kept."""
+        with self._lock:
+            for name in list(self._memory) + list(self._disk):
+                self._remove(name)
+
+    def _store(
+            self, bucket: str, key: str, data: bytes, metadata: dict) -> None:
+        """Keep the object in memory, and evict the least recently used
+        ones exceeding max_bytes. The lock must be held.
+        """
+        name = (bucket, key)
+        if len(data) > self.max_bytes:
+            self._write_to_disk(name, data, metadata)
+            return
+
+        self._memory[name] = (data, metadata)
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            evicted, (data, metadata) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            self._write_to_disk(evicted, data, metadata)
+
+    def _remove(self, name: typing.Tuple[str, str]) -> None:
+        """Remove the object from memory and the directory.
+        The lock must be held.
+        """
+        cached = self._memory.pop(name, None)
+        if cached is not None:
+            self._memory_bytes -= len(cached[0])
+
+        size = self._disk.pop(name, None)
+        if size is not None:
+            self._disk_bytes -= size
+            self._unlink(name)
+
+    def _path(self, name: typing.Tuple[str, str]) -> str:
+        """Return the path of the file keeping the object."""
+        digest = hashlib.sha256('/'.join(name).encode()).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def _write_to_disk(
+        self, name: typing.Tuple[str, str], data: bytes, metadata: dict,
+    ) -> None:
+        """Write the object evicted from memory into the directory,
+        and evict the least recently used ones exceeding max_disk_bytes.
+        The object is discarded without the directory or on errors.
+        The lock must be held.
+        """
+        if self.directory is None or len(data) > self.max_disk_bytes:
+            return
+
+        try:
+            # the first line is the metadata, and the rest is the data
+            with open(self._path(name), 'wb') as f:
+                f.write(json.dumps(metadata).encode() + b'\n')
+                f.write(data)
+        except OSError as e:
+            logger.warning(f'failed to cache {name[1]} on disk: {e}')
+            return
+
+        self._disk[name] = len(data)
+        self._disk_bytes += len(data)
+        while self._disk_bytes > self.max_disk_bytes:
+            evicted, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._unlink(evicted)
+
+    def _pop_from_disk(
+        self, name: typing.Tuple[str, str],
+    ) -> typing.Optional[typing.Tuple[bytes, dict]]:
+        """Read the object from the directory and remove it.
+        The lock must be held.
+        """
+        size = self._disk.pop(name, None)
+        if size is None:
+            return None
+
+        self._disk_bytes -= size
+        try:
+            with open(self._path(name), 'rb') as f:
+                metadata = json.loads(f.readline())
+                data = f.read()
+        except (OSError, ValueError) as e:
+            logger.warning(f'failed to read {name[1]} cached on disk: {e}')
+            return None
+        finally:
+            self._unlink(name)
+
+        return data, metadata
+
+    def _unlink(self, name: typing.Tuple[str, str]) -> None:
+        """Delete the file keeping the object if exists."""
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
@@ -50,6 +50,7 @@ class SQSExtendedSession(boto3.session.Session):
         message_size_threshold: int = (
             SQSExtendedConstants.DEFAULT_MESSAGE_SIZE_THRESHOLD.value),
         s3_bucket_params: Optional[dict] = {'ACL': 'private'},
+        **kwargs,
     ) -> None:
         """Initialize the SQS extended messaging.
         This method craetes S3 bucket if not exists, initializes a class for
@@ -71,6 +72,8 @@ class SQSExtendedSession(boto3.session.Session):
             you should create a bucket with some options, like the specific
             finite object lifecycle configured by
             `put_bucket_lifecycle_configuration`.
+        :param kwargs: other options of SQSExtendedMessage, like
+            `max_workers` to put/get messages on S3 concurrently
         """
         # create S3 bucket if needed
         if s3_bucket_params is not None:
@@ -90,7 +93,8 @@ class SQSExtendedSession(boto3.session.Session):
 
         # initialize sqs extention
         sqs = SQSExtendedMessage(
-            self, s3_bucket_name, always_through_s3, message_size_threshold)
+            self, s3_bucket_name, always_through_s3, message_size_threshold,
+            **kwargs)
         self.events.register(
             'creating-client-class.sqs',
             sqs.add_send_message_extended('creating-client-class.sqs')
@@ -111,6 +115,16 @@ class SQSExtendedSession(boto3.session.Session):
             'creating-client-class.sqs',
             sqs.add_delete_message_batch_extended('creating-client-class.sqs')
         )
+        self.events.register(
+            'creating-client-class.sqs',
+            sqs.add_change_message_visibility_extended(
+                'creating-client-class.sqs')
+        )
+        self.events.register(
+            'creating-client-class.sqs',
+            sqs.add_change_message_visibility_batch_extended(
+                'creating-client-class.sqs')
+        )
 
         self.events.register(
             'creating-resource-class.sqs.Queue',
@@ -136,3 +150,13 @@ class SQSExtendedSession(boto3.session.Session):
             sqs.add_delete_message_batch_extended(
                 'creating-resource-class.sqs.Queue')
         )
+        self.events.register(
+            'creating-resource-class.sqs.Message',
+            sqs.add_change_message_visibility_extended(
+                'creating-resource-class.sqs.Message')
+        )
+        self.events.register(
+            'creating-resource-class.sqs.Queue',
+            sqs.add_change_message_visibility_batch_extended(
+                'creating-resource-class.sqs.Queue')
+        )
@@ -0,0 +1,87 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import io
+import typing
+
+
+class MemoryViewReader(io.RawIOBase):
+    """Seekable file-like object over bytes-like object without copying it,
+    unlike io.BytesIO which copies bytearray and memoryview.
+    :type data: bytes, bytearray, or memoryview
+    :param data: data to be read
+    """
+
+    def __init__(self, data: typing.Union[bytes, bytearray, memoryview]):
+        super().__init__()
+        self._view = memoryview(data).cast('B')
+        self._position = 0
+
+    def __len__(self) -> int:
+        return self._view.nbytes
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: typing.Any) -> int:
+        size = min(len(buffer), self._view.nbytes - self._position)
+        if size <= 0:
+            return 0
+
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+
+        return size
+
+    def read(self, size: int = -1) -> bytes:
+        end = (
+            self._view.nbytes if size is None or size < 0
+            else min(self._position + size, self._view.nbytes))
+        data = self._view[self._position:end].tobytes()
+        self._position = max(end, self._position)
+
+        return data
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._view.nbytes + offset
+        else:
+            raise ValueError(f'invalid whence: {whence}')
+
+        if position < 0:
+            raise ValueError(f'negative seek position: {position}')
+
+        self._position = position
+
+        return position
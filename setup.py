@@ -37,6 +37,9 @@ requires = ['boto3~=1.26']
 extras_requires = {
     'dev': ['flake8', 'autopep8'],
     'test': ['pytest', 'pytest-cov', 'moto[all]'],
+    'zstd': ['zstandard'],
+    'lz4': ['lz4'],
+    'async': ['aiobotocore'],
 }
 
 with open(os.path.join(
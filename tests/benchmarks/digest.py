@@ -0,0 +1,129 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# micro-benchmark of MD5 calculated for received messages.
+# this compares the digest engine with the original way, which encoded
+# the whole body and concatenated attribute fields into immutable bytes,
+# changing the body size and the number and the size of attributes.
+# the original _md5attributes is copied as it was before the engine.
+#
+# python tests/benchmarks/digest.py
+import hashlib
+import logging
+import sys
+import timeit
+
+sys.path.append('./')
+from aws_sqs_ext_client.digest import (  # noqa: E402
+    md5_of_attributes, md5_of_body)
+
+BODY_SIZES = [2**10, 2**16, 2**20, 2**24]
+ATTRIBUTES = [(1, 2**4), (10, 2**4), (10, 2**12), (10, 2**16)]
+REPEAT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def original_md5attributes(self, attributes: dict) -> str:
+    """Calcuate md5 digest of message attributes.
+    Note that AWS SQS calculates it with big endian.
+    :type attributes: dict
+    :param attributes: sqs message attributes
+    :rtype: str
+    :return: md5 of the given message attributes
+    """
+    if not attributes or not isinstance(attributes, dict):
+        return None
+
+    seq = b''
+    items = sorted(attributes.items())
+    for k, v in items:
+        val = (
+            v['StringValue'].encode() if 'StringValue' in v else
+            v['BinaryValue'] if 'BinaryValue' in v else None)
+        if val is None:
+            # this case never happens when called by receive method
+            # because send method refuses to send the invalid attrs
+            logger.warn(f'thera are no supported attribute value in {k}')
+            continue
+
+        seq += len(k.encode()).to_bytes(4, 'big')
+        seq += k.encode()
+        seq += len(v['DataType'].encode()).to_bytes(4, 'big')
+        seq += v['DataType'].encode()
+        seq += (
+            bytes([1])
+            if v['DataType'] == 'String' or v['DataType'] == 'Number' else
+            bytes([2]))
+        seq += len(val).to_bytes(4, 'big')
+        seq += val
+
+    return hashlib.md5(seq).hexdigest()
+
+
+def best(func, number):
+    return min(timeit.repeat(func, number=number, repeat=REPEAT)) / number
+
+
+def bench_body(size):
+    body = 'x' * size
+    number = max(2**26 // size, 1)
+    return (
+        best(lambda: hashlib.md5(body.encode()).hexdigest(), number),
+        best(lambda: md5_of_body(body), number))
+
+
+def bench_attributes(count, size):
+    attributes = {
+        f'attr{i}': (
+            {'StringValue': 'x' * size, 'DataType': 'String'} if i % 2
+            else {'BinaryValue': b'x' * size, 'DataType': 'Binary'})
+        for i in range(count)}
+    assert original_md5attributes(None, attributes) == (
+        md5_of_attributes(attributes))
+    number = max(2**22 // (count * size), 10)
+    return (
+        best(lambda: original_md5attributes(None, attributes), number),
+        best(lambda: md5_of_attributes(attributes), number))
+
+
+def usec(seconds):
+    return f'{seconds * 1e6:,.1f}'
+
+
+if __name__ == '__main__':
+    print(f'{"body size":>24} {"encode (us)":>14} {"chunked (us)":>14}')
+    for size in BODY_SIZES:
+        before, after = bench_body(size)
+        print(f'{size:>24,} {usec(before):>14} {usec(after):>14}')
+
+    print()
+    print(
+        f'{"attributes x size":>24} {"original (us)":>14} '
+        f'{"buffer (us)":>14}')
+    for count, size in ATTRIBUTES:
+        before, after = bench_attributes(count, size)
+        print(
+            f'{f"{count} x {size:,}":>24} '
+            f'{usec(before):>14} {usec(after):>14}')
@@ -0,0 +1,125 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# memory benchmark of receive_message_extended.
+# this measures the peak allocation by tracemalloc while 10 messages are
+# reverted, changing the size of their attributes and the response metadata.
+# messages kept in the queue and ones stored in S3 are measured separately,
+# and S3 is stubbed to return a small stored message without the network.
+# the peak should be flat because messages are updated in place and
+# attributes are shallow-copied.
+#
+# python tests/benchmarks/receive_memory.py
+import hashlib
+import io
+import sys
+import tracemalloc
+import types
+
+import boto3
+
+sys.path.append('./')
+from aws_sqs_ext_client.constants import SQSExtendedConstants  # noqa: E402
+from aws_sqs_ext_client.extended_messaging import (  # noqa: E402
+    SQSExtendedMessage)
+from aws_sqs_ext_client.models.payload_s3_pointer import (  # noqa: E402
+    PayloadS3Pointer)
+
+MESSAGES = 10
+SIZES = [2**10, 2**14, 2**18, 2**20]
+
+
+STORED = b'stored text'
+
+
+class StubS3Client(object):
+    """S3 client returning the stored message for any key."""
+
+    def get_object(self, **kwargs):
+        return {'Body': io.BytesIO(STORED), 'Metadata': {}}
+
+
+def mkmessage(i, blob, offloaded):
+    attributes = {
+        'binary_attr': {'BinaryValue': blob, 'DataType': 'Binary'},
+    }
+    body = 'small text'
+    if offloaded:
+        attributes[SQSExtendedConstants.RESERVED_ATTRIBUTE_NAME.value] = {
+            'StringValue': str(len(STORED)), 'DataType': 'Number'}
+        body = PayloadS3Pointer('bucket', f'key-{i}').toJSON()
+
+    return {
+        'MessageId': str(i),
+        'ReceiptHandle': f'receipt-handle-{i}',
+        'MD5OfBody': hashlib.md5(body.encode()).hexdigest(),
+        'Body': body,
+        'MessageAttributes': attributes,
+    }
+
+
+def mkresponse(size, offloaded):
+    blob = b'x' * size
+    return {
+        'Messages': [
+            mkmessage(i, blob, offloaded) for i in range(MESSAGES)],
+        'ResponseMetadata': {
+            'RequestId': 'request-id',
+            'HTTPHeaders': {'x-large-header': blob},
+        },
+    }
+
+
+def measure(sqs, size, offloaded):
+    response = mkresponse(size, offloaded)
+    attributes = {'receive_message': lambda **kwargs: response}
+    sqs.add_receive_message_extended('creating-client-class.sqs')(
+        class_attributes=attributes)
+
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    res = attributes['receive_message_extended'](QueueUrl='queue')
+    peak = tracemalloc.get_traced_memory()[1] - base
+    assert len(res['Messages']) == MESSAGES
+    if offloaded:
+        assert {m['Body'] for m in res['Messages']} == {STORED.decode()}
+
+    return peak
+
+
+if __name__ == '__main__':
+    session = boto3.session.Session(region_name='us-east-1')
+    sqs = SQSExtendedMessage(session, 'bucket')
+    sqs.s3 = types.SimpleNamespace(
+        meta=types.SimpleNamespace(client=StubS3Client()))
+    # start the threads before measuring
+    measure(sqs, 0, True)
+
+    tracemalloc.start()
+    print(f'{"attribute size":>16} {"peak (queue)":>16} {"peak (S3)":>16}')
+    for size in SIZES:
+        print(
+            f'{size:>16,} {measure(sqs, size, False):>16,} '
+            f'{measure(sqs, size, True):>16,}')
+    tracemalloc.stop()
@@ -0,0 +1,90 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import concurrent.futures
+
+import pytest
+from aws_sqs_ext_client.models.lazy_payload import LazyPayload, prefetch
+
+
+def test_lazy_payload():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return '{"message": "text"}'
+
+    payload = LazyPayload(loader)
+    assert not payload.resolved
+    assert repr(payload) == '<LazyPayload (unresolved)>'
+    assert calls == []
+
+    assert payload == '{"message": "text"}'
+    assert payload.resolved
+    assert str(payload) == '{"message": "text"}'
+    assert len(payload) == 19
+    assert 'message' in payload
+    assert payload[2:9] == 'message'
+    assert payload.encode() == b'{"message": "text"}'
+    assert payload == LazyPayload(lambda: '{"message": "text"}')
+    assert calls == [1]
+
+
+def test_lazy_payload_w_callback():
+    resolved = []
+    payload = LazyPayload(lambda: 'text')
+    payload.add_resolved_callback(resolved.append)
+    assert resolved == []
+
+    assert payload.resolve() == 'text'
+    assert payload.resolve() == 'text'
+    assert resolved == ['text']
+
+    # called immediately after resolved
+    payload.add_resolved_callback(resolved.append)
+    assert resolved == ['text', 'text']
+
+
+def test_lazy_payload_w_error():
+    def loader():
+        raise ValueError('failed')
+
+    payload = LazyPayload(loader)
+    with pytest.raises(ValueError):
+        payload.resolve()
+    assert not payload.resolved
+
+
+def test_prefetch():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        messages = [
+            {'Body': LazyPayload(lambda: 'text1', executor)},
+            {'Body': 'text2'},
+            {'Body': LazyPayload(lambda: 'text3')},
+        ]
+        prefetch(messages)
+
+    assert messages[0]['Body'].resolved
+    assert messages[2]['Body'].resolved
+    assert [str(m['Body']) for m in messages] == ['text1', 'text2', 'text3']
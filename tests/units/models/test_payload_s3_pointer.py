@@ -42,6 +42,28 @@ class TestPayloadS3Pointer(object):
         assert poi.s3BucketName == 'bucket'
         assert poi.s3Key == 'key'
 
+    def test_toJSON_w_range(self):
+        poi = PayloadS3Pointer('bucket', 'key', 10, 20)
+        assert poi.toJSON() == (
+            '{"s3BucketName": "bucket", "s3Key": "key", '
+            '"s3Length": 20, "s3Offset": 10}')
+
+        poi = PayloadS3Pointer.fromJSON(poi.toJSON())
+        assert poi.s3Offset == 10
+        assert poi.s3Length == 20
+
+    def test_toJSON_w_checksum(self):
+        poi = PayloadS3Pointer(
+            'bucket', 'key', checksum_algorithm='SHA256', checksum='abc=')
+        assert poi.toJSON() == (
+            '{"s3BucketName": "bucket", "s3Checksum": "abc=", '
+            '"s3ChecksumAlgorithm": "SHA256", "s3Key": "key"}')
+
+        poi = PayloadS3Pointer.fromJSON(poi.toJSON())
+        assert poi.s3ChecksumAlgorithm == 'SHA256'
+        assert poi.s3Checksum == 'abc='
+        assert poi.s3Offset is None
+
     def test_fromJSON_w_pointer(self):
         poi = PayloadS3Pointer.fromJSON(
             '["software.amazon.payloadoffloading.PayloadS3Pointer",'
@@ -0,0 +1,482 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+from aws_sqs_ext_client.async_extended_messaging import (
+    AsyncSQSExtendedMessage, extend_sqs)
+from aws_sqs_ext_client.byte_budget import ByteBudget
+from aws_sqs_ext_client.digest import DigestSpooledFile
+
+
+class AsyncBody(object):
+    """Streaming body of aiobotocore, whose read is a coroutine."""
+
+    def __init__(self, body):
+        self.body = body
+
+    async def read(self, amt=None):
+        return self.body.read(amt)
+
+
+class AsyncClient(object):
+    """Client like aiobotocore wrapping the mocked boto3 client."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            res = method(*args, **kwargs)
+            if isinstance(res, dict) and 'Body' in res:
+                res['Body'] = AsyncBody(res['Body'])
+            return res
+
+        return call
+
+
+class Session(object):
+    """Session like aiobotocore to register handlers."""
+
+    def __init__(self):
+        self.handlers = []
+
+    def register(self, event, handler):
+        self.handlers.append((event, handler))
+
+    def create_client(self, client):
+        class_attributes = {
+            name: getattr(AsyncClient(client), name) for name in (
+                'send_message', 'receive_message', 'delete_message',
+                'send_message_batch', 'delete_message_batch',
+                'change_message_visibility',
+                'change_message_visibility_batch')}
+        for _, handler in self.handlers:
+            handler(class_attributes=class_attributes)
+        return type('AsyncSQS', (object,), class_attributes)
+
+
+@pytest.fixture
+def async_sqs(s3_bucket, s3_client, sqs_client, bucket_name):
+    session = Session()
+    sqs = extend_sqs(session, AsyncClient(s3_client), bucket_name)
+    assert isinstance(sqs, AsyncSQSExtendedMessage)
+    return session.create_client(sqs_client)
+
+
+def test_async_extended_messaging(
+        async_sqs, sqs_client, sqs_client_queue, s3_client, bucket_name,
+        big_message):
+    queue_url = sqs_client_queue['QueueUrl']
+
+    async def run():
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody=big_message)
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody='small')
+        return await async_sqs.receive_message_extended(
+            QueueUrl=queue_url, MaxNumberOfMessages=10)
+
+    res = asyncio.run(run())
+    bodies = sorted(m['Body'] for m in res['Messages'])
+    assert bodies == sorted([big_message, 'small'])
+    for m in res['Messages']:
+        assert m['MD5OfBody'] == hashlib.md5(m['Body'].encode()).hexdigest()
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 1
+
+    async def delete():
+        for m in res['Messages']:
+            await async_sqs.delete_message_extended(
+                QueueUrl=queue_url, ReceiptHandle=m['ReceiptHandle'])
+
+    asyncio.run(delete())
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
+    res = sqs_client.receive_message(QueueUrl=queue_url)
+    assert 'Messages' not in res
+
+
+def test_async_extended_messaging_batch(
+        async_sqs, sqs_client, sqs_client_queue, s3_client, bucket_name,
+        big_message):
+    queue_url = sqs_client_queue['QueueUrl']
+
+    async def run():
+        res = await async_sqs.send_message_batch_extended(
+            QueueUrl=queue_url, Entries=[
+                {'Id': str(i), 'MessageBody': big_message}
+                for i in range(3)])
+        assert [r['Id'] for r in res['Successful']] == ['0', '1', '2']
+
+        res = await async_sqs.receive_message_extended(
+            QueueUrl=queue_url, MaxNumberOfMessages=10)
+        assert [m['Body'] for m in res['Messages']] == [big_message] * 3
+        return await async_sqs.delete_message_batch_extended(
+            QueueUrl=queue_url, Entries=[
+                {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+                for i, m in enumerate(res['Messages'])])
+
+    res = asyncio.run(run())
+    assert len(res['Successful']) == 3
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
+
+
+def test_async_compatible_with_sync(
+        async_sqs, sqs_client, sqs_client_queue, sqs_extended_message,
+        big_message):
+    queue_url = sqs_client_queue['QueueUrl']
+    attributes = {'receive_message': sqs_client.receive_message}
+    sqs_extended_message.add_receive_message_extended(
+        'creating-client-class.sqs')(class_attributes=attributes)
+
+    asyncio.run(async_sqs.send_message_extended(
+        QueueUrl=queue_url, MessageBody=big_message))
+    res = attributes['receive_message_extended'](QueueUrl=queue_url)
+    assert res['Messages'][0]['Body'] == big_message
+    assert res['Messages'][0]['ReceiptHandle'].startswith(
+        '-..s3BucketName..-')
+
+
+def test_async_multipart_upload_and_ranged_download(
+        s3_bucket, session, region, sqs_client, sqs_client_queue,
+        bucket_name, monkeypatch):
+    # moto stores aws-chunked parts of upload_part with checksum trailers
+    # as they are, so that disable the default checksum calculation
+    monkeypatch.setenv('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')
+    s3_client = session.client('s3', region_name=region)
+    aio_session = Session()
+    extend_sqs(
+        aio_session, AsyncClient(s3_client), bucket_name,
+        multipart_threshold=5 * 2**20, multipart_chunksize=5 * 2**20,
+        download_threshold=2**20, download_part_size=2**20)
+    async_sqs = aio_session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+    body = json.dumps({'data': 'x' * (11 * 2**20)})
+
+    async def run():
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody=io.BytesIO(body.encode()))
+        return await async_sqs.receive_message_extended(QueueUrl=queue_url)
+
+    res = asyncio.run(run())
+    assert res['Messages'][0]['Body'] == body
+
+
+def test_async_lazy_payload_not_supported(s3_client, bucket_name):
+    with pytest.raises(ValueError):
+        AsyncSQSExtendedMessage(
+            AsyncClient(s3_client), bucket_name, lazy_payload=True)
+
+
+def test_async_content_addressed(
+        s3_bucket, s3_client, sqs_client, sqs_client_queue, bucket_name,
+        big_message):
+    session = Session()
+    extend_sqs(
+        session, AsyncClient(s3_client), bucket_name, content_addressed=True)
+    async_sqs = session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+
+    async def run():
+        await async_sqs.send_message_batch_extended(
+            QueueUrl=queue_url, Entries=[
+                {'Id': str(i), 'MessageBody': big_message}
+                for i in range(2)])
+        res = s3_client.list_objects_v2(Bucket=bucket_name)
+        assert res['KeyCount'] == 3
+
+        res = await async_sqs.receive_message_extended(
+            QueueUrl=queue_url, MaxNumberOfMessages=10)
+        assert [m['Body'] for m in res['Messages']] == [big_message] * 2
+        await async_sqs.delete_message_extended(
+            QueueUrl=queue_url,
+            ReceiptHandle=res['Messages'][0]['ReceiptHandle'])
+        assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 2
+        await async_sqs.delete_message_batch_extended(
+            QueueUrl=queue_url, Entries=[{
+                'Id': '0',
+                'ReceiptHandle': res['Messages'][1]['ReceiptHandle']}])
+
+    asyncio.run(run())
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
+
+
+def test_async_pack_batch(
+        s3_bucket, s3_client, sqs_client, sqs_client_queue, bucket_name,
+        big_message):
+    session = Session()
+    extend_sqs(session, AsyncClient(s3_client), bucket_name, pack_batch=True)
+    async_sqs = session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+
+    async def run():
+        await async_sqs.send_message_batch_extended(
+            QueueUrl=queue_url, Entries=[
+                {'Id': str(i), 'MessageBody': big_message}
+                for i in range(3)])
+        assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 1
+
+        res = await async_sqs.receive_message_extended(
+            QueueUrl=queue_url, MaxNumberOfMessages=10)
+        assert [m['Body'] for m in res['Messages']] == [big_message] * 3
+        await async_sqs.delete_message_extended(
+            QueueUrl=queue_url,
+            ReceiptHandle=res['Messages'][0]['ReceiptHandle'])
+        assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 2
+        await async_sqs.delete_message_batch_extended(
+            QueueUrl=queue_url, Entries=[
+                {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+                for i, m in enumerate(res['Messages'][1:])])
+
+    asyncio.run(run())
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
+
+
+def test_async_spool(
+        s3_bucket, s3_client, sqs_client, sqs_client_queue, bucket_name,
+        big_message):
+    session = Session()
+    extend_sqs(
+        session, AsyncClient(s3_client), bucket_name, compression='gzip',
+        spool_threshold=2**10, download_part_size=2**12)
+    async_sqs = session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+
+    async def run():
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody=io.BytesIO(big_message.encode()))
+        res = s3_client.list_objects_v2(Bucket=bucket_name)
+        assert res['Contents'][0]['Size'] < len(big_message)
+
+        res = await async_sqs.receive_message_extended(QueueUrl=queue_url)
+        with res['Messages'][0]['Body'] as body:
+            assert body.read() == big_message.encode()
+        await async_sqs.delete_message_extended(
+            QueueUrl=queue_url,
+            ReceiptHandle=res['Messages'][0]['ReceiptHandle'])
+
+    asyncio.run(run())
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
+
+
+def test_async_s3_checksum(
+        s3_bucket, s3_client, sqs_client, sqs_client_queue, bucket_name,
+        big_message, monkeypatch):
+    session = Session()
+    extend_sqs(
+        session, AsyncClient(s3_client), bucket_name,
+        s3_checksum_algorithm='SHA1')
+    async_sqs = session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+    checksum = base64.b64encode(
+        hashlib.sha1(big_message.encode()).digest()).decode()
+    get_object = s3_client.get_object
+    monkeypatch.setattr(s3_client, 'get_object', lambda **kwargs: {
+        **get_object(**kwargs), 'ChecksumSHA1': checksum})
+
+    async def run():
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody=big_message)
+        res = await async_sqs.receive_message_extended(QueueUrl=queue_url)
+        assert res['Messages'][0]['Body'] == big_message
+        assert 'MD5OfBody' not in res['Messages'][0]
+
+    asyncio.run(run())
+
+
+def test_async_change_message_visibility(
+        async_sqs, sqs_client_queue, s3_client, bucket_name, big_message):
+    queue_url = sqs_client_queue['QueueUrl']
+
+    async def run():
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody=big_message)
+        res = await async_sqs.receive_message_extended(QueueUrl=queue_url)
+        receipt_handle = res['Messages'][0]['ReceiptHandle']
+        await async_sqs.change_message_visibility_extended(
+            QueueUrl=queue_url, ReceiptHandle=receipt_handle,
+            VisibilityTimeout=0)
+
+        res = await async_sqs.receive_message_extended(QueueUrl=queue_url)
+        receipt_handle = res['Messages'][0]['ReceiptHandle']
+        res = await async_sqs.change_message_visibility_batch_extended(
+            QueueUrl=queue_url, Entries=[{
+                'Id': '0', 'ReceiptHandle': receipt_handle,
+                'VisibilityTimeout': 10}])
+        assert [r['Id'] for r in res['Successful']] == ['0']
+        await async_sqs.delete_message_extended(
+            QueueUrl=queue_url, ReceiptHandle=receipt_handle)
+
+    asyncio.run(run())
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
+
+
+def test_async_compression_on_thread_pool(
+        s3_bucket, s3_client, sqs_client, sqs_client_queue, bucket_name,
+        big_message, monkeypatch):
+    session = Session()
+    sqs = extend_sqs(
+        session, AsyncClient(s3_client), bucket_name, compression='gzip',
+        compress_to_fit=True)
+    async_sqs = session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+    threads = []
+    for name in (
+            '_prepare_attributes_and_message', '_prepare_batch_entries',
+            '_build_put_params'):
+        def record(*args, method=getattr(sqs, name)):
+            threads.append(threading.current_thread())
+            return method(*args)
+
+        monkeypatch.setattr(sqs, name, record)
+    # too random to fit into the queue even if compressed
+    body = base64.b64encode(os.urandom(2**18)).decode()
+
+    async def run():
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody=body)
+        await async_sqs.send_message_batch_extended(
+            QueueUrl=queue_url, Entries=[
+                {'Id': '0', 'MessageBody': big_message}])
+        res = await async_sqs.receive_message_extended(
+            QueueUrl=queue_url, MaxNumberOfMessages=10)
+        assert sorted(m['Body'] for m in res['Messages']) == sorted(
+            [body, big_message])
+
+    asyncio.run(run())
+    # big_message compressed to fit is kept in the queue
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 1
+    # batch entries are prepared by _prepare_attributes_and_message as well
+    assert len(threads) == 4
+    assert threading.main_thread() not in threads
+
+
+def test_async_decompression_on_thread_pool(
+        s3_bucket, s3_client, sqs_client, sqs_client_queue, bucket_name,
+        big_message, monkeypatch):
+    session = Session()
+    sqs = extend_sqs(
+        session, AsyncClient(s3_client), bucket_name, compression='gzip',
+        compress_to_fit=True)
+    async_sqs = session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+    threads = {}
+    for name in (
+            '_decode_object', '_decode_inline_message',
+            '_update_received_message'):
+        def record(*args, name=name, method=getattr(sqs, name)):
+            threads.setdefault(name, []).append(threading.current_thread())
+            return method(*args)
+
+        monkeypatch.setattr(sqs, name, record)
+    # too random to fit into the queue even if compressed
+    body = base64.b64encode(os.urandom(2**18)).decode()
+
+    async def run():
+        await async_sqs.send_message_batch_extended(
+            QueueUrl=queue_url, Entries=[
+                {'Id': '0', 'MessageBody': body},
+                {'Id': '1', 'MessageBody': big_message}])
+        res = await async_sqs.receive_message_extended(
+            QueueUrl=queue_url, MaxNumberOfMessages=10)
+        assert sorted(m['Body'] for m in res['Messages']) == sorted(
+            [body, big_message])
+
+    asyncio.run(run())
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 1
+    assert {name: len(t) for name, t in threads.items()} == {
+        '_decode_object': 1, '_decode_inline_message': 1,
+        '_update_received_message': 2}
+    assert all(
+        threading.main_thread() not in t for t in threads.values())
+
+
+def test_async_spool_on_thread_pool(
+        s3_bucket, s3_client, sqs_client, sqs_client_queue, bucket_name,
+        big_message, monkeypatch):
+    session = Session()
+    extend_sqs(
+        session, AsyncClient(s3_client), bucket_name, compression='gzip',
+        spool_threshold=2**10, download_part_size=2**12)
+    async_sqs = session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+    threads = []
+
+    def write(self, data, write=DigestSpooledFile.write):
+        threads.append(threading.current_thread())
+        return write(self, data)
+
+    monkeypatch.setattr(DigestSpooledFile, 'write', write)
+
+    async def run():
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody=big_message)
+        res = await async_sqs.receive_message_extended(QueueUrl=queue_url)
+        with res['Messages'][0]['Body'] as body:
+            assert body.read() == big_message.encode()
+
+    asyncio.run(run())
+    # chunks are decompressed and written on the thread pool
+    assert threads and threading.main_thread() not in threads
+
+
+def test_async_byte_budget_cancelled(
+        s3_bucket, s3_client, sqs_client, sqs_client_queue, bucket_name,
+        big_message):
+    budget = ByteBudget(len(big_message))
+    session = Session()
+    extend_sqs(
+        session, AsyncClient(s3_client), bucket_name, byte_budget=budget)
+    async_sqs = session.create_client(sqs_client)
+    queue_url = sqs_client_queue['QueueUrl']
+    budget.acquire('other', len(big_message))
+
+    async def run():
+        await async_sqs.send_message_extended(
+            QueueUrl=queue_url, MessageBody=big_message)
+        task = asyncio.create_task(async_sqs.receive_message_extended(
+            QueueUrl=queue_url, MessageAttributeNames=['All']))
+        await asyncio.sleep(0.2)
+        assert budget.stats()['waiting'] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    # the message held after cancelled is released at once
+    budget.release('other')
+    for _ in range(50):
+        if not budget.waiting:
+            break
+        time.sleep(0.1)
+    assert budget.used == 0 and len(budget) == 0
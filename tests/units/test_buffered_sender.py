@@ -0,0 +1,232 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import threading
+import time
+import types
+
+import pytest
+from aws_sqs_ext_client.buffered_sender import BatchEntryError, BufferedSender
+from aws_sqs_ext_client.extended_messaging import SQSExtendedMessage
+
+
+@pytest.fixture
+def send_message_batch_extended_client(sqs_extended_message, sqs_client):
+    attributes = {'send_message_batch': sqs_client.send_message_batch}
+
+    add_custom_method = sqs_extended_message.add_send_message_batch_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    return types.SimpleNamespace(
+        send_message_batch_extended=attributes['send_message_batch_extended'],
+        get_batch_entry_size_extended=(
+            attributes['get_batch_entry_size_extended']))
+
+
+def fake_batch_client(sqs_extended_message):
+    calls = []
+    lock = threading.Lock()
+
+    def send_message_batch_extended(QueueUrl, Entries):
+        with lock:
+            calls.append((QueueUrl, Entries))
+        return {
+            'Successful': [
+                {'Id': e['Id'], 'MessageId': f'{QueueUrl}-{e["MessageBody"]}'}
+                for e in Entries if e['MessageBody'] != 'bad'],
+            'Failed': [
+                {'Id': e['Id'], 'SenderFault': True, 'Code': 'Invalid',
+                 'Message': 'bad message'}
+                for e in Entries if e['MessageBody'] == 'bad'],
+        }
+
+    attributes = {'send_message_batch': send_message_batch_extended}
+    sqs_extended_message.add_send_message_batch_extended(
+        'creating-client-class.sqs')(class_attributes=attributes)
+
+    return types.SimpleNamespace(
+        calls=calls, send_message_batch_extended=send_message_batch_extended,
+        get_batch_entry_size_extended=(
+            attributes['get_batch_entry_size_extended']))
+
+
+@pytest.fixture
+def batch_client(sqs_extended_message):
+    return fake_batch_client(sqs_extended_message)
+
+
+def test_flush_by_max_batch_size(batch_client):
+    with BufferedSender(batch_client, max_wait_seconds=60) as sender:
+        futures = [
+            sender.send_message(QueueUrl='q', MessageBody=str(i))
+            for i in range(25)]
+        results = [f.result(timeout=5) for f in futures[:20]]
+        assert len(batch_client.calls) == 2
+
+    assert [r['MessageId'] for r in results] == [
+        f'q-{i}' for i in range(20)]
+    assert futures[24].result()['MessageId'] == 'q-24'
+    assert sorted(len(c[1]) for c in batch_client.calls) == [5, 10, 10]
+    assert 'Id' not in results[0]
+
+
+def test_flush_by_max_wait_seconds(batch_client):
+    sender = BufferedSender(batch_client, max_wait_seconds=0.05)
+    future1 = sender.send_message(QueueUrl='q1', MessageBody='a')
+    future2 = sender.send_message(QueueUrl='q2', MessageBody='b')
+
+    assert future1.result(timeout=5)['MessageId'] == 'q1-a'
+    assert future2.result(timeout=5)['MessageId'] == 'q2-b'
+    assert sorted(c[0] for c in batch_client.calls) == ['q1', 'q2']
+    sender.close()
+
+
+def test_flush_by_max_batch_bytes(session, bucket_name, big_message):
+    batch_client = fake_batch_client(SQSExtendedMessage(
+        session, bucket_name, message_size_threshold=2**20))
+    with BufferedSender(batch_client, max_wait_seconds=60) as sender:
+        body = json.dumps({'data': 'x' * (2**17)})
+        for _ in range(3):
+            sender.send_message(QueueUrl='q', MessageBody=body)
+        # counted as a pointer since it's larger than max_batch_bytes
+        sender.send_message(QueueUrl='q', MessageBody=big_message * 5)
+
+    assert sorted(len(c[1]) for c in batch_client.calls) == [1, 1, 2]
+
+
+def test_offloaded_message_counted_as_pointer(batch_client, big_message):
+    with BufferedSender(batch_client, max_wait_seconds=60) as sender:
+        for _ in range(10):
+            sender.send_message(QueueUrl='q', MessageBody=big_message)
+
+    assert [len(c[1]) for c in batch_client.calls] == [10]
+
+
+def test_entry_size_w_client_options(session, bucket_name, big_message):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, compress_to_fit=True,
+        s3_checksum_algorithm='SHA256')
+    get_entry_size = fake_batch_client(sqs).get_batch_entry_size_extended
+    pointer_size = sqs._get_pointer_size()
+    attributes = {'a': {'DataType': 'String', 'StringValue': 'x'}}
+
+    assert get_entry_size(MessageBody='small') == 5
+    # base64 encoded bytes are kept in the queue
+    assert get_entry_size(MessageBody=b'x' * 300) > 400
+    # compressed to fit under the threshold
+    compressed = get_entry_size(MessageBody='x' * 2**19)
+    assert 0 < compressed < 2**15
+    size = get_entry_size(
+        MessageBody=big_message * 100, MessageAttributes=attributes)
+    assert pointer_size < size < pointer_size + 100
+    # the given attributes are not changed
+    assert list(attributes) == ['a']
+
+
+def test_fifo_queue_sent_in_order(batch_client):
+    send_message_batch_extended = batch_client.send_message_batch_extended
+    running = []
+    concurrency = []
+    lock = threading.Lock()
+
+    def send_message_batch_slowly(QueueUrl, Entries):
+        with lock:
+            running.append(QueueUrl)
+            concurrency.append(running.count(QueueUrl))
+        # the first batch would be overtaken if sent concurrently
+        time.sleep(0.1 if Entries[0]['MessageBody'] == '0' else 0.01)
+        with lock:
+            running.remove(QueueUrl)
+        return send_message_batch_extended(QueueUrl, Entries)
+
+    client = types.SimpleNamespace(
+        calls=batch_client.calls,
+        send_message_batch_extended=send_message_batch_slowly,
+        get_batch_entry_size_extended=(
+            batch_client.get_batch_entry_size_extended))
+    with BufferedSender(client, max_wait_seconds=60) as sender:
+        futures = [
+            sender.send_message(
+                QueueUrl='q.fifo', MessageBody=str(i), MessageGroupId='g')
+            for i in range(35)]
+        sender.flush()
+        assert all(f.done() for f in futures)
+
+    assert [e['MessageBody'] for c in batch_client.calls for e in c[1]] == [
+        str(i) for i in range(35)]
+    assert max(concurrency) == 1
+
+
+def test_failed_entry(batch_client):
+    with BufferedSender(batch_client, max_wait_seconds=60) as sender:
+        future_ok = sender.send_message(QueueUrl='q', MessageBody='ok')
+        future_bad = sender.send_message(QueueUrl='q', MessageBody='bad')
+
+    assert future_ok.result()['MessageId'] == 'q-ok'
+    with pytest.raises(BatchEntryError) as e:
+        future_bad.result()
+    assert e.value.failed['Code'] == 'Invalid'
+
+
+def test_failed_batch(batch_client):
+    def send_message_batch_extended(QueueUrl, Entries):
+        raise ValueError('no bucket')
+
+    client = types.SimpleNamespace(
+        send_message_batch_extended=send_message_batch_extended,
+        get_batch_entry_size_extended=(
+            batch_client.get_batch_entry_size_extended))
+    with BufferedSender(client) as sender:
+        future = sender.send_message(QueueUrl='q', MessageBody='a')
+
+    with pytest.raises(ValueError):
+        future.result()
+
+
+def test_invalid_message(batch_client):
+    with BufferedSender(batch_client) as sender:
+        with pytest.raises(ValueError):
+            sender.send_message(MessageBody='a')
+        with pytest.raises(ValueError):
+            sender.send_message(QueueUrl='q')
+
+    with pytest.raises(ValueError):
+        sender.send_message(QueueUrl='q', MessageBody='a')
+
+
+def test_extended_client(
+        s3_bucket, sqs_client, sqs_client_queue, big_message,
+        send_message_batch_extended_client):
+    client = send_message_batch_extended_client
+    queue_url = sqs_client_queue['QueueUrl']
+    with BufferedSender(client) as sender:
+        futures = [
+            sender.send_message(QueueUrl=queue_url, MessageBody=body)
+            for body in ['small', big_message]]
+
+    assert all('MessageId' in f.result() for f in futures)
+    res = sqs_client.receive_message(
+        QueueUrl=queue_url, MaxNumberOfMessages=10)
+    assert len(res['Messages']) == 2
@@ -0,0 +1,150 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import threading
+import time
+
+import pytest
+from aws_sqs_ext_client.byte_budget import ByteBudget
+
+
+def test_byte_budget():
+    budget = ByteBudget(10)
+    assert budget.acquire('a', 4) == pytest.approx(0, abs=0.1)
+    budget.acquire_all({'b': 3, 'c': 3})
+    assert len(budget) == 3
+    assert budget.used == 10
+
+    # waits until the others are released
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire('d', 5)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    time.sleep(0.1)
+    assert not acquired.is_set()
+    assert budget.stats()['waiting'] == 1
+    assert budget.release('a') == 4
+    time.sleep(0.1)
+    assert not acquired.is_set()
+    # extended receipt handles are released by their original ones
+    assert budget.release(
+        '-..s3BucketName..-bucket-..s3BucketName..-'
+        '-..s3Key..-key-..s3Key..-b') == 3
+    thread.join(1)
+    assert acquired.is_set()
+
+    assert budget.release('unknown') == 0
+    stats = budget.stats()
+    assert stats.pop('wait_seconds') > 0.1
+    assert stats == {
+        'max_bytes': 10, 'used_bytes': 8, 'holds': 2, 'waiting': 0,
+        'expired': 0,
+    }
+
+
+def test_byte_budget_larger_than_max_bytes():
+    budget = ByteBudget(10)
+
+    # accepted when nothing is held
+    budget.acquire_all({'a': 8, 'b': 8})
+    assert budget.used == 16
+    with pytest.raises(TimeoutError):
+        budget.acquire('c', 1, timeout=0.1)
+
+    assert budget.release_all(['a', 'b']) == 16
+    budget.acquire('c', 1, timeout=0.1)
+
+    with pytest.raises(ValueError):
+        ByteBudget(0)
+
+
+def test_byte_budget_w_hold_timeout():
+    budget = ByteBudget(10, hold_timeout=0.2)
+    budget.acquire('a', 10)
+
+    # the hold never released expires
+    assert budget.acquire('b', 10) >= 0.1
+    assert budget.stats()['expired'] == 1
+    assert budget.release('a') == 0
+    assert budget.release('b') == 10
+
+
+def test_byte_budget_by_message_ids():
+    budget = ByteBudget(10)
+    assert budget.hold_timeout == 30
+    budget.acquire('a', 4, receipt_handle='rh-a1')
+    budget.acquire('b', 3, receipt_handle='rh-b')
+
+    # the message received again replaces the hold of the previous delivery
+    budget.acquire_all({'a': 5}, receipt_handles={'a': 'rh-a2'})
+    assert budget.used == 8 and len(budget) == 2
+    assert budget.release('rh-a1') == 0
+
+    # holds are released by their receipt handles or MessageIds
+    assert budget.release(
+        '-..s3BucketName..-bucket-..s3BucketName..-'
+        '-..s3Key..-key-..s3Key..-rh-a2') == 5
+    assert budget.release_all(['b', 'rh-b']) == 3
+    assert budget.used == 0 and len(budget) == 0
+
+
+def test_byte_budget_renew():
+    budget = ByteBudget(10, hold_timeout=0.2)
+    budget.acquire('a', 10, receipt_handle='rh-a')
+    time.sleep(0.1)
+    budget.renew_all(['rh-a'], hold_timeout=0.5)
+
+    with pytest.raises(TimeoutError):
+        budget.acquire('b', 10, timeout=0.2)
+    assert budget.stats()['expired'] == 0
+
+    # holds acquired with their own hold_timeout
+    budget.acquire_all({'c': 1}, hold_timeout=0.1)
+    assert budget.acquire('b', 10) >= 0.1
+    assert budget.stats()['expired'] == 2
+
+
+def test_byte_budget_replaced_hold_wakes_waiters():
+    budget = ByteBudget(10, hold_timeout=None)
+    budget.acquire('a', 10)
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire('b', 5)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    time.sleep(0.1)
+    assert not acquired.is_set()
+
+    # the redelivered message frees room for the waiting one
+    budget.acquire('a', 5)
+    thread.join(1)
+    assert acquired.is_set()
+    assert budget.used == 10
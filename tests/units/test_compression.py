@@ -0,0 +1,130 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import concurrent.futures
+
+import pytest
+from aws_sqs_ext_client.compression import (
+    CODECS, GzipCodec, PayloadCodec, get_codec, register_codec)
+
+
+@pytest.mark.parametrize('name', ['gzip', 'zstd', 'lz4'])
+def test_codec(name, big_message):
+    if name != 'gzip':
+        pytest.importorskip({'zstd': 'zstandard', 'lz4': 'lz4'}[name])
+
+    codec = get_codec(name)
+    assert codec.name == name
+
+    data = big_message.encode()
+    compressed = codec.compress(data)
+    assert len(compressed) < len(data)
+    assert codec.decompress(compressed) == data
+
+
+@pytest.mark.parametrize('name', ['gzip', 'zlib', 'zstd', 'lz4'])
+def test_codec_shared_by_threads(name, big_message):
+    if name in ('zstd', 'lz4'):
+        pytest.importorskip({'zstd': 'zstandard', 'lz4': 'lz4'}[name])
+
+    codec = get_codec(name)
+    payloads = [(big_message * (i % 3 + 1)).encode() for i in range(32)]
+
+    def roundtrip(data):
+        decompressor = codec.decompressor()
+        compressed = codec.compress(data)
+        return (
+            codec.decompress(compressed),
+            decompressor.decompress(compressed) + decompressor.flush())
+
+    # the same codec is used by the thread pools of the extended client
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(roundtrip, payloads))
+
+    assert results == [(data, data) for data in payloads]
+
+
+@pytest.mark.parametrize('name', ['gzip', 'zlib', 'zstd', 'lz4'])
+def test_codec_by_chunks(name, big_message):
+    if name in ('zstd', 'lz4'):
+        pytest.importorskip({'zstd': 'zstandard', 'lz4': 'lz4'}[name])
+
+    codec = get_codec(name)
+    data = big_message.encode()
+    chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+
+    compressor = codec.compressor()
+    compressed = b''.join(
+        [compressor.compress(chunk) for chunk in chunks] +
+        [compressor.flush()])
+    assert codec.decompress(compressed) == data
+
+    decompressor = codec.decompressor()
+    compressed = codec.compress(data)
+    assert b''.join(
+        [decompressor.decompress(compressed[i:i + 100])
+         for i in range(0, len(compressed), 100)] +
+        [decompressor.flush()]) == data
+
+
+def test_gzip_decompressor_w_multiple_members():
+    codec = GzipCodec()
+    decompressor = codec.decompressor()
+    compressed = codec.compress(b'hello ') + codec.compress(b'world')
+    assert decompressor.decompress(compressed) == b'hello world'
+
+
+def test_get_codec():
+    codec = GzipCodec(level=9)
+    assert get_codec(codec) is codec
+    assert get_codec(None) is None
+
+    with pytest.raises(ValueError) as excinfo:
+        get_codec('unknown')
+    assert 'unsupported compression: unknown' in str(excinfo.value)
+
+
+def test_register_codec():
+    class ReverseCodec(PayloadCodec):
+        name = 'reverse'
+
+        def compress(self, data):
+            return data[::-1]
+
+        def decompress(self, data):
+            return data[::-1]
+
+    register_codec(ReverseCodec)
+    assert get_codec('reverse').decompress(b'olleh') == b'hello'
+
+    # chunks are buffered for codecs without streaming support
+    decompressor = get_codec('reverse').decompressor()
+    assert decompressor.decompress(b'ol') == b''
+    assert decompressor.decompress(b'leh') == b''
+    assert decompressor.flush() == b'hello'
+    del CODECS['reverse']
+
+    with pytest.raises(ValueError) as excinfo:
+        register_codec(PayloadCodec)
+    assert 'codec must have its name' in str(excinfo.value)
@@ -0,0 +1,525 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import threading
+import time
+import types
+
+import pytest
+from aws_sqs_ext_client.buffered_sender import BatchEntryError
+from aws_sqs_ext_client.consumer import (
+    AckBatcher, FifoWorkerPoolConsumer, MessageConsumer, WorkerPoolConsumer)
+
+
+@pytest.fixture
+def consumer_client(sqs_extended_message, sqs_client):
+    attributes = {
+        'send_message': sqs_client.send_message,
+        'receive_message': sqs_client.receive_message,
+        'delete_message_batch': sqs_client.delete_message_batch,
+    }
+    event = 'creating-client-class.sqs'
+    sqs_extended_message.add_send_message_extended(event)(
+        class_attributes=attributes)
+    sqs_extended_message.add_receive_message_extended(event)(
+        class_attributes=attributes)
+    sqs_extended_message.add_delete_message_batch_extended(event)(
+        class_attributes=attributes)
+    return types.SimpleNamespace(
+        get_queue_attributes=sqs_client.get_queue_attributes,
+        send_message_extended=attributes['send_message_extended'],
+        receive_message_extended=attributes['receive_message_extended'],
+        delete_message_batch_extended=(
+            attributes['delete_message_batch_extended']),
+        release_message_extended=attributes['release_message_extended'])
+
+
+def fake_client(batches):
+    calls = []
+    released = []
+
+    def receive_message_extended(**kwargs):
+        calls.append(kwargs)
+        if not batches:
+            return {}
+        batch = batches.pop(0)
+        if isinstance(batch, Exception):
+            raise batch
+        return {'Messages': [
+            {'Body': body, 'ReceiptHandle': f'rh-{body}'} for body in batch]}
+
+    def release_message_extended(ReceiptHandle):
+        released.append(ReceiptHandle)
+        return 0
+
+    return types.SimpleNamespace(
+        calls=calls, released=released,
+        receive_message_extended=receive_message_extended,
+        release_message_extended=release_message_extended)
+
+
+def test_consumer_w_extended_messages(
+        s3_bucket, consumer_client, sqs_client_queue, big_message):
+    queue_url = sqs_client_queue['QueueUrl']
+    for body in (big_message, 'small'):
+        consumer_client.send_message_extended(
+            QueueUrl=queue_url, MessageBody=body)
+
+    with MessageConsumer(
+            consumer_client, queue_url, WaitTimeSeconds=0,
+            stop_when_empty=True) as consumer:
+        assert consumer.visibility_timeout == 30
+        bodies = sorted(m['Body'] for m in consumer)
+
+    assert bodies == sorted([big_message, 'small'])
+    assert consumer.expired == 0
+
+
+def test_consumer_keeps_prefetch_batches():
+    client = fake_client([[str(i)] for i in range(10)])
+    consumer = MessageConsumer(
+        client, 'q', prefetch_batches=2, visibility_timeout=30,
+        visibility_margin=0, stop_when_empty=True)
+    time.sleep(0.3)
+
+    # the buffer is full, and one more batch waits to be buffered
+    assert len(client.calls) == 3
+    assert client.calls[0] == {
+        'QueueUrl': 'q', 'MaxNumberOfMessages': 10, 'WaitTimeSeconds': 20,
+        'VisibilityTimeout': 30}
+    assert [m['Body'] for m in consumer] == [str(i) for i in range(10)]
+
+    consumer.close()
+
+
+def test_consumer_iter_batches():
+    client = fake_client([['0', '1'], ['2']])
+    with MessageConsumer(
+            client, 'q', visibility_timeout=30, visibility_margin=0,
+            stop_when_empty=True) as consumer:
+        batches = [[m['Body'] for m in b] for b in consumer.iter_batches()]
+
+    assert batches == [['0', '1'], ['2']]
+
+
+def test_consumer_drops_expired_messages():
+    client = fake_client([['0', '1'], ['2']])
+    with MessageConsumer(
+            client, 'q', visibility_timeout=1, visibility_margin=0.5,
+            stop_when_empty=True) as consumer:
+        bodies = []
+        for message in consumer:
+            bodies.append(message['Body'])
+            # the rest and the prefetched batch expire while processing
+            time.sleep(0.6)
+
+    assert bodies == ['0']
+    assert consumer.expired == 2
+    # the dropped messages are released from the byte budget
+    assert client.released == ['rh-1', 'rh-2']
+
+
+def test_consumer_extends_visibility():
+    client = fake_client([['0', '1', '2']])
+    visibility_calls = []
+
+    def change_message_visibility_batch_extended(QueueUrl, Entries):
+        visibility_calls.append(Entries)
+        return {
+            'Successful': [
+                {'Id': e['Id']} for e in Entries
+                if e['ReceiptHandle'] != 'rh-2'],
+            'Failed': [
+                {'Id': e['Id'], 'SenderFault': True,
+                 'Code': 'ReceiptHandleIsInvalid', 'Message': 'invalid'}
+                for e in Entries if e['ReceiptHandle'] == 'rh-2'],
+        }
+
+    client.change_message_visibility_batch_extended = (
+        change_message_visibility_batch_extended)
+    with MessageConsumer(
+            client, 'q', visibility_timeout=1, visibility_margin=0.5,
+            stop_when_empty=True) as consumer:
+        bodies = []
+        for message in consumer:
+            bodies.append(message['Body'])
+            time.sleep(0.6)
+
+    # the rest is extended instead of being dropped except the failed one
+    assert bodies == ['0', '1']
+    assert visibility_calls == [[
+        {'Id': '0', 'ReceiptHandle': 'rh-1', 'VisibilityTimeout': 1},
+        {'Id': '1', 'ReceiptHandle': 'rh-2', 'VisibilityTimeout': 1}]]
+    assert (consumer.extended, consumer.expired) == (1, 1)
+    assert client.released == ['rh-2']
+
+
+@pytest.mark.parametrize('grouped,given,released', [
+    (True, ['x0', 'b1', 'c1'], ['rh-a1', 'rh-a2']),
+    (False, ['x0'], ['rh-a1', 'rh-b1', 'rh-a2', 'rh-c1']),
+])
+def test_consumer_extends_visibility_of_fifo_queue(grouped, given, released):
+    client = fake_client([['x0', 'a1', 'b1', 'a2', 'c1']])
+    receive_message_extended = client.receive_message_extended
+
+    def receive_message_w_group(**kwargs):
+        res = receive_message_extended(**kwargs)
+        for message in res.get('Messages', []):
+            if grouped:
+                message['Attributes'] = {
+                    'MessageGroupId': message['Body'][0]}
+        return res
+
+    def change_message_visibility_batch_extended(QueueUrl, Entries):
+        return {
+            'Successful': [
+                {'Id': e['Id']} for e in Entries
+                if e['ReceiptHandle'] != 'rh-a1'],
+            'Failed': [
+                {'Id': e['Id'], 'SenderFault': True,
+                 'Code': 'ReceiptHandleIsInvalid', 'Message': 'invalid'}
+                for e in Entries if e['ReceiptHandle'] == 'rh-a1'],
+        }
+
+    client.receive_message_extended = receive_message_w_group
+    client.change_message_visibility_batch_extended = (
+        change_message_visibility_batch_extended)
+    with MessageConsumer(
+            client, 'q.fifo', visibility_timeout=1, visibility_margin=0.5,
+            stop_when_empty=True) as consumer:
+        bodies = []
+        for message in consumer:
+            bodies.append(message['Body'])
+            if message['Body'] == 'x0':
+                time.sleep(0.6)
+
+    # the following message of the failed one's group is not given ahead
+    # of it, and all of them are dropped without MessageGroupId
+    assert bodies == given
+    assert consumer.expired == len(released)
+    assert client.released == released
+
+
+def test_consumer_w_receive_error():
+    client = fake_client([['0'], ValueError('failed'), ValueError('failed')])
+    consumer = MessageConsumer(
+        client, 'q', visibility_timeout=30, visibility_margin=0,
+        stop_when_empty=True, retry_seconds=0.1, max_retry_seconds=0.15)
+    started = time.monotonic()
+
+    # receiving is retried with backoff instead of stopping
+    assert [m['Body'] for m in consumer] == ['0']
+    assert time.monotonic() - started >= 0.25
+    assert consumer.receive_errors == 2
+    assert len(client.calls) == 4
+
+    consumer.close()
+    with pytest.raises(ValueError):
+        MessageConsumer(client, 'q', visibility_timeout=30, retry_seconds=0)
+
+
+def test_consumer_close_while_waiting():
+    client = fake_client([[str(i)] for i in range(10)])
+    consumer = MessageConsumer(
+        client, 'q', prefetch_batches=1, visibility_timeout=30)
+    time.sleep(0.2)
+    consumer.close()
+    assert list(consumer) == []
+    assert len(client.calls) == 2
+
+
+def test_consumer_w_invalid_prefetch_batches():
+    with pytest.raises(ValueError):
+        MessageConsumer(fake_client([]), 'q', prefetch_batches=0)
+
+
+@pytest.fixture
+def ack_client():
+    calls = []
+    lock = threading.Lock()
+
+    def delete_message_batch_extended(QueueUrl, Entries):
+        with lock:
+            calls.append((QueueUrl, Entries))
+        return {
+            'Successful': [
+                {'Id': e['Id']} for e in Entries
+                if e['ReceiptHandle'] != 'bad'],
+            'Failed': [
+                {'Id': e['Id'], 'SenderFault': True,
+                 'Code': 'ReceiptHandleIsInvalid', 'Message': 'invalid'}
+                for e in Entries if e['ReceiptHandle'] == 'bad'],
+        }
+
+    return types.SimpleNamespace(
+        calls=calls,
+        delete_message_batch_extended=delete_message_batch_extended)
+
+
+def test_ack_batcher(ack_client):
+    with AckBatcher(ack_client, max_wait_seconds=60) as acks:
+        futures = [acks.ack('q', f'rh{i}') for i in range(12)]
+        futures[9].result(timeout=5)
+        assert len(ack_client.calls) == 1
+        bad = acks.ack('q', 'bad')
+
+    assert [len(c[1]) for c in ack_client.calls] == [10, 3]
+    assert ack_client.calls[0][1][0] == {'Id': '0', 'ReceiptHandle': 'rh0'}
+    assert futures[11].result() == {'Id': '1'}
+    with pytest.raises(BatchEntryError):
+        bad.result()
+    with pytest.raises(ValueError):
+        acks.ack('q', 'rh')
+
+
+def test_ack_batcher_by_max_wait_seconds(ack_client):
+    with AckBatcher(ack_client, max_wait_seconds=0.1) as acks:
+        future = acks.ack('q', 'rh')
+        future.result(timeout=5)
+        assert len(ack_client.calls) == 1
+
+
+def test_worker_pool_consumer(
+        s3_bucket, s3_client, bucket_name, consumer_client,
+        sqs_client_queue, sqs_client, big_message):
+    queue_url = sqs_client_queue['QueueUrl']
+    bodies = [big_message] + [str(i) for i in range(14)] + ['bad']
+    for body in bodies:
+        consumer_client.send_message_extended(
+            QueueUrl=queue_url, MessageBody=body)
+    processed = []
+    delete_message_batch = consumer_client.delete_message_batch_extended
+
+    def delete_message_batch_w_count(**kwargs):
+        processed.append(len(kwargs['Entries']))
+        return delete_message_batch(**kwargs)
+
+    def handler(message):
+        if message['Body'] == 'bad':
+            raise ValueError('bad message')
+        time.sleep(0.01)
+
+    consumer_client.delete_message_batch_extended = (
+        delete_message_batch_w_count)
+    with WorkerPoolConsumer(
+            consumer_client, queue_url, handler, max_workers=4,
+            WaitTimeSeconds=0, stop_when_empty=True) as consumer:
+        consumer.run()
+
+    assert (consumer.processed, consumer.failed) == (15, 1)
+    # messages are deleted by fewer calls than messages
+    assert sum(processed) == 15
+    assert len(processed) < 15
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
+
+    # the failed message is received again after its visibility timeout
+    res = sqs_client.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=['ApproximateNumberOfMessagesNotVisible'])
+    assert res['Attributes']['ApproximateNumberOfMessagesNotVisible'] == '1'
+
+
+def process_handler(message):
+    if message['Body'] == 'bad':
+        raise ValueError('bad message')
+
+
+def test_worker_pool_consumer_w_processes(ack_client):
+    client = fake_client([['0', '1'], ['bad', '2']])
+    client.delete_message_batch_extended = (
+        ack_client.delete_message_batch_extended)
+
+    consumer = WorkerPoolConsumer(
+        client, 'q', process_handler, max_workers=2, use_processes=True,
+        visibility_timeout=30, visibility_margin=0, stop_when_empty=True)
+    consumer.run()
+
+    assert (consumer.processed, consumer.failed) == (3, 1)
+    assert sum(len(c[1]) for c in ack_client.calls) == 3
+    assert client.released == ['rh-bad']
+
+
+def test_worker_pool_consumer_stop(ack_client):
+    client = fake_client([[str(i)] for i in range(100)])
+    client.delete_message_batch_extended = (
+        ack_client.delete_message_batch_extended)
+    consumer = WorkerPoolConsumer(
+        client, 'q', lambda message: time.sleep(0.05), max_workers=2,
+        visibility_timeout=30, visibility_margin=0)
+    thread = threading.Thread(target=consumer.run)
+    thread.start()
+    time.sleep(0.2)
+    consumer.stop()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert 0 < consumer.processed < 100
+    assert sum(len(c[1]) for c in ack_client.calls) == consumer.processed
+
+
+def test_ack_batcher_w_group(ack_client):
+    with AckBatcher(ack_client, max_wait_seconds=60) as acks:
+        acks.ack('q', 'a1', group='a')
+        acks.ack('q', 'b1', group='b')
+        acks.ack('q', 'a2', group='a')
+        acks.flush('q', 'a')
+        assert [[e['ReceiptHandle'] for e in c[1]]
+                for c in ack_client.calls] == [['a1', 'a2']]
+
+    assert len(ack_client.calls) == 2
+
+
+def test_fifo_worker_pool_consumer(
+        s3_bucket, sqs_extended_message, sqs_client, big_message):
+    queue_url = sqs_client.create_queue(
+        QueueName='extended-message-test-queue.fifo',
+        Attributes={
+            'FifoQueue': 'true', 'ContentBasedDeduplication': 'true',
+        })['QueueUrl']
+    attributes = {
+        'send_message_batch': sqs_client.send_message_batch,
+        'receive_message': sqs_client.receive_message,
+        'delete_message_batch': sqs_client.delete_message_batch,
+    }
+    event = 'creating-client-class.sqs'
+    for add_method in (
+            sqs_extended_message.add_send_message_batch_extended,
+            sqs_extended_message.add_receive_message_extended,
+            sqs_extended_message.add_delete_message_batch_extended):
+        add_method(event)(class_attributes=attributes)
+    client = types.SimpleNamespace(
+        get_queue_attributes=sqs_client.get_queue_attributes,
+        receive_message_extended=attributes['receive_message_extended'],
+        delete_message_batch_extended=(
+            attributes['delete_message_batch_extended']),
+        release_message_extended=attributes['release_message_extended'])
+    for group in ('a', 'b'):
+        attributes['send_message_batch_extended'](
+            QueueUrl=queue_url, Entries=[{
+                'Id': str(i), 'MessageGroupId': group,
+                'MessageBody': json.dumps({'group': group, 'seq': i}),
+            } for i in range(5)])
+    attributes['send_message_batch_extended'](
+        QueueUrl=queue_url, Entries=[{
+            'Id': '0', 'MessageGroupId': 'c', 'MessageBody': big_message}])
+
+    processed = []
+    running = set()
+    concurrency = []
+    lock = threading.Lock()
+
+    def handler(message):
+        body = message['Body']
+        group = message['Attributes']['MessageGroupId']
+        with lock:
+            assert group not in running
+            running.add(group)
+            concurrency.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.discard(group)
+            processed.append(body if group == 'c' else json.loads(body))
+
+    consumer = FifoWorkerPoolConsumer(
+        client, queue_url, handler, max_workers=3, WaitTimeSeconds=0,
+        stop_when_empty=True)
+    consumer.run()
+
+    assert (consumer.processed, consumer.failed) == (11, 0)
+    for group in ('a', 'b'):
+        assert [p['seq'] for p in processed
+                if isinstance(p, dict) and p['group'] == group] == list(
+                    range(5))
+    assert big_message in processed
+    assert max(concurrency) > 1
+    res = sqs_client.receive_message(QueueUrl=queue_url)
+    assert 'Messages' not in res
+
+
+def test_fifo_worker_pool_consumer_w_failure(ack_client):
+    batches = [['a1', 'b1', 'a2', 'a3'], ['b2']]
+    client = fake_client(batches)
+    receive_message_extended = client.receive_message_extended
+
+    def receive_message_w_group(**kwargs):
+        assert kwargs['AttributeNames'] == ['MessageGroupId']
+        res = receive_message_extended(**kwargs)
+        for message in res.get('Messages', []):
+            message['Attributes'] = {'MessageGroupId': message['Body'][0]}
+        return res
+
+    client.receive_message_extended = receive_message_w_group
+    client.delete_message_batch_extended = (
+        ack_client.delete_message_batch_extended)
+
+    def handler(message):
+        if message['Body'] == 'a2':
+            raise ValueError('bad message')
+
+    consumer = FifoWorkerPoolConsumer(
+        client, 'q', handler, max_workers=2, visibility_timeout=30,
+        visibility_margin=0, stop_when_empty=True)
+    consumer.run()
+
+    assert (consumer.processed, consumer.failed, consumer.skipped) == (
+        3, 1, 1)
+    deleted = sorted(
+        e['ReceiptHandle'] for c in ack_client.calls for e in c[1])
+    assert deleted == ['rh-a1', 'rh-b1', 'rh-b2']
+    assert sorted(client.released) == ['rh-a2', 'rh-a3']
+
+
+def test_fifo_worker_pool_consumer_w_callback_error(ack_client):
+    client = fake_client([['a1', 'a2', 'b1']])
+    receive_message_extended = client.receive_message_extended
+
+    def receive_message_w_group(**kwargs):
+        res = receive_message_extended(**kwargs)
+        for message in res.get('Messages', []):
+            message['Attributes'] = {'MessageGroupId': message['Body'][0]}
+        return res
+
+    client.receive_message_extended = receive_message_w_group
+    client.delete_message_batch_extended = (
+        ack_client.delete_message_batch_extended)
+
+    def discard(queue_url, receipt_handle):
+        raise RuntimeError('heartbeat error')
+
+    heartbeat = types.SimpleNamespace(
+        add=lambda queue_url, receipt_handle: None, discard=discard)
+    processed = []
+    consumer = FifoWorkerPoolConsumer(
+        client, 'q', lambda m: processed.append(m['Body']), max_workers=2,
+        max_pending_messages=2, heartbeat=heartbeat, visibility_timeout=30,
+        visibility_margin=0, stop_when_empty=True)
+    thread = threading.Thread(target=consumer.run, daemon=True)
+    thread.start()
+    thread.join(5)
+
+    # the next message of the group is processed and slots are released
+    assert not thread.is_alive()
+    assert processed.index('a1') < processed.index('a2')
+    assert sorted(processed) == ['a1', 'a2', 'b1']
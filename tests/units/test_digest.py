@@ -0,0 +1,92 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib
+import io
+
+import pytest
+from aws_sqs_ext_client.digest import (
+    DigestSpooledFile, md5_of_attributes, md5_of_body)
+
+
+@pytest.mark.parametrize('body', [
+    'small text', 'multi-byte text あ' * 1000, b'\x00binary' * 1000,
+    bytearray(b'bytearray'), memoryview(b'memoryview'), b''])
+def test_md5_of_body(body):
+    expected = hashlib.md5(
+        body.encode() if isinstance(body, str) else body).hexdigest()
+    assert md5_of_body(body, chunk_size=7) == expected
+
+
+def test_md5_of_body_w_stream(tmp_path):
+    stream = io.BytesIO(b'0123456789')
+    stream.seek(2)
+    assert md5_of_body(stream, chunk_size=3) == (
+        hashlib.md5(b'23456789').hexdigest())
+    assert stream.tell() == 2
+
+    # spooled files calculate MD5 while being written
+    with DigestSpooledFile(max_size=4, dir=tmp_path) as spooled:
+        spooled.write(b'0123')
+        spooled.write(b'456789')
+        spooled.seek(0)
+        assert md5_of_body(spooled) == hashlib.md5(b'0123456789').hexdigest()
+        assert spooled.read() == b'0123456789'
+
+
+def test_md5_of_attributes(sqs_client, sqs_client_queue):
+    attributes = {
+        'string_attr': {'StringValue': 'string', 'DataType': 'String'},
+        'number_attr': {'StringValue': '123', 'DataType': 'Number'},
+        'custom_attr': {
+            'StringValue': 'custom', 'DataType': 'String.custom'},
+        'small_binary_attr': {'BinaryValue': b'\x00', 'DataType': 'Binary'},
+        'large_binary_attr': {
+            'BinaryValue': b'\x01' * 2**13, 'DataType': 'Binary'},
+    }
+
+    # same as SQS calculates
+    res = sqs_client.send_message(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageBody='body',
+        MessageAttributes=attributes)
+    assert md5_of_attributes(attributes) == res['MD5OfMessageAttributes']
+    assert md5_of_attributes({}) is None
+    assert md5_of_attributes(None) is None
+
+
+@pytest.mark.parametrize('data_type,transport', [
+    ('String.custom', b'\x01'), ('Number.custom', b'\x01'),
+    ('Binary.custom', b'\x02')])
+def test_md5_of_custom_attributes(data_type, transport):
+    value = b'value' if data_type.startswith('Binary') else 'value'
+    attributes = {'attr': {
+        'BinaryValue' if isinstance(value, bytes) else 'StringValue': value,
+        'DataType': data_type}}
+
+    # custom types are sent with the transport type of their base type
+    expected = hashlib.md5(
+        b'\x00\x00\x00\x04attr' +
+        len(data_type).to_bytes(4, 'big') + data_type.encode() +
+        transport + b'\x00\x00\x00\x05value').hexdigest()
+    assert md5_of_attributes(attributes) == expected
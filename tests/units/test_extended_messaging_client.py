@@ -22,12 +22,22 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import base64
+import functools
 import hashlib
+import io
 import json
+import mmap
+import os
+import threading
+import time
 
 import botocore
 import pytest
+from aws_sqs_ext_client.byte_budget import ByteBudget
 from aws_sqs_ext_client.extended_messaging import SQSExtendedMessage
+from aws_sqs_ext_client.models.lazy_payload import LazyPayload, prefetch
+from aws_sqs_ext_client.payload_cache import PayloadCache
 
 
 @pytest.fixture
@@ -558,3 +568,1313 @@ def test_multiple_extended_messaging_w_large_text(
 
     res = s3_client.list_objects_v2(Bucket=bucket_name)
     assert res['KeyCount'] == 0
+
+
+def test_multiple_extended_messaging_w_failed_upload(
+        s3_bucket, sqs_client_queue, sqs_client, s3_client, big_message,
+        bucket_name, sqs_extended_message, monkeypatch,
+        send_message_batch_extended_client):
+    put_message_to_s3 = sqs_extended_message._put_message_to_s3
+
+    def put_message_to_s3_w_error(encoded, *args, **kwargs):
+        if b'TEST_BIG_MESSAGE2' in encoded:
+            raise botocore.exceptions.ClientError(
+                {'Error': {'Code': 'InternalError', 'Message': 'error'}},
+                'PutObject')
+        return put_message_to_s3(encoded, *args, **kwargs)
+
+    monkeypatch.setattr(
+        sqs_extended_message, '_put_message_to_s3', put_message_to_s3_w_error)
+
+    body1 = big_message
+    body2 = json.loads(big_message)
+    body2['id'] = 'TEST_BIG_MESSAGE2'
+    body2 = json.dumps(body2)
+
+    # send
+    res = send_message_batch_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'],
+        Entries=[
+            {'Id': '1', 'MessageBody': body1},
+            {'Id': '2', 'MessageBody': body2},
+            {'Id': '3', 'MessageBody': body1}])
+
+    assert list(map(lambda x: x['Id'], res['Successful'])) == ['1', '3']
+    assert len(res['Failed']) == 1
+    assert res['Failed'][0]['Id'] == '2'
+    assert res['Failed'][0]['Code'] == 'InternalError'
+    assert res['Failed'][0]['Message'].endswith('found in 1')
+
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 2
+
+
+def test_multiple_extended_messaging_wo_bucket(
+        sqs_client_queue, big_message, send_message_batch_extended_client):
+    res = send_message_batch_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'],
+        Entries=[
+            {'Id': '1', 'MessageBody': big_message},
+            {'Id': '2', 'MessageBody': big_message}])
+
+    assert res['Successful'] == []
+    assert list(map(lambda x: x['Id'], res['Failed'])) == ['1', '2']
+    assert res['Failed'][0]['Code'] == 'NoSuchBucket'
+
+
+def test_multiple_extended_messaging_w_mixed_text(
+        s3_bucket, sqs_client_queue, sqs_client, big_message,
+        send_message_batch_extended_client, receive_message_extended_client):
+    bodies = []
+    for i in range(0, 6):
+        body = json.loads(big_message)
+        body['id'] = f'TEST_BIG_MESSAGE{i}'
+        bodies.append(
+            json.dumps(body) if i % 2 else json.dumps({'message': str(i)}))
+
+    send_message_batch_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'],
+        Entries=[
+            {'Id': str(i), 'MessageBody': body}
+            for i, body in enumerate(bodies)])
+
+    res = sqs_client.receive_message(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10, VisibilityTimeout=0, WaitTimeSeconds=0)
+    res_extended = receive_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10)
+
+    assert res.keys() == res_extended.keys()
+    assert len(res_extended['Messages']) == 6
+    for message, message_extended in zip(
+            res['Messages'], res_extended['Messages']):
+        assert message['MessageId'] == message_extended['MessageId']
+    assert sorted(m['Body'] for m in res_extended['Messages']) == (
+        sorted(bodies))
+
+
+def test_multiple_extended_messaging_w_failed_deletion(
+        s3_bucket, sqs_client_queue, sqs_client, s3_client, big_message,
+        bucket_name, sqs_extended_message, monkeypatch,
+        send_message_batch_extended_client, receive_message_extended_client,
+        delete_message_batch_extended_client):
+    s3 = sqs_extended_message.s3.meta.client
+    delete_objects = s3.delete_objects
+    calls = []
+
+    def delete_objects_w_error(**kwargs):
+        objects = kwargs['Delete']['Objects']
+        calls.append(len(objects))
+        kwargs['Delete']['Objects'] = objects[1:]
+        res = delete_objects(**kwargs)
+        res['Errors'] = [{
+            'Key': objects[0]['Key'], 'Code': 'AccessDenied',
+            'Message': 'Access Denied'}]
+        return res
+
+    monkeypatch.setattr(s3, 'delete_objects', delete_objects_w_error)
+
+    send_message_batch_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'],
+        Entries=[
+            {'Id': str(i), 'MessageBody': big_message} for i in range(0, 3)])
+    res = receive_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10, VisibilityTimeout=0)
+    entries = [
+        {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+        for i, m in enumerate(res['Messages'])]
+
+    # delete
+    res = delete_message_batch_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], Entries=entries)
+
+    assert calls == [3]
+    assert list(map(lambda x: x['Id'], res['Successful'])) == ['1', '2']
+    assert len(res['Failed']) == 1
+    assert res['Failed'][0]['Id'] == '0'
+    assert res['Failed'][0]['Code'] == 'AccessDenied'
+    # failed one keeps the extended receipt handle to be deleted again
+    assert entries[0]['ReceiptHandle'].startswith('-..s3BucketName..-')
+
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 1
+    res = sqs_client.receive_message(
+        QueueUrl=sqs_client_queue['QueueUrl'], MaxNumberOfMessages=10)
+    assert len(res['Messages']) == 1
+
+
+def test_extended_messaging_w_compression(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, big_message, receive_message_extended_client,
+        delete_message_extended_client):
+    sqs = SQSExtendedMessage(session, bucket_name, compression='gzip')
+    attributes = {'send_message': sqs_client.send_message}
+    add_custom_method = sqs.add_send_message_extended(None)
+    add_custom_method(class_attributes=attributes)
+    send_method = attributes['send_message_extended']
+
+    # send
+    res = send_method(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageBody=big_message)
+    assert 'MessageId' in res
+
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    key = res['Contents'][0]['Key']
+    assert res['Contents'][0]['Size'] < len(big_message)
+    res = s3_client.head_object(Bucket=bucket_name, Key=key)
+    assert res['Metadata'] == {'payload-compression': 'gzip'}
+
+    # receive by the instance without compression
+    res = receive_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'])
+    assert res['Messages'][0]['Body'] == big_message
+    assert res['Messages'][0]['MD5OfBody'] == hashlib.md5(
+        big_message.encode()).hexdigest()
+
+    # delete
+    delete_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'],
+        ReceiptHandle=res['Messages'][0]['ReceiptHandle'])
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 0
+
+
+def test_extended_messaging_w_compress_to_fit(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, big_message, receive_message_extended_client):
+    sqs = SQSExtendedMessage(session, bucket_name, compress_to_fit=True)
+    attributes = {'send_message_batch': sqs_client.send_message_batch}
+    add_custom_method = sqs.add_send_message_batch_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    send_method = attributes['send_message_batch_extended']
+    # random text which cannot be compressed enough
+    incompressible = base64.b64encode(os.urandom(2**18)).decode()
+    attr = {
+        'string_attr': {
+            'StringValue': 'string_something',
+            'DataType': 'String'
+        },
+    }
+
+    # send
+    res = send_method(
+        QueueUrl=sqs_client_queue['QueueUrl'], Entries=[
+            {'Id': '1', 'MessageBody': big_message,
+             'MessageAttributes': attr},
+            {'Id': '2', 'MessageBody': incompressible}])
+    assert len(res['Successful']) == 2
+
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 1
+
+    # receive temporal message
+    res = sqs_client.receive_message(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10, VisibilityTimeout=0, WaitTimeSeconds=0)
+    compressed = next(
+        m for m in res['Messages'] if 'string_attr' in m['MessageAttributes'])
+    assert compressed['MessageAttributes']['ExtendedPayloadEncoding'] == {
+        'StringValue': 'zlib+base64', 'DataType': 'String'}
+    assert len(compressed['Body']) < len(big_message)
+
+    # receive actual message
+    res = receive_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], MaxNumberOfMessages=10,
+        MessageAttributeNames=['string_attr'])
+
+    bodies = {m['MessageId']: m for m in res['Messages']}
+    assert bodies[compressed['MessageId']]['Body'] == big_message
+    assert bodies[compressed['MessageId']]['MessageAttributes'] == attr
+    assert bodies[compressed['MessageId']]['MD5OfBody'] == hashlib.md5(
+        big_message.encode()).hexdigest()
+    assert not bodies[compressed['MessageId']]['ReceiptHandle'].startswith(
+        '-..s3BucketName..-')
+    del bodies[compressed['MessageId']]
+    assert list(bodies.values())[0]['Body'] == incompressible
+
+
+def test_send_message_extended_w_reserved_encoding_attribute(
+        send_message_extended_client):
+    with pytest.raises(ValueError) as excinfo:
+        send_message_extended_client(
+            MessageAttributes={'ExtendedPayloadEncoding': 'test'}
+        )
+    assert "ExtendedPayloadEncoding is reserved name" in str(excinfo.value)
+
+
+def test_extended_messaging_w_stream(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, tmp_path, receive_message_extended_client,
+        delete_message_batch_extended_client, monkeypatch):
+    # moto stores aws-chunked parts of upload_part with checksum trailers
+    # as they are, so that disable the default checksum calculation
+    monkeypatch.setenv('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')
+    sqs = SQSExtendedMessage(
+        session, bucket_name, multipart_threshold=5 * 2**20,
+        multipart_chunksize=5 * 2**20)
+    attributes = {'send_message_batch': sqs_client.send_message_batch}
+    add_custom_method = sqs.add_send_message_batch_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    send_method = attributes['send_message_batch_extended']
+    body = 'x' * (11 * 2**20)
+    path = tmp_path / 'body.txt'
+    path.write_text(body)
+
+    # send
+    with open(path, 'rb') as f:
+        res = send_method(
+            QueueUrl=sqs_client_queue['QueueUrl'], Entries=[
+                {'Id': '1', 'MessageBody': path},
+                {'Id': '2', 'MessageBody': f},
+                {'Id': '3', 'MessageBody': io.BytesIO(b'small text')}])
+    assert len(res['Successful']) == 3
+
+    # parts are uploaded by multipart upload
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert sorted(o['Size'] for o in res['Contents']) == [10, len(body), len(
+        body)]
+    assert sorted(o['ETag'].endswith('-3"') for o in res['Contents']) == [
+        False, True, True]
+
+    # receive
+    res = receive_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10)
+    assert sorted(m['Body'] for m in res['Messages']) == [
+        'small text', body, body]
+
+    # delete
+    delete_message_batch_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], Entries=[
+            {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+            for i, m in enumerate(res['Messages'])])
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 0
+
+
+def test_send_message_extended_w_unseekable_stream(
+        send_message_extended_client):
+    class Stream(object):
+        def read(self, size=-1):
+            return b''
+
+    with pytest.raises(ValueError) as excinfo:
+        send_message_extended_client(MessageBody=Stream())
+    assert "file-like message body must be seekable" in str(excinfo.value)
+
+
+def test_extended_messaging_w_ranged_download(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message, send_message_extended_client, monkeypatch):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, download_threshold=2**16,
+        download_part_size=2**16)
+    attributes = {'receive_message': sqs_client.receive_message}
+    add_custom_method = sqs.add_receive_message_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    receive_method = attributes['receive_message_extended']
+
+    s3 = sqs.s3.meta.client
+    get_object = s3.get_object
+    ranges = []
+
+    def get_object_w_range(**kwargs):
+        ranges.append(kwargs.get('Range'))
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(s3, 'get_object', get_object_w_range)
+
+    # send
+    send_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageBody=big_message)
+
+    # receive
+    res = receive_method(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'])
+    assert res['Messages'][0]['Body'] == big_message
+    assert res['Messages'][0]['MD5OfBody'] == hashlib.md5(
+        big_message.encode()).hexdigest()
+
+    parts = -(-len(big_message) // 2**16)
+    assert len(ranges) == parts
+    assert ranges[0] == f'bytes=0-{2**16 - 1}'
+    assert (
+        f'bytes={(parts - 1) * 2**16}-{len(big_message) - 1}') in ranges
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_extended_messaging_w_spool(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, big_message, tmp_path, compression):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, compression=compression,
+        spool_threshold=2**10, spool_directory=str(tmp_path),
+        download_part_size=2**12)
+    attributes = {
+        'send_message_batch': sqs_client.send_message_batch,
+        'receive_message': sqs_client.receive_message,
+        'delete_message_batch': sqs_client.delete_message_batch,
+    }
+    for add in (sqs.add_send_message_batch_extended,
+                sqs.add_receive_message_extended,
+                sqs.add_delete_message_batch_extended):
+        add_custom_method = add('creating-client-class.sqs')
+        add_custom_method(class_attributes=attributes)
+    path = tmp_path / 'body.txt'
+    path.write_text(big_message)
+
+    # send
+    with open(path, 'rb') as f:
+        res = attributes['send_message_batch_extended'](
+            QueueUrl=sqs_client_queue['QueueUrl'], Entries=[
+                {'Id': '1', 'MessageBody': f},
+                {'Id': '2', 'MessageBody': big_message}])
+    assert len(res['Successful']) == 2
+
+    # streams are compressed as well as str in spooled mode
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    sizes = [o['Size'] for o in res['Contents']]
+    if compression is None:
+        assert sizes == [len(big_message)] * 2
+    else:
+        assert sizes[0] == sizes[1] < len(big_message)
+    # spooled files of compressed streams are removed
+    assert os.listdir(tmp_path) == ['body.txt']
+
+    # receive
+    res = attributes['receive_message_extended'](
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10)
+    assert len(res['Messages']) == 2
+    for message in res['Messages']:
+        assert message['MD5OfBody'] == hashlib.md5(
+            big_message.encode()).hexdigest()
+        with message['Body'] as body:
+            assert body.read() == big_message.encode()
+
+    # delete
+    attributes['delete_message_batch_extended'](
+        QueueUrl=sqs_client_queue['QueueUrl'], Entries=[
+            {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+            for i, m in enumerate(res['Messages'])])
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 0
+
+
+def test_send_message_extended_w_mmap(
+        s3_bucket, bucket_name, sqs_client_queue, s3_client, tmp_path,
+        send_message_extended_client, receive_message_extended_client):
+    body = b'\x00binary' * 2**15
+    path = tmp_path / 'body.bin'
+    path.write_bytes(body)
+
+    # mmap is sent as bytes-like object without being read as a stream
+    with open(path, 'rb') as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        send_message_extended_client(
+            QueueUrl=sqs_client_queue['QueueUrl'], MessageBody=mapped)
+
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert [o['Size'] for o in res['Contents']] == [len(body)]
+
+    res = receive_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'])
+    assert res['Messages'][0]['Body'] == body.decode()
+
+
+def test_extended_messaging_w_lazy_payload(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message, send_message_batch_extended_client, monkeypatch):
+    sqs = SQSExtendedMessage(session, bucket_name, lazy_payload=True)
+    attributes = {'receive_message': sqs_client.receive_message}
+    add_custom_method = sqs.add_receive_message_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    receive_method = attributes['receive_message_extended']
+
+    s3 = sqs.s3.meta.client
+    get_object = s3.get_object
+    keys = []
+
+    def get_object_w_count(**kwargs):
+        keys.append(kwargs['Key'])
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(s3, 'get_object', get_object_w_count)
+
+    # send
+    send_message_batch_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], Entries=[
+            {'Id': str(i), 'MessageBody': big_message} for i in range(0, 3)])
+
+    # receive
+    res = receive_method(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10)
+    messages = res['Messages']
+    assert len(messages) == 3
+    assert keys == []
+    assert all(isinstance(m['Body'], LazyPayload) for m in messages)
+    assert all('MD5OfBody' not in m for m in messages)
+    assert all(
+        m['ReceiptHandle'].startswith('-..s3BucketName..-') for m in messages)
+
+    # resolve at the first access
+    assert messages[0]['Body'] == big_message
+    assert len(keys) == 1
+    assert messages[0]['Body'] == big_message
+    assert isinstance(messages[0]['Body'], str)
+    assert messages[0]['MD5OfBody'] == hashlib.md5(
+        big_message.encode()).hexdigest()
+
+    # resolve the others concurrently
+    prefetch(messages)
+    assert len(keys) == 3
+    assert all(m['Body'] == big_message for m in messages)
+    assert all('MD5OfBody' in m for m in messages)
+
+
+def test_extended_messaging_w_binary(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, send_message_batch_extended_client,
+        receive_message_extended_client):
+    sqs = SQSExtendedMessage(session, bucket_name, raw_body=True)
+    attributes = {'receive_message': sqs_client.receive_message}
+    add_custom_method = sqs.add_receive_message_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    receive_method = attributes['receive_message_extended']
+    small = os.urandom(2**10)
+    large = bytearray(os.urandom(2**18))
+
+    # send
+    res = send_message_batch_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], Entries=[
+            {'Id': '1', 'MessageBody': small},
+            {'Id': '2', 'MessageBody': memoryview(large)},
+            {'Id': '3', 'MessageBody': 'text'}])
+    assert len(res['Successful']) == 3
+
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 1
+    assert res['Contents'][0]['Size'] == len(large)
+
+    # receive temporal message
+    res = sqs_client.receive_message(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10, VisibilityTimeout=0, WaitTimeSeconds=0)
+    encoded = next(
+        m for m in res['Messages']
+        if 'ExtendedPayloadEncoding' in m.get('MessageAttributes', {}))
+    assert encoded['Body'] == base64.b64encode(small).decode()
+    assert encoded['MessageAttributes']['ExtendedPayloadEncoding'][
+        'StringValue'] == 'base64'
+
+    # receive actual message as bytes
+    res = receive_method(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10, VisibilityTimeout=0)
+    assert sorted(bytes(m['Body']) for m in res['Messages']) == sorted(
+        [small, bytes(large), b'text'])
+    for m in res['Messages']:
+        assert m['MD5OfBody'] == hashlib.md5(m['Body']).hexdigest()
+
+    # binary message cannot be decoded without raw_body
+    with pytest.raises(UnicodeDecodeError):
+        receive_message_extended_client(
+            QueueUrl=sqs_client_queue['QueueUrl'],
+            MessageAttributeNames=['All'], MaxNumberOfMessages=10)
+
+
+@pytest.mark.parametrize('strategy,calls,stored', [
+    ('auto', 2, 0),
+    ('split', 2, 0),
+    ('offload', 1, 2),
+])
+def test_extended_messaging_w_batch_overflow(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, receive_message_extended_client,
+        strategy, calls, stored):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, batch_overflow_strategy=strategy)
+    sizes = []
+
+    def send_message_batch(**kwargs):
+        sizes.append(sum(
+            sqs.get_message_size(
+                e.get('MessageAttributes', {}), e['MessageBody'])
+            for e in kwargs['Entries']))
+        return sqs_client.send_message_batch(**kwargs)
+
+    attributes = {'send_message_batch': send_message_batch}
+    add_custom_method = sqs.add_send_message_batch_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    send_method = attributes['send_message_batch_extended']
+    # each entry is under the threshold, but the total is not
+    bodies = [str(i) * 30000 for i in range(10)]
+
+    res = send_method(
+        QueueUrl=sqs_client_queue['QueueUrl'], Entries=[
+            {'Id': str(i), 'MessageBody': body}
+            for i, body in enumerate(bodies)])
+    assert [r['Id'] for r in res['Successful']] == [
+        str(i) for i in range(10)]
+    assert len(sizes) == calls
+    assert all(size <= 2**18 for size in sizes)
+
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == stored
+
+    res = receive_message_extended_client(
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10)
+    assert sorted(m['Body'] for m in res['Messages']) == bodies
+
+
+def test_pack_entries(sqs_extended_message):
+    sizes = {0: 2**17, 1: 2**16, 2: 2**17, 3: 2**16}
+
+    assert sqs_extended_message._pack_entries(sizes, False) == [
+        [0, 2], [1, 3]]
+    # consecutive entries for FIFO queue
+    assert sqs_extended_message._pack_entries(sizes, True) == [
+        [0, 1], [2, 3]]
+    assert sqs_extended_message._pack_entries({0: 1, 1: 1}, False) == [
+        [0, 1]]
+
+
+def test_invalid_batch_overflow_strategy(session, bucket_name):
+    with pytest.raises(ValueError):
+        SQSExtendedMessage(
+            session, bucket_name, batch_overflow_strategy='unknown')
+
+
+def test_extended_messaging_w_many_entries(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, big_message):
+    sqs = SQSExtendedMessage(session, bucket_name)
+    calls = []
+
+    def send_message_batch(**kwargs):
+        calls.append([e['Id'] for e in kwargs['Entries']])
+        if 'fail' in calls[-1]:
+            raise ValueError('failed to send')
+        return sqs_client.send_message_batch(**kwargs)
+
+    attributes = {'send_message_batch': send_message_batch}
+    add_custom_method = sqs.add_send_message_batch_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    send_method = attributes['send_message_batch_extended']
+    entries = [
+        {'Id': f'id{i}', 'MessageBody': big_message if i == 3 else str(i)}
+        for i in range(25)]
+    entries.append({'Id': 'fail', 'MessageBody': 'failed'})
+
+    res = send_method(
+        QueueUrl=sqs_client_queue['QueueUrl'], Entries=entries)
+    assert [r['Id'] for r in res['Successful']] == [
+        f'id{i}' for i in range(20)]
+    assert sorted(len(c) for c in calls) == [6, 10, 10]
+    assert [r['Id'] for r in res['Failed']] == [
+        'id20', 'id21', 'id22', 'id23', 'id24', 'fail']
+    assert res['Failed'][0]['Code'] == 'ValueError'
+
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 1
+
+
+def test_extended_messaging_w_many_fifo_entries(
+        session, bucket_name, sqs_client):
+    queue = sqs_client.create_queue(
+        QueueName='test.fifo', Attributes={
+            'FifoQueue': 'true', 'ContentBasedDeduplication': 'true'})
+    sqs = SQSExtendedMessage(session, bucket_name)
+    attributes = {'send_message_batch': sqs_client.send_message_batch}
+    add_custom_method = sqs.add_send_message_batch_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    send_method = attributes['send_message_batch_extended']
+
+    res = send_method(
+        QueueUrl=queue['QueueUrl'], Entries=[
+            {'Id': str(i), 'MessageBody': str(i), 'MessageGroupId': 'g'}
+            for i in range(15)])
+    assert len(res['Successful']) == 15
+
+    bodies = []
+    for _ in range(2):
+        res = sqs_client.receive_message(
+            QueueUrl=queue['QueueUrl'], MaxNumberOfMessages=10)
+        bodies.extend(m['Body'] for m in res['Messages'])
+        sqs_client.delete_message_batch(
+            QueueUrl=queue['QueueUrl'], Entries=[
+                {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+                for i, m in enumerate(res['Messages'])])
+    assert bodies == [str(i) for i in range(15)]
+
+
+def test_extended_messaging_w_failed_fifo_batch(
+        session, bucket_name, sqs_client):
+    queue = sqs_client.create_queue(
+        QueueName='test.fifo', Attributes={
+            'FifoQueue': 'true', 'ContentBasedDeduplication': 'true'})
+    sqs = SQSExtendedMessage(session, bucket_name)
+    calls = []
+
+    def send_message_batch(**kwargs):
+        calls.append([e['Id'] for e in kwargs['Entries']])
+        if len(calls) == 1:
+            raise ValueError('failed to send')
+        return sqs_client.send_message_batch(**kwargs)
+
+    attributes = {'send_message_batch': send_message_batch}
+    add_custom_method = sqs.add_send_message_batch_extended(
+        'creating-client-class.sqs')
+    add_custom_method(class_attributes=attributes)
+    send_method = attributes['send_message_batch_extended']
+    groups = ['g', 'h'] * 6 + ['k'] * 3
+
+    res = send_method(
+        QueueUrl=queue['QueueUrl'], Entries=[
+            {'Id': str(i), 'MessageBody': str(i), 'MessageGroupId': group}
+            for i, group in enumerate(groups)])
+    # entries of the failed groups are not sent ahead of failed ones
+    assert calls == [[str(i) for i in range(10)], ['12', '13', '14']]
+    assert [r['Id'] for r in res['Successful']] == ['12', '13', '14']
+    assert [r['Id'] for r in res['Failed']] == [str(i) for i in range(12)]
+    assert res['Failed'][0]['Code'] == 'ValueError'
+    assert [r['Code'] for r in res['Failed'][10:]] == [
+        'PreviousEntryFailed'] * 2
+
+
+def test_extended_messaging_w_content_addressed(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, big_message, monkeypatch):
+    sqs = SQSExtendedMessage(session, bucket_name, content_addressed=True)
+    attributes = {
+        'send_message': sqs_client.send_message,
+        'send_message_batch': sqs_client.send_message_batch,
+        'receive_message': sqs_client.receive_message,
+        'delete_message': sqs_client.delete_message,
+        'delete_message_batch': sqs_client.delete_message_batch,
+    }
+    event = 'creating-client-class.sqs'
+    for add_method in (
+            sqs.add_send_message_extended, sqs.add_receive_message_extended,
+            sqs.add_delete_message_extended,
+            sqs.add_send_message_batch_extended,
+            sqs.add_delete_message_batch_extended):
+        add_method(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    uploads = []
+    put_object = s3_client.put_object
+
+    def put_object_w_count(**kwargs):
+        uploads.append(kwargs['Key'])
+        return put_object(**kwargs)
+
+    monkeypatch.setattr(sqs.s3.meta.client, 'put_object', put_object_w_count)
+
+    # the same message is stored once with a marker of each message
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+    attributes['send_message_batch_extended'](
+        QueueUrl=queue_url, Entries=[
+            {'Id': str(i), 'MessageBody': big_message} for i in range(2)])
+    key = hashlib.sha256(big_message.encode()).hexdigest()
+    assert uploads.count(key) == 1
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert sorted(o['Key'] for o in res['Contents'])[0] == key
+    assert res['KeyCount'] == 4
+
+    res = attributes['receive_message_extended'](
+        QueueUrl=queue_url, MaxNumberOfMessages=10,
+        MessageAttributeNames=['All'])
+    messages = res['Messages']
+    assert [m['Body'] for m in messages] == [big_message] * 3
+    assert all('MessageAttributes' not in m for m in messages)
+    assert all(
+        f'{key}.refs/' in m['ReceiptHandle'] for m in messages)
+
+    # the stored object is kept while other messages refer to it
+    attributes['delete_message_extended'](
+        QueueUrl=queue_url, ReceiptHandle=messages[0]['ReceiptHandle'])
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 3
+    s3_client.head_object(Bucket=bucket_name, Key=key)
+
+    res = attributes['delete_message_batch_extended'](
+        QueueUrl=queue_url, Entries=[
+            {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+            for i, m in enumerate(messages[1:])])
+    assert len(res['Successful']) == 2
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 0
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_extended_messaging_w_pack_batch(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, big_message, compression):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, pack_batch=True, compression=compression)
+    attributes = {
+        'send_message_batch': sqs_client.send_message_batch,
+        'receive_message': sqs_client.receive_message,
+        'delete_message': sqs_client.delete_message,
+        'delete_message_batch': sqs_client.delete_message_batch,
+    }
+    event = 'creating-client-class.sqs'
+    for add_method in (
+            sqs.add_receive_message_extended,
+            sqs.add_delete_message_extended,
+            sqs.add_send_message_batch_extended,
+            sqs.add_delete_message_batch_extended):
+        add_method(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    bodies = [big_message.replace('TEST', str(i)) for i in range(3)]
+
+    # offloaded entries are stored in one object with byte ranges
+    res = attributes['send_message_batch_extended'](
+        QueueUrl=queue_url, Entries=[
+            {'Id': str(i), 'MessageBody': body}
+            for i, body in enumerate(bodies)])
+    assert len(res['Successful']) == 3
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 1
+    key = res['Contents'][0]['Key']
+    assert key.endswith('.parts-3')
+
+    res = attributes['receive_message_extended'](
+        QueueUrl=queue_url, MaxNumberOfMessages=10,
+        MessageAttributeNames=['All'])
+    messages = res['Messages']
+    assert sorted(m['Body'] for m in messages) == sorted(bodies)
+
+    # the object is kept until all packed messages are deleted
+    attributes['delete_message_extended'](
+        QueueUrl=queue_url, ReceiptHandle=messages[0]['ReceiptHandle'])
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 2
+
+    res = attributes['delete_message_batch_extended'](
+        QueueUrl=queue_url, Entries=[
+            {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+            for i, m in enumerate(messages[1:])])
+    assert len(res['Successful']) == 2
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    assert res['KeyCount'] == 0
+
+
+def test_pack_batch_w_content_addressed(session, bucket_name):
+    with pytest.raises(ValueError):
+        SQSExtendedMessage(
+            session, bucket_name, pack_batch=True, content_addressed=True)
+
+
+def test_extended_messaging_w_payload_cache(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, big_message, monkeypatch):
+    cache = PayloadCache()
+    sqs = SQSExtendedMessage(session, bucket_name, payload_cache=cache)
+    attributes = {
+        'send_message': sqs_client.send_message,
+        'receive_message': sqs_client.receive_message,
+        'delete_message': sqs_client.delete_message,
+    }
+    event = 'creating-client-class.sqs'
+    for add_method in (
+            sqs.add_send_message_extended, sqs.add_receive_message_extended,
+            sqs.add_delete_message_extended):
+        add_method(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    downloads = []
+    get_object = s3_client.get_object
+
+    def get_object_w_count(**kwargs):
+        downloads.append(kwargs['Key'])
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(sqs.s3.meta.client, 'get_object', get_object_w_count)
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+
+    # the redelivered message is got from the cache
+    for _ in range(2):
+        res = attributes['receive_message_extended'](
+            QueueUrl=queue_url, VisibilityTimeout=0,
+            MessageAttributeNames=['All'])
+        assert res['Messages'][0]['Body'] == big_message
+    assert len(downloads) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    attributes['delete_message_extended'](
+        QueueUrl=queue_url, ReceiptHandle=res['Messages'][0]['ReceiptHandle'])
+    assert len(cache) == 0
+
+
+def test_extended_messaging_w_byte_budget(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message):
+    budget = ByteBudget(len(big_message) * 2)
+    sqs = SQSExtendedMessage(session, bucket_name, byte_budget=budget)
+    attributes = {
+        'send_message_batch': sqs_client.send_message_batch,
+        'receive_message': sqs_client.receive_message,
+        'delete_message': sqs_client.delete_message,
+        'delete_message_batch': sqs_client.delete_message_batch,
+    }
+    event = 'creating-client-class.sqs'
+    for add_method in (
+            sqs.add_send_message_batch_extended,
+            sqs.add_receive_message_extended,
+            sqs.add_delete_message_extended,
+            sqs.add_delete_message_batch_extended):
+        add_method(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    attributes['send_message_batch_extended'](
+        QueueUrl=queue_url, Entries=[
+            {'Id': str(i), 'MessageBody': big_message} for i in range(3)]
+        + [{'Id': '3', 'MessageBody': 'small text'}])
+
+    res = attributes['receive_message_extended'](
+        QueueUrl=queue_url, MessageAttributeNames=['All'],
+        MaxNumberOfMessages=2)
+    messages = res['Messages']
+    assert budget.stats()['used_bytes'] == sum(
+        len(m['Body']) for m in messages if m['Body'] != 'small text')
+
+    # receiving waits until the held messages are deleted
+    received = []
+    thread = threading.Thread(target=lambda: received.extend(
+        attributes['receive_message_extended'](
+            QueueUrl=queue_url, MessageAttributeNames=['All'],
+            MaxNumberOfMessages=2)['Messages']))
+    thread.start()
+    thread.join(0.5)
+    assert received == [] and budget.stats()['waiting'] == 1
+
+    attributes['delete_message_extended'](
+        QueueUrl=queue_url, ReceiptHandle=messages[0]['ReceiptHandle'])
+    attributes['delete_message_batch_extended'](
+        QueueUrl=queue_url, Entries=[
+            {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+            for i, m in enumerate(messages[1:])])
+    thread.join(5)
+    assert len(received) == 2
+    assert len(messages) + len(received) == 4
+    assert budget.stats()['wait_seconds'] > 0.1
+
+    attributes['delete_message_batch_extended'](
+        QueueUrl=queue_url, Entries=[
+            {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']}
+            for i, m in enumerate(received)])
+    assert budget.used == 0
+
+
+def test_extended_messaging_w_byte_budget_released(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message):
+    budget = ByteBudget(len(big_message) * 4)
+    sqs = SQSExtendedMessage(session, bucket_name, byte_budget=budget)
+    attributes = {
+        'send_message': sqs_client.send_message,
+        'receive_message': sqs_client.receive_message,
+        'change_message_visibility': sqs_client.change_message_visibility,
+        'change_message_visibility_batch': (
+            sqs_client.change_message_visibility_batch),
+    }
+    event = 'creating-client-class.sqs'
+    for add_method in (
+            sqs.add_send_message_extended,
+            sqs.add_receive_message_extended,
+            sqs.add_change_message_visibility_extended,
+            sqs.add_change_message_visibility_batch_extended):
+        add_method(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+
+    def receive():
+        return attributes['receive_message_extended'](
+            QueueUrl=queue_url, MessageAttributeNames=['All'],
+            VisibilityTimeout=0)['Messages'][0]
+
+    # the message received again replaces the hold of the previous delivery
+    first = receive()
+    second = receive()
+    assert first['MessageId'] == second['MessageId']
+    assert budget.used == len(big_message) and len(budget) == 1
+
+    # resetting the visibility releases the hold, extending it renews it
+    attributes['change_message_visibility_batch_extended'](
+        QueueUrl=queue_url, Entries=[{
+            'Id': '0', 'ReceiptHandle': second['ReceiptHandle'],
+            'VisibilityTimeout': 60}])
+    assert budget._holds[second['MessageId']][1] > time.monotonic() + 50
+    attributes['change_message_visibility_extended'](
+        QueueUrl=queue_url, ReceiptHandle=second['ReceiptHandle'],
+        VisibilityTimeout=0)
+    assert budget.used == 0
+
+    third = receive()
+    assert attributes['release_message_extended'](
+        ReceiptHandle=third['ReceiptHandle']) == len(big_message)
+    assert attributes['release_message_extended'](
+        ReceiptHandle=third['ReceiptHandle']) == 0
+    assert budget.used == 0
+
+
+def test_extended_messaging_w_byte_budget_lazy_payload(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message):
+    budget = ByteBudget(1)
+    sqs = SQSExtendedMessage(
+        session, bucket_name, byte_budget=budget, lazy_payload=True)
+    attributes = {
+        'send_message': sqs_client.send_message,
+        'receive_message': sqs_client.receive_message,
+    }
+    event = 'creating-client-class.sqs'
+    sqs.add_send_message_extended(event)(class_attributes=attributes)
+    sqs.add_receive_message_extended(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+
+    # nothing is held because nothing is got from S3 at receiving
+    res = attributes['receive_message_extended'](
+        QueueUrl=queue_url, MessageAttributeNames=['All'])
+    assert len(res['Messages']) == 1
+    assert budget.used == 0 and len(budget) == 0
+
+
+def test_extended_messaging_wo_calculate_md5(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message, send_message_extended_client):
+    sqs = SQSExtendedMessage(session, bucket_name, calculate_md5=False)
+    attributes = {'receive_message': sqs_client.receive_message}
+    sqs.add_receive_message_extended('creating-client-class.sqs')(
+        class_attributes=attributes)
+    attr = {'string_attr': {'StringValue': 'string', 'DataType': 'String'}}
+    for body in ('small text', big_message):
+        send_message_extended_client(
+            QueueUrl=sqs_client_queue['QueueUrl'], MessageBody=body,
+            MessageAttributes=dict(attr))
+
+    res = attributes['receive_message_extended'](
+        QueueUrl=sqs_client_queue['QueueUrl'], MessageAttributeNames=['All'],
+        MaxNumberOfMessages=10)
+    messages = {m['Body']: m for m in res['Messages']}
+    assert set(messages) == {'small text', big_message}
+
+    # the message kept in the queue has MD5 given by SQS
+    small = messages['small text']
+    assert small['MD5OfBody'] == hashlib.md5(b'small text').hexdigest()
+    assert 'MD5OfMessageAttributes' in small
+
+    # MD5 of the reverted message is not calculated
+    assert 'MD5OfBody' not in messages[big_message]
+    assert 'MD5OfMessageAttributes' not in messages[big_message]
+    assert messages[big_message]['MessageAttributes'] == {
+        'string_attr': {'StringValue': 'string', 'DataType': 'String'}}
+
+
+def test_extended_messaging_w_s3_checksum(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message, monkeypatch):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, s3_checksum_algorithm='SHA256')
+    attributes = {
+        'send_message': sqs_client.send_message,
+        'receive_message': sqs_client.receive_message,
+    }
+    event = 'creating-client-class.sqs'
+    for add_method in (
+            sqs.add_send_message_extended, sqs.add_receive_message_extended):
+        add_method(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    checksum = base64.b64encode(
+        hashlib.sha256(big_message.encode()).digest()).decode()
+
+    # the checksum calculated by S3 is kept in the pointer
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+    res = sqs_client.receive_message(
+        QueueUrl=queue_url, VisibilityTimeout=0)
+    pointer = json.loads(res['Messages'][0]['Body'])
+    assert pointer['s3ChecksumAlgorithm'] == 'SHA256'
+    assert pointer['s3Checksum'] == checksum
+
+    # moto doesn't return the checksum, which S3 does with ChecksumMode
+    returned = {'ChecksumSHA256': checksum}
+    s3 = sqs.s3.meta.client
+    get_object = s3.get_object
+    calls = []
+
+    def get_object_w_checksum(**kwargs):
+        calls.append(kwargs)
+        return {**get_object(**kwargs), **returned}
+
+    monkeypatch.setattr(s3, 'get_object', get_object_w_checksum)
+    res = attributes['receive_message_extended'](
+        QueueUrl=queue_url, MessageAttributeNames=['All'],
+        VisibilityTimeout=0)
+    message = res['Messages'][0]
+    assert message['Body'] == big_message
+    assert calls[0]['ChecksumMode'] == 'ENABLED'
+    # MD5 of body is not calculated for the verified message
+    assert 'MD5OfBody' not in message
+
+    # the overwritten object is not received
+    returned['ChecksumSHA256'] = base64.b64encode(b'0' * 32).decode()
+    with pytest.raises(ValueError) as excinfo:
+        attributes['receive_message_extended'](
+            QueueUrl=queue_url, MessageAttributeNames=['All'])
+    assert 'is expected' in str(excinfo.value)
+
+
+def test_extended_messaging_w_composite_s3_checksum(
+        s3_bucket, session, region, bucket_name, sqs_client, sqs_client_queue,
+        big_message, monkeypatch):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, s3_checksum_algorithm='SHA256',
+        multipart_threshold=2**10, download_threshold=2**10,
+        download_part_size=2**16)
+    attributes = {
+        'send_message': sqs_client.send_message,
+        'receive_message': sqs_client.receive_message,
+    }
+    event = 'creating-client-class.sqs'
+    for add_method in (
+            sqs.add_send_message_extended, sqs.add_receive_message_extended):
+        add_method(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+
+    # moto doesn't return the checksum, which S3 does with ChecksumMode,
+    # and the checksum of multipart upload is composite of parts
+    checksum = base64.b64encode(b'0' * 32).decode() + '-1'
+    s3 = sqs.s3.meta.client
+    create_multipart_upload = s3.create_multipart_upload
+    # moto doesn't decode the aws-chunked body of parts with checksums
+    upload_part = session.client(
+        's3', region_name=region, config=botocore.config.Config(
+            request_checksum_calculation='when_required')).upload_part
+    head_object = s3.head_object
+    get_object = s3.get_object
+    calls = []
+
+    def create_multipart_upload_w_count(**kwargs):
+        calls.append('create_multipart_upload')
+        return create_multipart_upload(**kwargs)
+
+    def get_object_w_count(**kwargs):
+        calls.append(kwargs)
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(
+        s3, 'create_multipart_upload', create_multipart_upload_w_count)
+    monkeypatch.setattr(
+        s3, 'upload_part',
+        lambda ChecksumAlgorithm, **kwargs: upload_part(**kwargs))
+    monkeypatch.setattr(s3, 'head_object', lambda **kwargs: {
+        **head_object(**kwargs), 'ChecksumSHA256': checksum})
+    monkeypatch.setattr(s3, 'get_object', get_object_w_count)
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+    assert calls == ['create_multipart_upload']
+    res = sqs_client.receive_message(
+        QueueUrl=queue_url, VisibilityTimeout=0)
+    assert json.loads(res['Messages'][0]['Body'])['s3Checksum'] == checksum
+
+    # botocore doesn't validate the body against the composite checksum,
+    # so that the message is got by byte ranges and keeps MD5 of body
+    res = attributes['receive_message_extended'](
+        QueueUrl=queue_url, MessageAttributeNames=['All'])
+    message = res['Messages'][0]
+    assert message['Body'] == big_message
+    assert message['MD5OfBody'] == hashlib.md5(
+        big_message.encode()).hexdigest()
+    ranges = [c for c in calls[1:] if 'Range' in c]
+    assert len(ranges) == len(calls) - 1 > 1
+    assert not any('ChecksumMode' in c for c in calls[1:])
+
+
+def test_content_addressed_w_too_many_attributes(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message):
+    queue_url = sqs_client_queue['QueueUrl']
+    attributes = {
+        f'attribute{i}': {'DataType': 'String', 'StringValue': str(i)}
+        for i in range(9)}
+    for content_addressed in (False, True):
+        sqs = SQSExtendedMessage(
+            session, bucket_name, content_addressed=content_addressed)
+        methods = {'send_message': sqs_client.send_message}
+        sqs.add_send_message_extended('creating-client-class.sqs')(
+            class_attributes=methods)
+        send = functools.partial(
+            methods['send_message_extended'], QueueUrl=queue_url,
+            MessageBody=big_message, MessageAttributes=dict(attributes))
+        if not content_addressed:
+            send()
+            continue
+
+        # the reference attribute leaves 8 attributes for the caller
+        with pytest.raises(ValueError) as excinfo:
+            send()
+        assert 'including reserved ones exceed 10' in str(excinfo.value)
+
+
+def test_content_addressed_w_compression(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        s3_client, big_message):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, content_addressed=True, compression='gzip')
+    attributes = {'send_message': sqs_client.send_message}
+    sqs.add_send_message_extended('creating-client-class.sqs')(
+        class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+
+    # gzip headers of the same message sent at different times are same
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+    time.sleep(1.1)
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+    res = s3_client.list_objects_v2(Bucket=bucket_name)
+    data = [o['Key'] for o in res['Contents'] if '.refs/' not in o['Key']]
+    assert len(data) == 1 and res['KeyCount'] == 3
+
+
+def test_content_addressed_w_s3_checksum(
+        s3_bucket, session, bucket_name, sqs_client, sqs_client_queue,
+        big_message, monkeypatch):
+    sqs = SQSExtendedMessage(
+        session, bucket_name, content_addressed=True,
+        s3_checksum_algorithm='SHA256')
+    attributes = {'send_message': sqs_client.send_message}
+    sqs.add_send_message_extended('creating-client-class.sqs')(
+        class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    checksum = base64.b64encode(
+        hashlib.sha256(big_message.encode()).digest()).decode()
+
+    # moto doesn't return the checksum, which S3 does with ChecksumMode
+    s3 = sqs.s3.meta.client
+    head_object = s3.head_object
+    calls = []
+
+    def head_object_w_checksum(**kwargs):
+        calls.append(kwargs)
+        return {**head_object(**kwargs), 'ChecksumSHA256': checksum}
+
+    monkeypatch.setattr(s3, 'head_object', head_object_w_checksum)
+    for _ in range(2):
+        attributes['send_message_extended'](
+            QueueUrl=queue_url, MessageBody=big_message)
+    res = sqs_client.receive_message(
+        QueueUrl=queue_url, MaxNumberOfMessages=10)
+    pointers = [json.loads(m['Body']) for m in res['Messages']]
+
+    # the existing object is referred with its checksum as well
+    assert len(pointers) == 2
+    assert pointers[0]['s3Key'] == pointers[1]['s3Key']
+    assert [p['s3Checksum'] for p in pointers] == [checksum] * 2
+    assert calls[-1]['ChecksumMode'] == 'ENABLED'
+
+
+def test_invalid_s3_checksum_algorithm(session, bucket_name):
+    with pytest.raises(ValueError) as excinfo:
+        SQSExtendedMessage(session, bucket_name, s3_checksum_algorithm='MD5')
+    assert 'unsupported s3_checksum_algorithm: MD5' in str(excinfo.value)
+
+
+def test_change_message_visibility_extended(
+        s3_bucket, sqs_extended_message, bucket_name, sqs_client,
+        sqs_client_queue, s3_client, big_message):
+    attributes = {
+        'send_message': sqs_client.send_message,
+        'receive_message': sqs_client.receive_message,
+        'delete_message': sqs_client.delete_message,
+        'change_message_visibility': sqs_client.change_message_visibility,
+        'change_message_visibility_batch': (
+            sqs_client.change_message_visibility_batch),
+    }
+    event = 'creating-client-class.sqs'
+    sqs = sqs_extended_message
+    for add_method in (
+            sqs.add_send_message_extended, sqs.add_receive_message_extended,
+            sqs.add_delete_message_extended,
+            sqs.add_change_message_visibility_extended,
+            sqs.add_change_message_visibility_batch_extended):
+        add_method(event)(class_attributes=attributes)
+    queue_url = sqs_client_queue['QueueUrl']
+    attributes['send_message_extended'](
+        QueueUrl=queue_url, MessageBody=big_message)
+
+    def receive():
+        return attributes['receive_message_extended'](
+            QueueUrl=queue_url, MessageAttributeNames=['All'],
+            WaitTimeSeconds=0).get('Messages', [])
+
+    messages = receive()
+    receipt_handle = messages[0]['ReceiptHandle']
+    assert receive() == []
+    attributes['change_message_visibility_extended'](
+        QueueUrl=queue_url, ReceiptHandle=receipt_handle,
+        VisibilityTimeout=0)
+
+    messages = receive()
+    assert messages[0]['Body'] == big_message
+    entries = [{
+        'Id': '0', 'ReceiptHandle': messages[0]['ReceiptHandle'],
+        'VisibilityTimeout': 0}]
+    res = attributes['change_message_visibility_batch_extended'](
+        QueueUrl=queue_url, Entries=entries)
+    assert [r['Id'] for r in res['Successful']] == ['0']
+    # given entries keep the extended receipt handle
+    assert entries[0]['ReceiptHandle'] == messages[0]['ReceiptHandle']
+
+    messages = receive()
+    attributes['delete_message_extended'](
+        QueueUrl=queue_url, ReceiptHandle=messages[0]['ReceiptHandle'])
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
+
+    with pytest.raises(ValueError):
+        attributes['change_message_visibility_extended'](
+            QueueUrl=queue_url, VisibilityTimeout=0)
+    with pytest.raises(ValueError):
+        attributes['change_message_visibility_batch_extended'](
+            QueueUrl=queue_url, Entries=[{'Id': '0'}])
+
+
+def test_receive_message_extended_wo_copy(sqs_extended_message):
+    blob = bytearray(b'x' * 1024)
+    attributes = {
+        'binary_attr': {'BinaryValue': blob, 'DataType': 'Binary'},
+        'ExtendedPayloadSize': {'StringValue': '1', 'DataType': 'Number'},
+    }
+    response = {
+        'Messages': [{'Body': 'text', 'MessageAttributes': attributes}],
+        'ResponseMetadata': {'HTTPHeaders': {'header': blob}},
+    }
+
+    is_client, messages, metadata = (
+        sqs_extended_message._parse_received_response(response))
+    assert is_client and messages is response['Messages']
+    assert metadata == {'ResponseMetadata': response['ResponseMetadata']}
+    assert metadata['ResponseMetadata'] is response['ResponseMetadata']
+
+    attr = sqs_extended_message._pop_reserved_attribute(
+        attributes, 'ExtendedPayloadSize')
+    assert list(attr) == ['binary_attr']
+    assert attr['binary_attr']['BinaryValue'] is blob
+    assert 'ExtendedPayloadSize' in attributes
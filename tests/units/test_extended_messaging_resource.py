@@ -58,6 +58,30 @@ def delete_message_extended_resource(session, sqs_extended_message):
     yield
 
 
+@pytest.fixture
+def change_visibility_extended_resource(session, sqs_extended_message):
+    session.events.register(
+        'creating-resource-class.sqs.Message',
+        sqs_extended_message.add_change_message_visibility_extended(
+            'creating-resource-class.sqs.Message')
+    )
+    yield
+
+
+@pytest.fixture
+def change_message_visibility_batch_extended_resource(
+        sqs_extended_message, sqs_resource_queue):
+    attributes = {
+        'change_message_visibility_batch': (
+            sqs_resource_queue.change_message_visibility_batch)}
+
+    add_custom_method = (
+        sqs_extended_message.add_change_message_visibility_batch_extended(
+            'creating-resource-class.sqs.Queue'))
+    add_custom_method(class_attributes=attributes)
+    return attributes['change_message_visibility_batch_extended']
+
+
 @pytest.fixture
 def send_message_batch_extended_resource(
         sqs_extended_message, sqs_resource_queue):
@@ -230,3 +254,37 @@ def test_multiple_extended_messaging_w_large_text(
 
     res = s3_client.list_objects_v2(Bucket=bucket_name)
     assert res['KeyCount'] == 0
+
+
+##
+# visibility change test
+##
+
+
+def test_change_visibility_extended(
+        s3_bucket, s3_client, bucket_name, big_message, sqs_resource_queue,
+        send_message_extended_resource, receive_message_extended_resource,
+        delete_message_extended_resource,
+        change_visibility_extended_resource,
+        change_message_visibility_batch_extended_resource):
+    send_message_extended_resource(MessageBody=big_message)
+
+    messages = receive_message_extended_resource(
+        MessageAttributeNames=['All'], WaitTimeSeconds=0)
+    messages[0].change_visibility_extended(VisibilityTimeout=0)
+
+    messages = receive_message_extended_resource(
+        MessageAttributeNames=['All'], WaitTimeSeconds=0)
+    assert messages[0].body == big_message
+    res = change_message_visibility_batch_extended_resource(Entries=[{
+        'Id': '0', 'ReceiptHandle': messages[0].meta.data['ReceiptHandle'],
+        'VisibilityTimeout': 0}])
+    assert [r['Id'] for r in res['Successful']] == ['0']
+
+    # the extended receipt handle is kept to delete the stored message
+    messages = receive_message_extended_resource(
+        MessageAttributeNames=['All'], WaitTimeSeconds=0)
+    messages[0].change_visibility_extended(VisibilityTimeout=10)
+    messages[0].delete_extended()
+    assert sqs_resource_queue.receive_messages(WaitTimeSeconds=0) == []
+    assert s3_client.list_objects_v2(Bucket=bucket_name)['KeyCount'] == 0
@@ -0,0 +1,94 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import threading
+import time
+import types
+
+import pytest
+from aws_sqs_ext_client.heartbeat import VisibilityHeartbeat
+
+
+@pytest.fixture
+def visibility_client():
+    calls = []
+    lock = threading.Lock()
+
+    def change_message_visibility_batch_extended(QueueUrl, Entries):
+        with lock:
+            calls.append((QueueUrl, Entries))
+        return {
+            'Successful': [
+                {'Id': e['Id']} for e in Entries
+                if e['ReceiptHandle'] != 'deleted'],
+            'Failed': [
+                {'Id': e['Id'], 'SenderFault': True,
+                 'Code': 'ReceiptHandleIsInvalid', 'Message': 'invalid'}
+                for e in Entries if e['ReceiptHandle'] == 'deleted'],
+        }
+
+    return types.SimpleNamespace(
+        calls=calls, change_message_visibility_batch_extended=(
+            change_message_visibility_batch_extended))
+
+
+def test_heartbeat_beat(visibility_client):
+    with VisibilityHeartbeat(visibility_client, 60) as heartbeat:
+        for i in range(12):
+            heartbeat.add('q1', f'rh{i:02}')
+        heartbeat.add('q2', 'deleted')
+        heartbeat.beat()
+
+        # one call per 10 messages of each queue
+        calls = visibility_client.calls
+        assert [(url, len(entries)) for url, entries in calls] == [
+            ('q1', 10), ('q1', 2), ('q2', 1)]
+        assert calls[0][1][0] == {
+            'Id': '0', 'ReceiptHandle': 'rh00', 'VisibilityTimeout': 60}
+
+        # failed and discarded messages are not extended any more
+        heartbeat.discard('q1', 'rh00')
+        del calls[:]
+        heartbeat.beat()
+        assert [(url, len(entries)) for url, entries in calls] == [
+            ('q1', 10), ('q1', 1)]
+
+
+def test_heartbeat_every_interval(visibility_client):
+    heartbeat = VisibilityHeartbeat(visibility_client, 2, interval=0.1)
+    with heartbeat.keep('q', 'rh'):
+        time.sleep(0.35)
+    calls = len(visibility_client.calls)
+    assert calls >= 2
+
+    time.sleep(0.2)
+    heartbeat.close()
+    assert len(visibility_client.calls) == calls
+    with pytest.raises(ValueError):
+        heartbeat.add('q', 'rh')
+
+
+def test_heartbeat_w_invalid_interval(visibility_client):
+    with pytest.raises(ValueError):
+        VisibilityHeartbeat(visibility_client, 10, interval=10)
@@ -0,0 +1,80 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+
+from aws_sqs_ext_client.payload_cache import PayloadCache
+
+
+def test_payload_cache_lru():
+    cache = PayloadCache(max_bytes=10)
+    cache.put('bucket', 'a', b'0123', {})
+    cache.put('bucket', 'b', b'4567', {'payload-compression': 'gzip'})
+    assert cache.get('bucket', 'a') == (b'0123', {})
+
+    # 'b' is evicted as the least recently used
+    cache.put('bucket', 'c', b'89ab', {})
+    assert cache.get('bucket', 'b') is None
+    assert cache.get('other', 'a') is None
+    assert len(cache) == 2
+
+    # objects larger than max_bytes are not cached without directory
+    cache.put('bucket', 'd', b'0123456789ab', {})
+    assert cache.get('bucket', 'd') is None
+
+    cache.invalidate('bucket', 'a')
+    assert cache.get('bucket', 'a') is None
+    assert cache.stats() == {
+        'hits': 1, 'misses': 4, 'memory_items': 1, 'memory_bytes': 4,
+        'disk_items': 0, 'disk_bytes': 0,
+    }
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_payload_cache_w_directory(tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = PayloadCache(max_bytes=4, directory=directory, max_disk_bytes=8)
+    metadata = {'payload-compression': 'gzip'}
+    cache.put('bucket', 'a', b'0123', metadata)
+    cache.put('bucket', 'b', b'4567', {})
+    assert cache.stats()['disk_items'] == 1
+    assert len(os.listdir(directory)) == 1
+
+    # the object on disk is moved into memory, and 'b' is on disk
+    assert cache.get('bucket', 'a') == (b'0123', metadata)
+    assert cache.stats()['memory_bytes'] == 4
+    assert cache.stats()['disk_bytes'] == 4
+
+    # the least recently used one on disk is deleted
+    cache.put('bucket', 'c', b'89ab', {})
+    cache.put('bucket', 'd', b'cdef', {})
+    assert cache.get('bucket', 'b') is None
+    assert len(os.listdir(directory)) == 2
+
+    cache.invalidate('bucket', 'a')
+    assert len(os.listdir(directory)) == 1
+    cache.clear()
+    assert os.listdir(directory) == []
@@ -62,6 +62,8 @@ def test_extend_session_w_env(region, queue_name, s3_client):
     assert hasattr(client, 'delete_message_extended')
     assert hasattr(client, 'send_message_batch_extended')
     assert hasattr(client, 'delete_message_batch_extended')
+    assert hasattr(client, 'change_message_visibility_extended')
+    assert hasattr(client, 'change_message_visibility_batch_extended')
 
     resource = session.resource('sqs')
     queue = resource.Queue(queue_name)
@@ -69,9 +71,11 @@ def test_extend_session_w_env(region, queue_name, s3_client):
     assert hasattr(queue, 'receive_messages_extended')
     assert hasattr(queue, 'send_messages_extended')
     assert hasattr(queue, 'delete_messages_extended')
+    assert hasattr(queue, 'change_message_visibility_batch_extended')
 
     message = resource.Message('queue_url', 'receipt_handle')
     assert hasattr(message, 'delete_extended')
+    assert hasattr(message, 'change_visibility_extended')
 
     del os.environ['AWS_DEFAULT_REGION']
 
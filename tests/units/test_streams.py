@@ -0,0 +1,58 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2021 Archetype Digital Inc.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import io
+
+import pytest
+from aws_sqs_ext_client.streams import MemoryViewReader
+
+
+def test_memory_view_reader():
+    data = bytearray(b'0123456789')
+    reader = MemoryViewReader(memoryview(data))
+    assert len(reader) == 10
+    assert reader.readable() and reader.seekable()
+
+    assert reader.read(3) == b'012'
+    assert reader.tell() == 3
+    buffer = bytearray(4)
+    assert reader.readinto(buffer) == 4
+    assert buffer == b'3456'
+    assert reader.read() == b'789'
+    assert reader.read() == b''
+    assert reader.readinto(buffer) == 0
+
+    assert reader.seek(-2, io.SEEK_END) == 8
+    assert reader.read(10) == b'89'
+    assert reader.seek(0) == 0
+    assert reader.seek(5, io.SEEK_CUR) == 5
+    assert reader.read() == b'56789'
+
+    # the data is not copied
+    data[0:1] = b'x'
+    reader.seek(0)
+    assert reader.read(1) == b'x'
+
+    with pytest.raises(ValueError):
+        reader.seek(-1)